@@ -0,0 +1,755 @@
+# -*- coding: utf-8 -*-
+
+import sonpy
+import asyncio
+import gc
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmarks of SonPy on large synthetic Sonnet projects. No Sonnet
+# installation is needed. Run all benchmarks with
+#
+#     python benchmark.py
+#
+# or only some of them by naming them, e.g. ``python benchmark.py read``.
+
+
+def makeProject(npoly, ntlayers=1, nports=0, polygons=None):
+    # Returns the text of a Sonnet project with npoly rectangles spread over
+    # ntlayers metal technology layers (gds streams 1, 2, ...). The rectangles
+    # are placed on a square grid, and nports ports are attached to the left
+    # edge of the first nports rectangles. If polygons is a list of
+    # (gds stream, closed list of vertices) these are used instead.
+
+    ncols = max(1, int(npoly**0.5))
+    nrows = (npoly + ncols - 1)//ncols
+    xwidth, ywidth = 20*ncols, 20*nrows
+    if polygons == None:
+        polygons = []
+        for poly in range(npoly):
+            x = 20*(poly % ncols)
+            y = 20*(poly//ncols)
+            polygons.append((poly % ntlayers + 1, [(x, y), (x + 10.5, y), (x + 10.5, y + 10), (x, y + 10), (x, y)]))
+        streams = range(1, ntlayers + 1)
+    else:
+        npoly = len(polygons)
+        xwidth = int(max(x for stream, vertices in polygons for x, y in vertices)) + 1
+        ywidth = int(max(y for stream, vertices in polygons for x, y in vertices)) + 1
+        streams = sorted(set(stream for stream, vertices in polygons))
+
+    text = ["FTYP SONPROJ 16 ! Sonnet Project File\n",
+            "VER 16.54\n",
+            "HEADER\n",
+            "LIC SONPY BENCHMARK\n",
+            "END HEADER\n",
+            "DIM\n",
+            "FREQ GHZ\n",
+            "LNG UM\n",
+            "END DIM\n",
+            "GEO\n",
+            "TMET \"Lossless\" 0 SUP 0 0 0 0\n",
+            "BMET \"Lossless\" 0 SUP 0 0 0 0\n",
+            "MET \"Lossless\" 1 SUP 0 0 0 0\n",
+            "BOX 1 {:d} {:d} {:d} {:d} 20 0\n".format(xwidth, ywidth, 2*xwidth, 2*ywidth),
+            "      500 1 1 0 0 0 0 \"Vacuum\"\n",
+            "      279 11.45 1 1e-06 0 0.00044 0 \"Silicon\"\n"]
+
+    for stream in streams:
+        text.append("TECHLAY METAL Stream{0:d}:0 <UNSPECIFIED> {0:d} 0\n".format(stream))
+        text.append("0 0 -1 N {:d} 1 1 100 100 0 0 0 Y\n".format(stream))
+        text.append("END\nEND\n")
+
+    text.append("VALVAR L IND 10 \"\"\n")
+    text.append("LORGN 0 {:d} U\n".format(ywidth))
+
+    for port in range(nports):
+        text.append("POR1 STD\nPOLY {:d} 1\n3\n".format(port + 1))
+        text.append("{:d} 50 0 0 0 {:d} {:d}\n".format(port + 1, 20*(port % ncols), 20*(port//ncols) + 5))
+
+    text.append("NUM {:d}\n".format(npoly))
+    for poly, (stream, vertices) in enumerate(polygons):
+        text.append("MET POL\n")
+        text.append("0 {:d} -1 N {:d} 1 1 100 100 0 0 0 Y\n".format(len(vertices), poly + 1))
+        text.append("TLAYNAM Stream{:d}:0 INH\n".format(stream))
+        text.append("".join("{:.10g} {:.10g}\n".format(x, y) for x, y in vertices))
+        text.append("END\n")
+
+    text += ["END GEO\n",
+             "CONTROL\n",
+             "ABS\n",
+             "OPTIONS  -d\n",
+             "SUBSPLAM Y 20\n",
+             "EDGECHECK N\n",
+             "CFMAX Y 10\n",
+             "SPEED 0\n",
+             "CACHE_ABS 1\n",
+             "TARG_ABS 300\n",
+             "Q_ACC Y\n",
+             "END CONTROL\n",
+             "FREQ\n",
+             "ABS 5 8\n",
+             "END FREQ\n",
+             "VARSWP\n",
+             "ABS_ENTRY 5 8\n",
+             "VAR L Y 10 15 1\n",
+             "END\n",
+             "END VARSWP\n",
+             "FILEOUT\n",
+             "CSV D Y $BASENAME.csv NC 8 S DB R 50\n",
+             "END FILEOUT\n",
+             "QSG\n",
+             "IMPORT NO\n",
+             "END QSG\n"]
+
+    return "".join(text)
+
+
+def makeFragments(ntraces, nfragments):
+    # Returns a fragmented layout like the GDSII translation of traces often
+    # gives, as polygons for makeProject: ntraces horizontal traces each cut
+    # into nfragments abutting rectangles, with a narrower stub on top of
+    # every fifth rectangle
+
+    polygons = []
+    for trace in range(ntraces):
+        y = 20*trace
+        for fragment in range(nfragments):
+            x = 10*fragment
+            polygons.append((1, [(x, y), (x + 10, y), (x + 10, y + 4), (x, y + 4), (x, y)]))
+            if fragment % 5 == 0:
+                polygons.append((1, [(x + 3, y + 4), (x + 7, y + 4), (x + 7, y + 10), (x + 3, y + 10), (x + 3, y + 4)]))
+    return polygons
+
+
+def readGdsPolygons(filename):
+    # Returns the boundaries of a GDSII file as polygons for makeProject, in
+    # user units with the GDSII layer as gds stream. References to other
+    # structures are not followed.
+
+    def real(data):
+        # GDSII 8 byte real: sign, excess 64 base 16 exponent, 56 bit mantissa
+        value = int.from_bytes(data[1:8], "big")/2**56*16.0**((data[0] & 0x7f) - 64)
+        return -value if data[0] & 0x80 else value
+
+    with open(filename, 'rb') as fd:
+        data = fd.read()
+    polygons = []
+    unit = 1
+    layer = 0
+    index = 0
+    while index + 4 <= len(data):
+        length, record = struct.unpack(">HB", data[index:index + 3])
+        if length == 0:
+            break
+        body = data[index + 4:index + length]
+        if record == 0x03:
+            # UNITS
+            unit = real(body[0:8])
+        elif record == 0x0d:
+            # LAYER
+            layer = struct.unpack(">h", body[0:2])[0]
+        elif record == 0x10:
+            # XY of a boundary (after its LAYER record)
+            coordinates = struct.unpack(">{:d}i".format(len(body)//4), body)
+            vertices = [(unit*coordinates[i], unit*coordinates[i + 1]) for i in range(0, len(coordinates), 2)]
+            polygons.append((layer, vertices))
+        index += length
+    return polygons
+
+
+def writeProject(text, directory):
+    # Writes the project text to a file in directory and returns a sonnet
+    # instance pointing to it
+
+    snt = sonpy.sonnet()
+    snt.sonnet_file_path = directory + os.sep
+    snt.sonnet_file = "benchmark.son"
+    with open(snt.sonnet_file_path + snt.sonnet_file, 'w') as fd:
+        fd.write(text)
+    return snt
+
+
+def timeit(function, repeat=3):
+    # Returns the best wall time of repeat calls of function
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmarkRead(directory):
+    # Throughput of readProject in lines/s and polygons/s
+    print("\nreadProject throughput")
+    print("  {:>10s} {:>10s} {:>10s} {:>14s} {:>14s}".format("polygons", "lines", "time [s]", "lines/s", "polygons/s"))
+    for npoly in [1000, 10000, 100000]:
+        text = makeProject(npoly, ntlayers=3, nports=5)
+        nlines = text.count("\n")
+        snt = writeProject(text, directory)
+        elapsed = timeit(snt.readProject)
+        print("  {:10d} {:10d} {:10.3f} {:14.0f} {:14.0f}".format(npoly, nlines, elapsed, nlines/elapsed, npoly/elapsed))
+
+
+def benchmarkScaling(directory):
+    # Load time of readProject against the number of polygons, technology
+    # layers and ports. The time per polygon should stay roughly constant.
+    print("\nreadProject scaling")
+    print("  {:>10s} {:>10s} {:>10s} {:>10s} {:>14s}".format("polygons", "tlayers", "ports", "time [s]", "us/polygon"))
+    cases = [(npoly, 10, 10) for npoly in [12500, 25000, 50000, 100000]]
+    cases += [(25000, ntlayers, 10) for ntlayers in [1, 100, 1000]]
+    cases += [(25000, 10, nports) for nports in [100, 1000]]
+    for npoly, ntlayers, nports in cases:
+        snt = writeProject(makeProject(npoly, ntlayers, nports), directory)
+        elapsed = timeit(snt.readProject)
+        print("  {:10d} {:10d} {:10d} {:10.3f} {:14.2f}".format(npoly, ntlayers, nports, elapsed, 1e6*elapsed/npoly))
+
+
+def benchmarkWrite(directory):
+    # Throughput of printProject in MB/s and polygons/s
+    print("\nprintProject throughput")
+    print("  {:>10s} {:>10s} {:>10s} {:>10s} {:>14s}".format("polygons", "size [MB]", "time [s]", "MB/s", "polygons/s"))
+    for npoly in [1000, 10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        snt.readProject()
+        elapsed = timeit(snt.printProject)
+        size = os.path.getsize(snt.sonnet_file_path + snt.sonnet_file)/1e6
+        print("  {:10d} {:10.1f} {:10.3f} {:10.1f} {:14.0f}".format(npoly, size, elapsed, size/elapsed, npoly/elapsed))
+
+
+def benchmarkRewrite(directory):
+    # printProject after changing only the frequency sweep, which reuses the
+    # cached polygon records of the previous printProject
+    print("\nprintProject again after setFrequencySweep")
+    print("  {:>10s} {:>14s} {:>14s}".format("polygons", "first [s]", "again [s]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        snt.readProject()
+        first = timeit(snt.printProject, repeat=1)
+        def run():
+            snt.setFrequencySweep(f1=4, f2=6)
+            snt.printProject()
+        print("  {:10d} {:14.3f} {:14.3f}".format(npoly, first, timeit(run)))
+
+
+def benchmarkExtent(directory):
+    # mapPoint (run by addPort and addComponent) against the number of
+    # polygons. Only the first call computes the bounding box.
+    print("\nmapPoint with cached bounding box")
+    print("  {:>10s} {:>14s} {:>14s}".format("polygons", "first [ms]", "next [us]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3), directory)
+        snt.readProject()
+        first = timeit(lambda: snt.mapPoint(0, 0), repeat=1)
+        repeated = timeit(lambda: [snt.mapPoint(0, 0) for i in range(1000)])/1000
+        print("  {:10d} {:14.1f} {:14.1f}".format(npoly, 1e3*first, 1e6*repeated))
+
+
+def benchmarkPorts(directory):
+    # Latency of addPort against the number of polygons, for the same number
+    # of ports. The first port builds the edge index of every technology
+    # layer, the others only query it, so their time should not grow with
+    # the number of polygons. The query time is that of the edge index of
+    # one layer alone.
+    print("\naddPort latency for 50 ports")
+    print("  {:>10s} {:>14s} {:>14s} {:>14s}".format("polygons", "first [ms]", "per port [us]", "query [us]"))
+    for npoly in [1000, 10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3), directory)
+        snt.readProject()
+        ncols = max(1, int(npoly**0.5))
+        nrows = (npoly + ncols - 1)//ncols
+        # Left edges of rectangles of the first column, in the lower left
+        # corner coordinates used by addPort
+        points = [(0, 20*nrows - 10 - 20*(i % nrows) - 5) for i in range(50)]
+        first = timeit(lambda: snt.addPort(*points[0]), repeat=1)
+        start = time.perf_counter()
+        for point in points[1:]:
+            snt.addPort(*point)
+        following = (time.perf_counter() - start)/(len(points) - 1)
+        edgeindex = snt.project.geo.dlayers[0].tlayers[0].getEdgeIndex()
+        queries = [snt.mapPoint(*point) for point in points]
+        query = timeit(lambda: [edgeindex.query(x - 0.005, y - 0.005, x + 0.005, y + 0.005) for x, y in queries])/len(queries)
+        print("  {:10d} {:14.2f} {:14.1f} {:14.1f}".format(npoly, 1e3*first, 1e6*following, 1e6*query))
+
+
+def benchmarkManyPorts(directory):
+    # Placing 20 to 100 ports with addPort in a loop and with addPorts
+    print("\nPlacing many ports on 10000 polygons")
+    print("  {:>10s} {:>14s} {:>14s}".format("ports", "addPort [ms]", "addPorts [ms]"))
+    text = makeProject(10000, ntlayers=3)
+    nrows = 100
+    for nports in [20, 50, 100]:
+        points = [(0, 20*nrows - 10 - 20*i - 5) for i in range(nports)]
+        snt = writeProject(text, directory)
+        snt.readProject()
+        # Build the edge indices outside of the timing
+        snt.addPort(*points[0])
+        loop = timeit(lambda: [snt.addPort(*point) for point in points], repeat=1)
+        batch = timeit(lambda: snt.addPorts(points), repeat=1)
+        print("  {:10d} {:14.2f} {:14.2f}".format(nports, 1e3*loop, 1e3*batch))
+
+
+def benchmarkManyComponents(directory):
+    # Adding 20 to 100 ideal components with addComponent in a loop and
+    # with addComponents
+    print("\nAdding many components on 10000 polygons")
+    print("  {:>10s} {:>14s} {:>14s}".format("components", "loop [ms]", "batch [ms]"))
+    text = makeProject(10000)
+    nrows = 100
+    for ncomponents in [20, 50, 100]:
+        # Between the right edge of the rectangles in the first column and
+        # the left edge of the rectangles in the second column
+        components = [(10.5, 20*nrows - 10 - 20*i - 5, 20, 20*nrows - 10 - 20*i - 5, 1, "cap", 1) for i in range(ncomponents)]
+        snt = writeProject(text, directory)
+        snt.readProject()
+        # Build the edge index outside of the timing
+        snt.addComponent(*components[0])
+        loop = timeit(lambda: [snt.addComponent(*component) for component in components], repeat=1)
+        batch = timeit(lambda: snt.addComponents(components), repeat=1)
+        print("  {:10d} {:14.2f} {:14.2f}".format(ncomponents, 1e3*loop, 1e3*batch))
+
+
+def benchmarkMerge(directory):
+    # mergePolygons on the project of example.gds and on fragmented traces
+    print("\nmergePolygons")
+    print("  {:>22s} {:>10s} {:>10s} {:>10s}".format("layout", "before", "after", "time [s]"))
+    layouts = [("example.gds", readGdsPolygons(os.path.join(os.path.dirname(os.path.abspath(__file__)), "example.gds")))]
+    for ntraces, nfragments in [(10, 100), (100, 100), (100, 1000)]:
+        layouts.append(("{:d} x {:d} fragments".format(ntraces, nfragments), makeFragments(ntraces, nfragments)))
+    for name, polygons in layouts:
+        snt = writeProject(makeProject(0, polygons=polygons), directory)
+        snt.readProject()
+        start = time.perf_counter()
+        before, after = snt.mergePolygons(silent=True)
+        elapsed = time.perf_counter() - start
+        print("  {:>22s} {:10d} {:10d} {:10.3f}".format(name, before, after, elapsed))
+
+
+def benchmarkSimplify(directory):
+    # simplifyGeometry on rectangles with a duplicate and a collinear vertex
+    # each and some glitched polygons, and the vertex simplification alone
+    # with numpy and one polygon at a time
+    print("\nsimplifyGeometry")
+    print("  {:>10s} {:>10s} {:>10s} {:>10s} {:>14s} {:>14s}".format("polygons", "vertices", "removed", "time [s]", "numpy [ms]", "loop [ms]"))
+    for npoly in [1000, 10000, 100000]:
+        polygons = []
+        for poly in range(npoly):
+            x, y = 20*(poly % 100), 20*(poly//100)
+            if poly % 100 == 99:
+                polygons.append((1, [(x, y)]*5))
+            else:
+                polygons.append((1, [(x, y), (x + 5, y), (x + 10, y), (x + 10, y), (x + 10, y + 10), (x, y + 10), (x, y)]))
+        snt = writeProject(makeProject(0, polygons=polygons), directory)
+        snt.readProject()
+        tlayerPolygons = snt.project.geo.dlayers[0].tlayers[0].getPolygons()
+        # Without garbage collection like in simplifyGeometry
+        gc.disable()
+        vectorized = timeit(lambda: sonpy.simplifyPolygons(tlayerPolygons))
+        loop = timeit(lambda: sonpy.simplifyPolygons(tlayerPolygons, vectorized=False))
+        gc.enable()
+        nvertices = sum(polygon.nvertices for polygon in tlayerPolygons)
+        start = time.perf_counter()
+        removed, npolygons = snt.simplifyGeometry(silent=True)
+        elapsed = time.perf_counter() - start
+        print("  {:10d} {:10d} {:10d} {:10.3f} {:14.2f} {:14.2f}".format(npoly, nvertices, removed, elapsed, 1e3*vectorized, 1e3*loop))
+
+
+def benchmarkSnap(directory):
+    # snapToGrid on rectangles shifted slightly off the grid, like the
+    # GDSII translator does, and proposeCellSize afterwards
+    print("\nsnapToGrid and proposeCellSize")
+    print("  {:>10s} {:>10s} {:>14s} {:>14s} {:>14s} {:>10s}".format("polygons", "snapped", "snap [s]", "numpy [ms]", "loop [ms]", "cell size"))
+    for npoly in [1000, 10000, 100000]:
+        polygons = []
+        for poly in range(npoly):
+            x, y = 20*(poly % 100), 20*(poly//100)
+            shift = 0.003*(poly % 3 - 1)
+            polygons.append((1, [(x, y), (x + 10 + shift, y), (x + 10 + shift, y + 10), (x, y + 10), (x, y)]))
+        snt = writeProject(makeProject(0, polygons=polygons), directory)
+        snt.readProject()
+        tlayerPolygons = snt.project.geo.dlayers[0].tlayers[0].getPolygons()
+        # Without garbage collection like in snapToGrid
+        gc.disable()
+        vectorized = timeit(lambda: sonpy.snapVertices(tlayerPolygons, 1, 1, 0.01, 0.01))
+        loop = timeit(lambda: sonpy.snapVertices(tlayerPolygons, 1, 1, 0.01, 0.01, vectorized=False))
+        gc.enable()
+        start = time.perf_counter()
+        snt.cropBox()
+        nsnapped = snt.snapToGrid(silent=True)
+        elapsed = time.perf_counter() - start
+        [xcellsize, ycellsize] = snt.proposeCellSize()
+        print("  {:10d} {:10d} {:14.3f} {:14.2f} {:14.2f} {:>10s}".format(npoly, nsnapped, elapsed, 1e3*vectorized, 1e3*loop, "{:g}x{:g}".format(xcellsize, ycellsize)))
+
+
+def benchmarkTransform(directory):
+    # transformGeometry (through cropBox and mirror) on projects with up to
+    # a million vertices, and the vertex transform alone with numpy and one
+    # polygon at a time
+    print("\nGeometry transforms")
+    print("  {:>10s} {:>10s} {:>8s} {:>12s} {:>12s} {:>14s} {:>14s}".format("polygons", "vertices", "arrays", "cropBox [s]", "mirror [s]", "numpy [ms]", "loop [ms]"))
+    for npoly, arrays in [(2000, False), (20000, False), (200000, False), (200000, True)]:
+        # Rectangles away from the origin, so cropBox moves them
+        polygons = []
+        for poly in range(npoly):
+            x, y = 20*(poly % 500) + 100.5, 20*(poly//500) + 100.5
+            polygons.append((1, [(x, y), (x + 10, y), (x + 10, y + 10), (x, y + 10), (x, y)]))
+        snt = writeProject(makeProject(0, polygons=polygons), directory)
+        snt.readProject(arrays=arrays)
+        tlayerPolygons = snt.project.geo.dlayers[0].tlayers[0].getPolygons()
+        nvertices = sum(len(polygon.vertices) for polygon in tlayerPolygons)
+        # The extents are cached by the first call
+        snt.getBoundingBox()
+        crop = timeit(snt.cropBox, repeat=1)
+        mirror = timeit(lambda: snt.mirror("x"), repeat=1)
+        # Without garbage collection like in transformGeometry
+        gc.disable()
+        vectorized = timeit(lambda: sonpy.transformVertices(tlayerPolygons, ((1, 0), (0, 1)), (1, 1)))
+        loop = timeit(lambda: sonpy.transformVertices(tlayerPolygons, ((1, 0), (0, 1)), (1, 1), vectorized=False))
+        gc.enable()
+        print("  {:10d} {:10d} {:>8s} {:12.3f} {:12.3f} {:14.2f} {:14.2f}".format(npoly, nvertices, str(arrays), crop, mirror, 1e3*vectorized, 1e3*loop))
+
+
+def benchmarkCrop(directory):
+    # cropToRegion with a window of a quarter of the layout in each
+    # direction, and the project size written before and after
+    print("\ncropToRegion")
+    print("  {:>22s} {:>10s} {:>10s} {:>10s} {:>12s} {:>12s}".format("layout", "before", "after", "time [s]", "size [kB]", "cropped [kB]"))
+    layouts = [("example.gds", readGdsPolygons(os.path.join(os.path.dirname(os.path.abspath(__file__)), "example.gds")))]
+    for ntraces, nfragments in [(100, 100), (100, 1000)]:
+        layouts.append(("{:d} x {:d} fragments".format(ntraces, nfragments), makeFragments(ntraces, nfragments)))
+    for name, polygons in layouts:
+        snt = writeProject(makeProject(0, polygons=polygons), directory)
+        snt.readProject()
+        snt.cropBox()
+        snt.printProject()
+        size = os.path.getsize(snt.sonnet_file_path + snt.sonnet_file)
+        before = snt.project.geo.npoly
+        [[xmin, ymin], [xmax, ymax]] = snt.getBoundingBox()
+        start = time.perf_counter()
+        snt.cropToRegion(xmin, ymin, xmin + (xmax - xmin)/4, ymin + (ymax - ymin)/4)
+        elapsed = time.perf_counter() - start
+        snt.printProject()
+        cropped = os.path.getsize(snt.sonnet_file_path + snt.sonnet_file)
+        print("  {:>22s} {:10d} {:10d} {:10.3f} {:12.1f} {:12.1f}".format(name, before, snt.project.geo.npoly, elapsed, size/1e3, cropped/1e3))
+
+
+def benchmarkNearest(directory):
+    # The distance computation of addPort and addComponent for a point
+    # against many candidate edges, with numpy and one edge at a time
+    print("\nNearest edge points")
+    print("  {:>10s} {:>14s} {:>14s}".format("edges", "numpy [ms]", "loop [ms]"))
+    for npoly in [100, 1000, 10000]:
+        snt = writeProject(makeProject(npoly), directory)
+        snt.readProject()
+        tlayer = snt.project.geo.dlayers[0].tlayers[0]
+        edgeindex = tlayer.getEdgeIndex()
+        edges = edgeindex.query(*tlayer.getExtent())
+        vectorized = timeit(lambda: sonpy.nearestEdgePoints(edges, 5, 5, 1e9, 1e9))
+        loop = timeit(lambda: sonpy.nearestEdgePoints(edges, 5, 5, 1e9, 1e9, vectorized=False))
+        print("  {:10d} {:14.2f} {:14.2f}".format(len(edges), 1e3*vectorized, 1e3*loop))
+
+
+def benchmarkLazy(directory):
+    # Read, change the frequency sweep and write, with and without lazy
+    # decoding of the polygons
+    print("\nreadProject + setFrequencySweep + printProject")
+    print("  {:>10s} {:>14s} {:>14s}".format("polygons", "eager [s]", "lazy [s]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        times = []
+        for lazy in [False, True]:
+            def run():
+                snt.readProject(lazy=lazy)
+                snt.setFrequencySweep(f1=4, f2=6)
+                snt.printProject()
+            times.append(timeit(run))
+        print("  {:10d} {:14.3f} {:14.3f}".format(npoly, times[0], times[1]))
+
+
+def benchmarkCache(directory):
+    # Cold parse of the project file against a warm load of the binary cache,
+    # with the size of both files and the peak memory allocated while loading
+    print("\nreadProject with and without cache")
+    print("  {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}".format("polygons", "son [MB]", "cache [MB]", "parse [s]", "cache [s]", "parse [MB]", "cache [MB]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        filename = snt.sonnet_file_path + snt.sonnet_file
+        if os.path.exists(filename + ".cache"):
+            os.remove(filename + ".cache")
+        snt.readProject(cache=True)
+        times = [timeit(snt.readProject), timeit(lambda: snt.readProject(cache=True))]
+        memory = []
+        for cache in [False, True]:
+            snt.project = None
+            tracemalloc.start()
+            snt.readProject(cache=cache)
+            memory.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        sizes = [os.path.getsize(filename), os.path.getsize(filename + ".cache")]
+        print("  {:10d} {:10.1f} {:10.1f} {:10.3f} {:10.3f} {:10.1f} {:10.1f}".format(npoly, sizes[0]/1e6, sizes[1]/1e6, times[0], times[1], memory[0]/1e6, memory[1]/1e6))
+
+
+def benchmarkMemory(directory):
+    # Memory taken by the vertices of the read project, stored as lists and
+    # as arrays. The vertices take the memory freed by dropping them.
+    print("\nMemory of the vertices of the read project")
+    print("  {:>10s} {:>10s} {:>18s} {:>18s} {:>12s} {:>12s}".format("polygons", "vertices", "lists [B/vertex]", "arrays [B/vertex]", "lists [s]", "arrays [s]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        nvertices = 5*npoly
+        memory, times = [], []
+        for arrays in [False, True]:
+            snt.project = None
+            tracemalloc.start()
+            snt.readProject(arrays=arrays)
+            total = tracemalloc.get_traced_memory()[0]
+            for dlayer in snt.project.geo.dlayers:
+                for tlayer in dlayer.tlayers:
+                    for polygon in tlayer.polygons:
+                        polygon.vertices = None
+            memory.append(total - tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+            times.append(timeit(lambda: snt.readProject(arrays=arrays)))
+        print("  {:10d} {:10d} {:18.1f} {:18.1f} {:12.3f} {:12.3f}".format(npoly, nvertices, memory[0]/nvertices, memory[1]/nvertices, times[0], times[1]))
+
+
+def benchmarkSlots(directory):
+    # Memory per instance of the model classes, which use __slots__, against
+    # instances of a plain class with the same attributes, and the time to
+    # read a large project
+    print("\nMemory per instance of the model classes")
+    print("  {:>10s} {:>14s} {:>14s}".format("class", "slots [B]", "plain [B]"))
+    for cls in [sonpy.Polygon, sonpy.Port, sonpy.Component, sonpy.Tlayer, sonpy.Dlayer, sonpy.Var, sonpy.Valvar]:
+        names = [name for name in cls.__slots__ if hasattr(cls(), name)]
+        class Plain():
+            def __init__(self, instance):
+                for name in names:
+                    setattr(self, name, getattr(instance, name))
+        memory = []
+        for make in [cls, lambda: Plain(cls())]:
+            tracemalloc.start()
+            instances = [make() for i in range(10000)]
+            memory.append(tracemalloc.get_traced_memory()[0]/len(instances))
+            tracemalloc.stop()
+            del instances
+        print("  {:>10s} {:14.0f} {:14.0f}".format(cls.__name__, memory[0], memory[1]))
+
+    print("\nreadProject with slotted polygons")
+    print("  {:>10s} {:>10s} {:>14s}".format("polygons", "time [s]", "memory [MB]"))
+    for npoly in [10000, 100000]:
+        snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+        snt.project = None
+        tracemalloc.start()
+        snt.readProject()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("  {:10d} {:10.3f} {:14.1f}".format(npoly, timeit(snt.readProject), memory/1e6))
+
+
+def benchmarkParallel(directory):
+    # Speedup of readProject(processes=n) against the number of processes
+    npoly = 200000
+    print("\nreadProject on {:d} polygons with several processes ({:d} CPU cores)".format(npoly, os.cpu_count() or 1))
+    print("  {:>10s} {:>10s} {:>10s}".format("processes", "time [s]", "speedup"))
+    snt = writeProject(makeProject(npoly, ntlayers=3, nports=5), directory)
+    serial = None
+    for processes in [1, 2, 4, 8, 16]:
+        if processes > 2*(os.cpu_count() or 1):
+            break
+        elapsed = timeit(lambda: snt.readProject(processes=processes))
+        if serial == None:
+            serial = elapsed
+        print("  {:10d} {:10.3f} {:10.2f}".format(processes, elapsed, serial/elapsed))
+
+
+# Stand-in for em, which takes a fixed time and writes an empty data file
+FAKE_EM = """#!{:s}
+import os, sys, time
+time.sleep({:g})
+with open(os.path.splitext(sys.argv[-1])[0] + ".csv", "w") as fd:
+    fd.write("Frequency\\n")
+"""
+
+
+def benchmarkVariants(directory):
+    # runVariants with a stand-in em taking half a second per variant (POSIX
+    # only, since the stand-in is a script with a #! line)
+    print("\nrunVariants with a stand-in em of 0.5 s")
+    print("  {:>10s} {:>10s} {:>10s}".format("variants", "processes", "time [s]"))
+    snt = writeProject(makeProject(1000), directory)
+    snt.readProject()
+    snt.executable_path = os.path.join(directory, "")
+    snt.executable_file = "em"
+    with open(snt.executable_path + snt.executable_file, 'w') as fd:
+        fd.write(FAKE_EM.format(sys.executable, 0.5))
+    os.chmod(snt.executable_path + snt.executable_file, 0o755)
+    variants = {}
+    for f2 in range(6, 14):
+        variants[str(f2)] = lambda variant, f2=f2: variant.setFrequencySweep(f1=5, f2=f2)
+    for processes in [1, 2, 4, 8]:
+        elapsed = timeit(lambda: snt.runVariants(variants, processes=processes, silent=True), repeat=1)
+        print("  {:10d} {:10d} {:10.3f}".format(len(variants), processes, elapsed))
+
+
+def benchmarkAsync(directory):
+    # runSimulationAsync of several projects awaited together, against
+    # runSimulation of one after the other, with the stand-in em of
+    # benchmarkVariants
+    print("\nrunSimulationAsync with a stand-in em of 0.5 s")
+    print("  {:>10s} {:>14s} {:>14s}".format("projects", "serial [s]", "async [s]"))
+    with open(os.path.join(directory, "em"), 'w') as fd:
+        fd.write(FAKE_EM.format(sys.executable, 0.5))
+    os.chmod(os.path.join(directory, "em"), 0o755)
+    for nprojects in [1, 4, 16]:
+        projects = []
+        for index in range(nprojects):
+            snt = writeProject(makeProject(100), directory)
+            snt.readProject()
+            snt.sonnet_file = "async{:d}.son".format(index)
+            snt.executable_path = os.path.join(directory, "")
+            snt.executable_file = "em"
+            projects.append(snt)
+        start = time.perf_counter()
+        for snt in projects:
+            snt.runSimulation()
+        serial = time.perf_counter() - start
+        async def run():
+            await asyncio.gather(*[snt.runSimulationAsync() for snt in projects])
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        print("  {:10d} {:14.3f} {:14.3f}".format(nprojects, serial, elapsed))
+
+
+# Stand-in for em -v, which prints progress lines between filler lines
+CHATTY_EM = """#!{:s}
+print("Subsections: 1234")
+print("Estimated memory: 56.5 MB")
+for line in range({:d}):
+    if line % 100 == 0:
+        print("Frequency {{:d}}: {{:g}} GHz".format(line//100 + 1, 5 + line/1e4))
+    else:
+        print("Matrix fill {{:d}} of {{:d}}".format(line, {:d}))
+print("Total elapsed time: 00:01:02")
+"""
+
+
+def benchmarkProgress(directory):
+    # runSimulation with a stand-in em printing many lines, which fill the
+    # pipe of em unless its output is read while it runs, with and without
+    # a progress function, and parseProgressLine alone
+    print("\nrunSimulation with a stand-in em printing many lines")
+    print("  {:>10s} {:>14s} {:>14s} {:>14s} {:>14s}".format("lines", "plain [s]", "progress [s]", "frequencies", "lines/s"))
+    snt = writeProject(makeProject(100), directory)
+    snt.readProject()
+    snt.executable_path = os.path.join(directory, "")
+    snt.executable_file = "em"
+    for nlines in [1000, 100000, 1000000]:
+        with open(snt.executable_path + snt.executable_file, 'w') as fd:
+            fd.write(CHATTY_EM.format(sys.executable, nlines, nlines))
+        os.chmod(snt.executable_path + snt.executable_file, 0o755)
+        events = []
+        plain = timeit(snt.runSimulation, repeat=1)
+        progress = timeit(lambda: snt.runSimulation(progress=events.append), repeat=1)
+        lines = ["Matrix fill {:d} of {:d}".format(line, nlines) for line in range(min(nlines, 100000))]
+        parse = timeit(lambda: [sonpy.parseProgressLine(line) for line in lines], repeat=1)
+        frequencies = sum(1 for event in events if event.kind == "frequency")
+        print("  {:10d} {:14.3f} {:14.3f} {:14d} {:14.0f}".format(nlines, plain, progress, frequencies, len(lines)/parse))
+
+
+def benchmarkResultCache(directory):
+    # runSimulation with the stand-in em of benchmarkVariants, first
+    # simulated and then taken from the result cache, for output files of
+    # several sizes
+    print("\nrunSimulation with a result cache and a stand-in em of 0.5 s")
+    print("  {:>10s} {:>12s} {:>12s} {:>12s}".format("size [MB]", "miss [s]", "hit [ms]", "store [ms]"))
+    snt = writeProject(makeProject(1000), directory)
+    snt.readProject()
+    snt.executable_path = os.path.join(directory, "")
+    snt.executable_file = "em"
+    with open(snt.executable_path + snt.executable_file, 'w') as fd:
+        fd.write(FAKE_EM.format(sys.executable, 0.5))
+    os.chmod(snt.executable_path + snt.executable_file, 0o755)
+    snt.setResultCache(os.path.join(directory, "results"), maxsize=1000)
+    [output] = snt.getOutputFiles()
+    for size in [0.01, 1, 100]:
+        snt.setFrequencySweep(f1=5, f2=5 + size)
+        miss = timeit(snt.runSimulation, repeat=1)
+        # Outputs the size of large sweeps, stored directly in the cache
+        with open(output, 'w') as fd:
+            fd.write("0"*int(1e6*size))
+        key = snt.result_cache.key(snt.sonnet_file_path + snt.sonnet_file, [snt.executable_path + snt.executable_file, snt.sonnet_options])
+        shutil.rmtree(os.path.join(directory, "results", key))
+        store = timeit(lambda: snt.result_cache.store(key, [output]), repeat=1)
+        hit = timeit(snt.runSimulation)
+        print("  {:10g} {:12.3f} {:12.2f} {:12.2f}".format(size, miss, 1e3*hit, 1e3*store))
+    print("  {}".format(snt.result_cache.getStatistics()))
+
+
+def benchmarkParameterVariants(directory):
+    # Eight values of a variable parameter of large projects, with
+    # runVariants writing a project file per value and runParameterVariants
+    # writing a parameter file per value, with a stand-in em returning
+    # immediately
+    print("\nrunVariants and runParameterVariants of 8 parameter values")
+    print("  {:>10s} {:>14s} {:>14s} {:>16s}".format("polygons", "variants [s]", "params [s]", "rewritten [MB]"))
+    for npoly in [1000, 10000, 100000]:
+        snt = writeProject(makeProject(npoly), directory)
+        snt.readProject()
+        snt.executable_path = os.path.join(directory, "")
+        snt.executable_file = "em"
+        with open(snt.executable_path + snt.executable_file, 'w') as fd:
+            fd.write(FAKE_EM.format(sys.executable, 0))
+        os.chmod(snt.executable_path + snt.executable_file, 0o755)
+        snt.addParameter("Lk", unittype="IND", value=10)
+        def setter(value):
+            def variant(clone):
+                clone.project.geo.valvars[-1].value = value
+            return variant
+        values = range(1, 9)
+        variants = timeit(lambda: snt.runVariants([setter(value) for value in values], processes=8, silent=True), repeat=1)
+        params = timeit(lambda: snt.runParameterVariants([{"Lk": value} for value in values], processes=8, silent=True), repeat=1)
+        written = len(values)*os.path.getsize(snt.sonnet_file_path + snt.sonnet_file)/1e6
+        print("  {:10d} {:14.3f} {:14.3f} {:16.1f}".format(npoly, variants, params, written))
+
+
+BENCHMARKS = {
+    "read": benchmarkRead,
+    "scaling": benchmarkScaling,
+    "write": benchmarkWrite,
+    "rewrite": benchmarkRewrite,
+    "extent": benchmarkExtent,
+    "ports": benchmarkPorts,
+    "nearest": benchmarkNearest,
+    "manyports": benchmarkManyPorts,
+    "manycomponents": benchmarkManyComponents,
+    "merge": benchmarkMerge,
+    "simplify": benchmarkSimplify,
+    "snap": benchmarkSnap,
+    "transform": benchmarkTransform,
+    "crop": benchmarkCrop,
+    "lazy": benchmarkLazy,
+    "cache": benchmarkCache,
+    "parallel": benchmarkParallel,
+    "variants": benchmarkVariants,
+    "async": benchmarkAsync,
+    "progress": benchmarkProgress,
+    "resultcache": benchmarkResultCache,
+    "paramvariants": benchmarkParameterVariants,
+    "memory": benchmarkMemory,
+    "slots": benchmarkSlots,
+}
+
+if __name__ == '__main__':
+
+    names = sys.argv[1:] or list(BENCHMARKS)
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            BENCHMARKS[name](directory)
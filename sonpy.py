@@ -4,14 +4,37 @@ __license__ = 'GNU General Public License 3.0'
 __docformat__ = 'reStructuredText'
 
 import subprocess
+import asyncio
 import time
 import os
+import gc
+import re
+import itertools
+import collections
+import contextlib
+import operator
+import bisect
+import math
+import array
+import pickle
+import hashlib
+import shutil
+import concurrent.futures
+import threading
+import pathlib
 import platform
 OS = platform.system()
 
 if OS == "Windows":
    from win32com.client import GetObject
 
+# numpy is only needed to store vertices in arrays (see readProject)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
 class Project():
     # Only geometry projects are supported
     def __init__(self):
@@ -27,18 +50,22 @@ class Project():
         self.subdiv = None
         self.qsg = None
 
+
 class Preheader():
     def __init__(self):
         self.lines = []
 
+
 class Header():
     def __init__(self):
         self.lines = []
 
+
 class Dim():
     def __init__(self):
         self.lines = []
 
+
 class Geo():
     def __init__(self):
         self.tmet = None
@@ -50,6 +77,9 @@ class Geo():
         self.valvars = []
         self.lorgn = None
         self.npoly = None
+        # Undecoded polygons of a lazily read project (see LazyPolygons)
+        self.lazypolygons = None
+
 
 class Tmet():
     def __init__(self):
@@ -58,6 +88,7 @@ class Tmet():
         self.type = "SUP"
         self.values = [0, 0, 0, 0]
 
+
 class Bmet():
     def __init__(self):
         self.name = "Lossless"
@@ -65,6 +96,7 @@ class Bmet():
         self.type = "SUP"
         self.values = [0, 0, 0, 0]
 
+
 class Met():
     def __init__(self):
         self.name = "Lossless"
@@ -72,6 +104,7 @@ class Met():
         self.type = "SUP"
         self.values = [0, 0, 0, 0]
 
+
 class Brick():
     def __init__(self):
         self.name = "Air"
@@ -79,6 +112,7 @@ class Brick():
         self.values = [0, 0, 0]  # [Erel, Loss Tan, Cond] elements can be lists length 3 (isotropic) or length 9 (anisotropic)
         self.isIsotropic = True
 
+
 class Box():
     def __init__(self):
         self.nlev = None
@@ -89,7 +123,15 @@ class Box():
         self.nsubs = None
         self.eeff = None
 
+
 class Dlayer():
+    # Translated layouts have hundreds of thousands of polygons, so the
+    # classes instantiated per layer, polygon, port, component and variable
+    # store their attributes in __slots__ instead of a __dict__ per instance
+    __slots__ = ("ilevel", "thickness", "erel", "mrel", "eloss", "mloss",
+                 "esignma", "nzpart", "name", "tlayers", "ports",
+                 "components")
+
     def __init__(self):
         self.ilevel = 0
         self.thickness = 0
@@ -105,7 +147,42 @@ class Dlayer():
         self.ports = []
         self.components = []
 
+
+class PolygonList(list):
+    # Internal use only.
+
+    # The list of polygons of a technology layer (see Tlayer.polygons). Every
+    # change of the list counts up its generation, which tells the layer to
+    # drop the caches built from the polygons (see Tlayer.checkCaches).
+    # Changes of the polygons themselves are not seen by the list, see
+    # Tlayer.markChanged.
+    generation = 0
+
+
+def countGeneration(method):
+    # Internal use only.
+
+    # Wraps a method of list that changes the list for PolygonList
+    def changed(self, *args, **kwargs):
+        self.generation += 1
+        return method(self, *args, **kwargs)
+    changed.__name__ = method.__name__
+    return changed
+
+
+for name in ("append", "extend", "insert", "remove", "pop", "clear", "sort",
+             "reverse", "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(PolygonList, name, countGeneration(getattr(list, name)))
+
+
 class Tlayer():
+    __slots__ = ("lay_type", "lay_name", "dxf_layer", "gds_stream",
+                 "gds_object", "type", "ilevel", "nvertices", "mtype",
+                 "filltype", "debugid", "xmin", "ymin", "xmax", "ymax",
+                 "conmax", "res1", "res2", "edgemesh", "to_level",
+                 "meshingfill", "pads", "_polygons", "lazypolygons",
+                 "polygontext", "extent", "edgeindex", "generation")
+
     def __init__(self):
         self.lay_type = "METAL" # "METAL", "BRICK" or "VIA"
         self.lay_name = None
@@ -132,7 +209,99 @@ class Tlayer():
         # List of associated polygons
         self.polygons = []
 
+    @property
+    def polygons(self):
+        # Changes of the returned list are tracked (see PolygonList), changes
+        # of the polygons in it have to be reported with markChanged
+        return self.getPolygons()
+
+    @polygons.setter
+    def polygons(self, polygons):
+        self.lazypolygons = None
+        if type(polygons) != PolygonList:
+            polygons = PolygonList(polygons)
+        self._polygons = polygons
+        self.markChanged()
+
+    def getPolygons(self):
+        # Internal use only.
+
+        # The polygons for code that does not change them, which keeps the
+        # caches. The polygons of a lazily read project are decoded on first
+        # access.
+        if self.lazypolygons != None:
+            lazypolygons = self.lazypolygons
+            self.lazypolygons = None
+            lazypolygons.decode()
+        return self._polygons
+
+    def markChanged(self):
+        # Drops the records cached by printProject, the cached extent and the
+        # edge index. The functions of sonnet call it when they change
+        # polygons of the layer in place, and so has code which changes them
+        # (e.g. their vertices) directly. Changes of the list of polygons
+        # itself are noticed without it (see checkCaches).
+        self.polygontext = None
+        self.extent = None
+        self.edgeindex = None
+        self.generation = self._polygons.generation
+
+    def checkCaches(self):
+        # Internal use only.
+
+        # Drops the caches if the list of polygons has changed since they
+        # were built (see PolygonList). Takes constant time.
+        if self.generation != self._polygons.generation:
+            self.markChanged()
+
+    def getExtent(self):
+        # Internal use only.
+
+        # Returns (xmin, ymin, xmax, ymax) of the vertices of the polygons, or
+        # None if there are none. Polygons where all the vertices are the same
+        # (glitches of Sonnet or the gds translator) are left out. The extent
+        # is cached until the polygons change (see markChanged).
+        self.checkCaches()
+        if self.extent == None:
+            xmin = ymin = float("inf")
+            xmax = ymax = -float("inf")
+            for polygon in self.getPolygons():
+                vertices = polygon.vertices
+                if len(vertices) == 0:
+                    continue
+                if np != None and type(vertices) == np.ndarray:
+                    (pxmin, pymin), (pxmax, pymax) = vertices.min(axis=0).tolist(), vertices.max(axis=0).tolist()
+                else:
+                    xvertices = [vertex[0] for vertex in vertices]
+                    yvertices = [vertex[1] for vertex in vertices]
+                    pxmin, pxmax = min(xvertices), max(xvertices)
+                    pymin, pymax = min(yvertices), max(yvertices)
+                if pxmin == pxmax and pymin == pymax:
+                    continue
+                xmin, ymin = min(xmin, pxmin), min(ymin, pymin)
+                xmax, ymax = max(xmax, pxmax), max(ymax, pymax)
+            # An empty tuple marks a layer without (proper) polygons
+            self.extent = (xmin, ymin, xmax, ymax) if xmin <= xmax else ()
+        return self.extent or None
+
+    def getEdgeIndex(self):
+        # Internal use only.
+
+        # Returns the EdgeIndex of the polygon edges, which is cached like
+        # the extent
+        self.checkCaches()
+        if self.edgeindex == None:
+            with gcPaused():
+                self.edgeindex = EdgeIndex(self.getPolygons())
+        return self.edgeindex
+
+
 class Polygon():
+    __slots__ = ("type", "ilevel", "nvertices", "mtype", "filltype",
+                 "debugid", "xmin", "ymin", "xmax", "ymax", "conmax", "res1",
+                 "res2", "edgemesh", "to_level", "meshingfill", "pads",
+                 "gds_stream", "gds_object", "inherit", "vertices")
+
     def __init__(self):
         self.type = "MET POL" # "MET POL", "BRI POL" or "VIA POLYGON"
         self.ilevel = None
@@ -157,7 +326,11 @@ class Polygon():
         # List of [xvertex, yvertex]
         self.vertices = []
 
+
 class Port():
+    __slots__ = ("type", "ipolygon", "ivertex", "portnum", "resist", "react",
+                 "induct", "capac", "xcoord", "ycoord")
+
     def __init__(self):
         self.type = "STD"
         self.ipolygon = None
@@ -170,8 +343,16 @@ class Port():
         self.xcoord = None
         self.ycoord = None
 
+
 class Component():
     # Only ideal components are implemeted
+    __slots__ = ("levelnum", "label", "objectid", "gndref", "twtype",
+                 "leftpos", "rightpos", "toppos", "bottompos", "pbshw",
+                 "xpos", "ypos", "smdp1_levelnum", "smdp1_x", "smdp1_y",
+                 "smdp1_orientation", "smdp1_portnum", "smdp1_pinnum",
+                 "smdp2_levelnum", "smdp2_x", "smdp2_y", "smdp2_orientation",
+                 "smdp2_portnum", "smdp2_pinnum", "idealtype", "compval")
+
     def __init__(self):
         self.levelnum = None
         self.label = None
@@ -200,19 +381,24 @@ class Component():
         self.idealtype = "IND"
         self.compval = 30
 
+
 class Valvar():
+    __slots__ = ("varname", "unittype", "value", "description")
+
     def __init__(self):
         self.varname = None
         self.unittype = None
         self.value = 30
         self.description = ""
 
+
 class Lorgn():
     def __init__(self):
         self.x = None
         self.y = None
         self.locked = "U"
 
+
 class Control():
     def __init__(self):
         self.sweep = "ABS" # SIMPLE, ABS or VARSWP
@@ -235,6 +421,7 @@ class Control():
         self.q_acc = "Y"
         self.det_abs_res = None
 
+
 class Freq():
     # Only SIMPLE and ABS sweeps are implemeted
     def __init__(self):
@@ -243,15 +430,18 @@ class Freq():
         self.f2 = None
         self.fstep = None
 
+
 class Opt():
     def __init__(self):
         self.lines = []
 
+
 class Varswp():
     def __init__(self):
         # List of Psweep instances
         self.psweeps = []
 
+
 class Psweep():
     # Only SWEEP and ABS_ENTRY sweeps are implemeted
     def __init__(self):
@@ -262,7 +452,10 @@ class Psweep():
         # List of Var instances
         self.vars = []
 
+
 class Var():
+    __slots__ = ("parameter", "ytype", "min", "max", "step")
+
     def __init__(self):
         self.parameter = None
         self.ytype = "Y" # "N" or any of the Ytypes
@@ -270,6 +463,7 @@ class Var():
         self.max = None
         self.step = None
 
+
 class Fileout():
     # Only a single "Response" file (for geometry projects) is implemented
     def __init__(self):
@@ -284,14 +478,2170 @@ class Fileout():
         self.ports = "R 50"
         self.folder = None
 
+
 class Subdiv():
     def __init__(self):
         self.lines = []
 
+
 class Qsg():
     def __init__(self):
         self.lines = []
 
+
+# Keywords that select the sweep in the CONTROL block
+CONTROL_SWEEPS = ["SIMPLE", "STD", "ABS", "OPTIMIZE", "VARSWP", "EXTFILE"]
+
+# CONTROL statements of the form "KEYWORD value"
+CONTROL_VALUES = {
+    "OPTIONS": ("options", str),
+    "FILENAME": ("filename", str),
+    "SPEED": ("speed", int),
+    "CACHE_ABS": ("cache_abs", int),
+    "TARG_ABS": ("targ_abs", int),
+    "Q_ACC": ("q_acc", str), # "Y" or "N"
+    "DET_ABS_RES": ("det_abs_res", str), # "Y" or "N"
+}
+
+# CONTROL statements of the form "KEYWORD Y value" or "KEYWORD N"
+CONTROL_SWITCHES = {
+    "SUBSPLAM": ("subsplam", "subsplam_subslambda", int),
+    "CFMAX": ("cfmax", "cfmax_subfreq", float),
+    "CEPSY": ("cepsy", "cepsy_epsilon", float),
+    "RES_ABS": ("res_abs", "res_abs_resolution", float),
+}
+
+# Output file types in the FILEOUT block
+FILEOUT_TYPES = ["TS", "TOUCH2", "DATA_BANK", "SC", "CSV", "CADENCE", "MDIF", "EBMDIF"]
+
+
+@contextlib.contextmanager
+def gcPaused():
+    # Internal use only.
+
+    # Pauses the cyclic garbage collector while a block builds many small
+    # objects without reference cycles (vertex lists, edge hashes, unpickled
+    # polygons). Otherwise the collector would rescan the growing structures
+    # again and again for nothing. The previous state is restored afterwards.
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gcEnabled:
+            gc.enable()
+
+
+def readPolygons(lines, index, npoly, arrays=False):
+    # Internal use only.
+
+    # Parses npoly polygon records of the NUM statement, starting at
+    # lines[index]. Returns the list of polygons and the index of the first
+    # line after the last polygon. Every line is split exactly once.
+    # Parsing creates millions of small lists (one per vertex), so it runs
+    # under gcPaused.
+    # With arrays the coordinates are collected in a flat array instead, and
+    # the vertices of every polygon become a view on it (see storeVertices).
+
+    coordinates = None
+    if arrays:
+        coordinates = array.array('d')
+    with gcPaused():
+        polygons, index, offsets = readPolygonRecords(lines, index, npoly, coordinates)
+
+    if arrays:
+        storeVertices(polygons, np.frombuffer(coordinates).reshape(-1, 2), offsets)
+
+    return polygons, index
+
+
+def readPolygonRecords(lines, index, npoly, coordinates=None):
+    # Internal use only.
+
+    # The parser behind readPolygons. If coordinates is an array, the
+    # coordinates are appended to it and the offsets of the polygons in it are
+    # returned as well.
+
+    polygons = []
+    offsets = [0]
+    for poly in range(npoly):
+        polygon = Polygon()
+        params = lines[index].split()
+        index += 1
+        if len(params) != 13:
+            polygon.type = " ".join(params)
+            params = lines[index].split()
+            index += 1
+        else:
+            polygon.type = "MET POL"
+        polygon.ilevel = int(params[0])
+        polygon.nvertices = int(params[1])
+        polygon.mtype = int(params[2])
+        polygon.filltype = params[3]
+        polygon.debugid = int(params[4])
+        polygon.xmin = int(params[5])
+        polygon.ymin = int(params[6])
+        polygon.xmax = int(params[7])
+        polygon.ymax = int(params[8])
+        polygon.conmax = int(params[9])
+        polygon.res1 = int(params[10])
+        polygon.res2 = int(params[11])
+        polygon.edgemesh = params[12]
+        params = lines[index].split()
+        index += 1
+        if params[0] == "TOLEVEL":
+            polygon.to_level = int(params[1])
+            polygon.meshingfill = params[2]
+            polygon.pads = params[3]
+            params = lines[index].split()
+            index += 1
+        gds_indices = params[1].replace("Stream","").split(":")
+        polygon.gds_stream = int(gds_indices[0])
+        polygon.gds_object = int(gds_indices[1])
+        polygon.inherit = params[2]
+        line = lines[index]
+        index += 1
+        if coordinates == None:
+            vertices = polygon.vertices
+            while line != "END\n":
+                params = line.split()
+                vertices.append([float(params[0]), float(params[1])])
+                line = lines[index]
+                index += 1
+        else:
+            while line != "END\n":
+                params = line.split()
+                coordinates.append(float(params[0]))
+                coordinates.append(float(params[1]))
+                line = lines[index]
+                index += 1
+            offsets.append(len(coordinates)//2)
+        polygons.append(polygon)
+
+    return polygons, index, offsets
+
+
+def storeVertices(polygons, vertices, offsets):
+    # Internal use only.
+
+    # Sets the vertices of every polygon to a view on the (N, 2) array
+    # vertices holding the vertices of all polygons. The vertices of
+    # polygons[i] are vertices[offsets[i]:offsets[i + 1]]. A view costs about
+    # 100 bytes per polygon, while a vertex takes 16 bytes in the array
+    # instead of about 120 bytes as a list of two floats.
+    for i, polygon in enumerate(polygons):
+        polygon.vertices = vertices[offsets[i]:offsets[i + 1]]
+
+
+def packVertices(polygons):
+    # Internal use only.
+
+    # Moves the vertices of polygons into a single array, see storeVertices
+    offsets = [0]
+    for polygon in polygons:
+        offsets.append(offsets[-1] + len(polygon.vertices))
+    coordinates = np.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(polygon.vertices for polygon in polygons)), dtype=float, count=2*offsets[-1])
+    storeVertices(polygons, coordinates.reshape(-1, 2), offsets)
+
+
+# Returns the attributes of a polygon as a tuple (see readPolygonChunk)
+polygonAttributes = operator.attrgetter(*Polygon.__slots__)
+
+# The attributes of a polygon written to its record, except the vertices and
+# the levels, which are taken from its technology layer (see writePolygons)
+
+
+# NUM statements with fewer polygons are always read in a single process,
+# since starting the worker processes takes longer than reading them
+PARALLEL_THRESHOLD = 50000
+
+
+def readPolygonChunk(lines):
+    # Internal use only.
+
+    # Runs in the worker processes of readPolygonsParallel. Parses all polygon
+    # records in lines and returns each as a tuple of its attribute values,
+    # which pass between processes much faster than Polygon instances.
+    polygons, index = readPolygons(lines, 0, lines.count("END\n"))
+    return [polygonAttributes(polygon) for polygon in polygons]
+
+
+def readPolygonsParallel(lines, index, npoly, processes, exception=Exception, arrays=False):
+    # Internal use only.
+
+    # Same as readPolygons, but the polygon records are split into chunks
+    # which are parsed on a pool of processes worker processes. Every record
+    # ends with an END line and vertex lines never equal END, so the chunks
+    # are cut right after END lines. The chunks are merged back in their
+    # original order.
+
+    try:
+        end = lines.index("END GEO\n", index)
+    except ValueError:
+        raise exception("Sonnet project file is missing END GEO")
+
+    # A few chunks per process balance the load between the processes
+    nchunks = 4*processes
+    step = max(1, (end - index)//nchunks)
+    chunks = []
+    start = index
+    while start < end:
+        try:
+            stop = lines.index("END\n", min(start + step, end - 1), end) + 1
+        except ValueError:
+            break
+        chunks.append(lines[start:stop])
+        start = stop
+
+    polygons = []
+    with gcPaused():
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            for records in executor.map(readPolygonChunk, chunks):
+                for record in records:
+                    polygon = Polygon.__new__(Polygon)
+                    # Same order as Polygon.__slots__
+                    (polygon.type, polygon.ilevel, polygon.nvertices, polygon.mtype,
+                     polygon.filltype, polygon.debugid, polygon.xmin, polygon.ymin,
+                     polygon.xmax, polygon.ymax, polygon.conmax, polygon.res1,
+                     polygon.res2, polygon.edgemesh, polygon.to_level,
+                     polygon.meshingfill, polygon.pads, polygon.gds_stream,
+                     polygon.gds_object, polygon.inherit, polygon.vertices) = record
+                    polygons.append(polygon)
+
+    if len(polygons) != npoly:
+        raise exception("Sonnet project file has {:d} polygons instead of {:d}".format(len(polygons), npoly))
+
+    if arrays:
+        packVertices(polygons)
+
+    return polygons, start
+
+
+def assignPolygons(dlayers, polygons):
+    # Internal use only.
+
+    # Appends every polygon to the technology layers matching its
+    # (gds_stream, gds_object) pair. The layers are looked up in a dictionary
+    # built once, so each polygon is assigned in constant time.
+
+    tlayersByStream = {}
+    for dlayer in dlayers:
+        for tlayer in dlayer.tlayers:
+            key = (tlayer.gds_stream, tlayer.gds_object)
+            tlayersByStream.setdefault(key, []).append(tlayer)
+
+    assigned = {}
+    for polygon in polygons:
+        for tlayer in tlayersByStream.get((polygon.gds_stream, polygon.gds_object), ()):
+            assigned.setdefault(id(tlayer), (tlayer, []))[1].append(polygon)
+    for tlayer, tlayerPolygons in assigned.values():
+        tlayer.getPolygons().extend(tlayerPolygons)
+
+
+# Polygons whose bounding box covers more grid cells than this are entered
+# into the grid of EdgeIndex edge by edge, and edges covering more cells are
+# checked by every query
+EDGE_INDEX_MAX_CELLS = 64
+
+
+class EdgeIndex():
+    # Internal use only.
+
+    # Uniform grid over the polygons of a technology layer, used to find the
+    # polygon edges near an attachment point (see addPort and addComponent)
+    # without looking at every edge. Every polygon is entered into the cells
+    # covered by its bounding box, except large polygons (e.g. ground planes)
+    # whose edges are entered one by one. The cell size is about the size of
+    # an average polygon.
+
+    def __init__(self, polygons):
+        self.polygons = list(polygons)
+        # Entries are (ipolygon, ivertex), where ivertex is -1 for a whole
+        # polygon, so sorting them gives the original order of the edges
+        self.cells = cells = {}
+        self.large = []
+        self.xorigin = self.yorigin = 0
+        self.cellsize = 1
+
+        boxes = []
+        for polygon in self.polygons:
+            xvertices = [vertex[0] for vertex in polygon.vertices]
+            yvertices = [vertex[1] for vertex in polygon.vertices]
+            if xvertices:
+                boxes.append((min(xvertices), min(yvertices), max(xvertices), max(yvertices)))
+            else:
+                boxes.append(None)
+        if not any(boxes):
+            return
+
+        self.xorigin = xorigin = min(box[0] for box in boxes if box)
+        self.yorigin = yorigin = min(box[1] for box in boxes if box)
+        xspan = max(box[2] for box in boxes if box) - xorigin
+        yspan = max(box[3] for box in boxes if box) - yorigin
+        # Squares with about one polygon each for a layout evenly covered
+        # with polygons, but no thinner than the layout divided by the polygons
+        npolygons = len(self.polygons)
+        self.cellsize = cellsize = max((xspan*yspan/npolygons)**0.5, max(xspan, yspan)/npolygons) or 1
+
+        for ipolygon, box in enumerate(boxes):
+            if box == None:
+                continue
+            ix0, iy0, ix1, iy1 = self.cellRange(*box)
+            if ix0 == ix1 and iy0 == iy1:
+                cells.setdefault((ix0, iy0), []).append((ipolygon, -1))
+            elif (ix1 - ix0 + 1)*(iy1 - iy0 + 1) <= EDGE_INDEX_MAX_CELLS:
+                for ix in range(ix0, ix1 + 1):
+                    for iy in range(iy0, iy1 + 1):
+                        cells.setdefault((ix, iy), []).append((ipolygon, -1))
+            else:
+                for polygon, ivertex, x0, y0, x1, y1 in self.getEdges(ipolygon):
+                    ix0, iy0, ix1, iy1 = self.cellRange(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+                    if (ix1 - ix0 + 1)*(iy1 - iy0 + 1) > EDGE_INDEX_MAX_CELLS:
+                        self.large.append((ipolygon, ivertex))
+                        continue
+                    for ix in range(ix0, ix1 + 1):
+                        for iy in range(iy0, iy1 + 1):
+                            cells.setdefault((ix, iy), []).append((ipolygon, ivertex))
+
+    def cellRange(self, xmin, ymin, xmax, ymax):
+        # The first and last cell in x and y direction covering the rectangle
+        return (int((xmin - self.xorigin)//self.cellsize), int((ymin - self.yorigin)//self.cellsize),
+                int((xmax - self.xorigin)//self.cellsize), int((ymax - self.yorigin)//self.cellsize))
+
+    def getEdges(self, ipolygon):
+        # Returns the edges of a polygon as (polygon, ivertex, x0, y0, x1, y1)
+        polygon = self.polygons[ipolygon]
+        vertices = polygon.vertices
+        if np != None and type(vertices) == np.ndarray:
+            vertices = vertices.tolist()
+        edges = []
+        for ivertex in range(0, polygon.nvertices - 1):
+            edges.append((polygon, ivertex, vertices[ivertex][0], vertices[ivertex][1],
+                          vertices[ivertex + 1][0], vertices[ivertex + 1][1]))
+        return edges
+
+    def query(self, xmin, ymin, xmax, ymax):
+        # Returns the edges (see getEdges) that may have a bounding box
+        # intersecting the rectangle, in their original order. The caller
+        # checks the actual distance.
+        ix0, iy0, ix1, iy1 = self.cellRange(xmin, ymin, xmax, ymax)
+        if (ix1 - ix0 + 1)*(iy1 - iy0 + 1) > len(self.cells):
+            # Large rectangles cover most cells anyway
+            entries = set((ipolygon, -1) for ipolygon in range(len(self.polygons)))
+        else:
+            entries = set(self.large)
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    entries.update(self.cells.get((ix, iy), ()))
+        edges = []
+        for ipolygon, group in itertools.groupby(sorted(entries), operator.itemgetter(0)):
+            polygonEdges = self.getEdges(ipolygon)
+            for ipolygon, ivertex in group:
+                if ivertex == -1:
+                    edges += polygonEdges
+                else:
+                    edges.append(polygonEdges[ivertex])
+        return edges
+
+
+def polygonArea(vertices):
+    # Internal use only.
+
+    # Signed area of a closed list of vertices (the shoelace formula),
+    # positive for counterclockwise vertices in a y up system
+    area = 0
+    for (x0, y0), (x1, y1) in zip(vertices, vertices[1:]):
+        area += x0*y1 - x1*y0
+    return area/2
+
+
+def mergePolygonGroups(polygons):
+    # Internal use only.
+
+    # Finds the groups of abutting polygons that can be merged into one
+    # polygon (see mergePolygons) and returns a list of (ipolygons,
+    # vertices) with the indices of the polygons of each group and the
+    # closed list of vertices of the merged polygon.
+    # All polygons are oriented the same way, so the edges two abutting
+    # polygons share run in opposite directions. The edges are hashed on
+    # their end points and opposite edges cancel out, which also joins the
+    # two polygons in a group. Vertical and horizontal edges are first
+    # split at the end points of all other edges on the same line, so edges
+    # shared only in part cancel as well. The edges left of a group trace
+    # the outline of the merged polygon. If the outline of a group is not a
+    # single loop (it encloses a hole or polygons only touch at a corner),
+    # the group is split into parts without holes, see splitHoleFreeGroups.
+    # A group or part is left alone if its area differs from the sum of the
+    # areas of its polygons (some of them overlap).
+
+    loops = []
+    areas = []
+    for polygon in polygons:
+        vertices = polygon.vertices
+        if np != None and type(vertices) == np.ndarray:
+            vertices = vertices.tolist()
+        vertices = [tuple(vertex) for vertex in vertices]
+        area = polygonArea(vertices)
+        if area < 0:
+            vertices.reverse()
+        loops.append(vertices)
+        areas.append(area)
+
+    # All end points on every vertical (x) and horizontal (y) line
+    xlines = {}
+    ylines = {}
+    for vertices in loops:
+        for (x0, y0), (x1, y1) in zip(vertices, vertices[1:]):
+            if x0 == x1:
+                xlines.setdefault(x0, set()).update((y0, y1))
+            elif y0 == y1:
+                ylines.setdefault(y0, set()).update((x0, x1))
+    xlines = {x: sorted(ylist) for x, ylist in xlines.items()}
+    ylines = {y: sorted(xlist) for y, xlist in ylines.items()}
+
+    # Disjoint sets of polygons joined by shared edges
+    parents = list(range(len(polygons)))
+    def find(ipolygon):
+        while parents[ipolygon] != ipolygon:
+            parents[ipolygon] = parents[parents[ipolygon]]
+            ipolygon = parents[ipolygon]
+        return ipolygon
+
+    def splitEdges(vertices):
+        # The edges of a loop split at the end points of the other edges on
+        # the same vertical or horizontal line, in the order of the loop
+        splits = []
+        for (x0, y0), (x1, y1) in zip(vertices, vertices[1:]):
+            if x0 == x1 and y0 == y1:
+                continue
+            elif x0 == x1:
+                points = xlines[x0]
+                points = points[bisect.bisect_right(points, min(y0, y1)):bisect.bisect_left(points, max(y0, y1))]
+                if y0 > y1:
+                    points.reverse()
+                points = [(x0, y) for y in points]
+            elif y0 == y1:
+                points = ylines[y0]
+                points = points[bisect.bisect_right(points, min(x0, x1)):bisect.bisect_left(points, max(x0, x1))]
+                if x0 > x1:
+                    points.reverse()
+                points = [(x, y0) for x in points]
+            else:
+                points = []
+            points = [(x0, y0)] + points + [(x1, y1)]
+            splits.extend(zip(points, points[1:]))
+        return splits
+
+    # The edges that did not cancel out, with the polygons they belong to
+    edges = {}
+    for ipolygon, vertices in enumerate(loops):
+        for start, end in splitEdges(vertices):
+            owners = edges.get((end, start))
+            if owners:
+                parents[find(owners.pop())] = find(ipolygon)
+            else:
+                edges.setdefault((start, end), []).append(ipolygon)
+
+    groups = {}
+    outlines = {}
+    for ipolygon in range(len(polygons)):
+        groups.setdefault(find(ipolygon), []).append(ipolygon)
+    for edge, owners in edges.items():
+        for ipolygon in owners:
+            outlines.setdefault(find(ipolygon), []).append(edge)
+
+    merged = []
+    for root, ipolygons in groups.items():
+        if len(ipolygons) < 2 or root not in outlines:
+            continue
+        vertices = traceOutline(outlines[root])
+        if vertices == None:
+            parts = splitHoleFreeGroups(ipolygons, [splitEdges(loops[ipolygon]) for ipolygon in ipolygons])
+        else:
+            parts = [(ipolygons, vertices)]
+        for ipolygons, vertices in parts:
+            if vertices == None or len(ipolygons) < 2:
+                continue
+            area = sum(abs(areas[ipolygon]) for ipolygon in ipolygons)
+            if abs(polygonArea(vertices) - area) > 1e-9*area:
+                continue
+            # Keep the orientation of the first polygon
+            if areas[ipolygons[0]] < 0:
+                vertices.reverse()
+            merged.append((ipolygons, vertices))
+
+    return merged
+
+
+def traceOutline(outline):
+    # Internal use only.
+
+    # Follows the edges (start, end) of outline from vertex to vertex and
+    # returns the closed list of vertices of the loop they form, without
+    # the vertices in the middle of straight edges. Returns None if the
+    # edges do not form a single loop of at least three vertices.
+    following = {}
+    for start, end in outline:
+        if start in following:
+            return None
+        following[start] = end
+    start = min(following)
+    loop = [start]
+    vertex = following[start]
+    while vertex != start and vertex in following and len(loop) <= len(following):
+        loop.append(vertex)
+        vertex = following[vertex]
+    if vertex != start or len(loop) != len(following):
+        return None
+    vertices = []
+    for ivertex in range(len(loop)):
+        (xa, ya), (xb, yb), (xc, yc) = loop[ivertex - 1], loop[ivertex], loop[(ivertex + 1) % len(loop)]
+        if (xb - xa)*(yc - yb) != (yb - ya)*(xc - xb):
+            vertices.append([xb, yb])
+    if len(vertices) < 3:
+        return None
+    vertices.append(list(vertices[0]))
+    return vertices
+
+
+def splitHoleFreeGroups(ipolygons, splits):
+    # Internal use only.
+
+    # Splits a group of abutting polygons whose outline is not a single loop
+    # (see mergePolygonGroups) into parts that can each be merged into one
+    # polygon, and returns a list of (ipolygons, vertices) like
+    # mergePolygonGroups, with vertices None for a part that is no single
+    # loop after all. splits holds the split edges of every polygon of the
+    # group (see splitEdges in mergePolygonGroups).
+    # Every part grows from the first polygon not in a part yet, breadth
+    # first over shared edges. A polygon joins a part only if the edges it
+    # shares with the outline of the part are one contiguous run of its
+    # own edges and none of its other vertices lies on the outline, so
+    # the outline stays a single loop without holes or corners where it
+    # touches itself. A polygon turned down is tried again when another of
+    # its neighbours joins the part. The parts are maximal but not
+    # necessarily the largest possible, e.g. a ring of polygons around a
+    # hole becomes one part open on one side and the polygon closing it.
+    owners = {}
+    for index, edges in enumerate(splits):
+        for edge in edges:
+            owners[edge] = index
+
+    parts = []
+    done = [False]*len(ipolygons)
+    for seed in range(len(ipolygons)):
+        if done[seed]:
+            continue
+        done[seed] = True
+        part = [seed]
+        outline = dict(splits[seed])
+        queue = collections.deque(owners.get((end, start)) for start, end in splits[seed])
+        while queue:
+            index = queue.popleft()
+            if index == None or done[index]:
+                continue
+            edges = splits[index]
+            shared = [outline.get(end) == start for start, end in edges]
+            # Number of runs of shared edges around the polygon
+            runs = sum(1 for iedge in range(len(edges)) if shared[iedge] and not shared[iedge - 1])
+            if runs != 1 or all(shared):
+                continue
+            if any(edges[iedge][0] in outline for iedge in range(len(edges)) if not shared[iedge] and not shared[iedge - 1]):
+                continue
+            done[index] = True
+            part.append(index)
+            for (start, end), isShared in zip(edges, shared):
+                if isShared:
+                    del outline[end]
+            for (start, end), isShared in zip(edges, shared):
+                if not isShared:
+                    outline[start] = end
+                    queue.append(owners.get((end, start)))
+        parts.append(([ipolygons[index] for index in sorted(part)], traceOutline(outline.items()) if len(part) > 1 else None))
+    return parts
+
+
+def gatherVertices(polygons):
+    # Internal use only.
+
+    # Returns the vertices of all polygons as one (N, 2) array and the
+    # number of vertices of every polygon, for the operations that handle
+    # the polygons of a layer at once with numpy
+    lengths = np.array([len(polygon.vertices) for polygon in polygons], dtype=np.int64)
+    if len(polygons) > 0 and all(type(polygon.vertices) == np.ndarray for polygon in polygons):
+        coordinates = np.concatenate([polygon.vertices for polygon in polygons])
+    else:
+        vertices = itertools.chain.from_iterable(polygon.vertices for polygon in polygons)
+        coordinates = np.fromiter(itertools.chain.from_iterable(vertices), float, 2*int(lengths.sum()))
+    return coordinates.reshape(-1, 2), lengths
+
+
+def transformVertices(polygons, matrix, offset, vectorized=True):
+    # Internal use only.
+
+    # Applies the affine transform (x, y) -> matrix (x, y) + offset to the
+    # vertices of the polygons in place, see transformGeometry. Vertices
+    # stored in arrays (see storeVertices) are transformed all at once with
+    # numpy (unless vectorized=False). Vertices stored as lists are changed
+    # one by one, which is faster than converting them to an array and back.
+    ((xx, xy), (yx, yy)), (dx, dy) = matrix, offset
+    translation = (xx, xy, yx, yy) == (1, 0, 0, 1)
+
+    stored = []
+    for polygon in polygons:
+        vertices = polygon.vertices
+        if np != None and type(vertices) == np.ndarray:
+            if vectorized:
+                stored.append(polygon)
+            else:
+                for vertex in vertices:
+                    x, y = vertex.tolist()
+                    vertex[0], vertex[1] = xx*x + xy*y + dx, yx*x + yy*y + dy
+        elif translation:
+            for vertex in vertices:
+                vertex[0] += dx
+                vertex[1] += dy
+        else:
+            for vertex in vertices:
+                x, y = vertex
+                vertex[0], vertex[1] = xx*x + xy*y + dx, yx*x + yy*y + dy
+
+    if len(stored) > 0:
+        coordinates, lengths = gatherVertices(stored)
+        x, y = coordinates[:, 0], coordinates[:, 1]
+        coordinates = np.column_stack((xx*x + xy*y + dx, yx*x + yy*y + dy))
+        end = 0
+        for polygon, length in zip(stored, lengths.tolist()):
+            start, end = end, end + length
+            polygon.vertices[:] = coordinates[start:end]
+
+
+def simplifyRing(ring):
+    # Internal use only.
+
+    # Scalar version of simplifyPolygons for one open list of vertices
+    while True:
+        # Consecutive duplicates
+        ring = [vertex for ivertex, vertex in enumerate(ring) if vertex != ring[ivertex - 1]]
+        # Vertices in the middle of straight edges
+        simplified = []
+        for ivertex in range(len(ring)):
+            (xa, ya), (xb, yb), (xc, yc) = ring[ivertex - 1], ring[ivertex], ring[(ivertex + 1) % len(ring)]
+            if (xb - xa)*(yc - yb) != (yb - ya)*(xc - xb):
+                simplified.append(ring[ivertex])
+        if len(simplified) == len(ring):
+            return ring
+        ring = simplified
+
+
+def simplifyPolygons(polygons, vectorized=True):
+    # Internal use only.
+
+    # Removes consecutive duplicate vertices and vertices in the middle of
+    # straight edges (collinear with their neighbours) from the polygons,
+    # see simplifyGeometry. Returns a list with, for every polygon, None if
+    # it is unchanged, an empty list if nothing but a line or point is left,
+    # and otherwise the new closed list of vertices. Both steps are
+    # repeated until nothing changes, since removing the tip of a spike
+    # leaves duplicates behind. All polygons are handled at once with numpy
+    # if it is installed, otherwise (or with vectorized=False) one by one.
+
+    if np == None or not vectorized:
+        simplified = []
+        for polygon in polygons:
+            vertices = polygon.vertices
+            if np != None and type(vertices) == np.ndarray:
+                vertices = vertices.tolist()
+            ring = [tuple(vertex) for vertex in vertices[:-1]]
+            newRing = simplifyRing(ring)
+            if len(newRing) < 3:
+                simplified.append([])
+            elif len(newRing) == len(ring):
+                simplified.append(None)
+            else:
+                simplified.append([list(vertex) for vertex in newRing + newRing[:1]])
+        return simplified
+
+    # The vertices of all polygons, without the closing vertex of each
+    coordinates, lengths = gatherVertices(polygons)
+    closing = np.ones(len(coordinates), dtype=bool)
+    closing[(np.cumsum(lengths) - 1)[lengths > 0]] = False
+    x, y = coordinates[closing, 0], coordinates[closing, 1]
+    lengths = np.maximum(lengths - 1, 0)
+    counts = lengths
+    iring = np.repeat(np.arange(len(polygons)), counts)
+
+    def neighbours(iring, counts):
+        # The previous and next vertex of every vertex in its own ring
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        ivertex = np.arange(len(iring))
+        previous = ivertex - 1
+        following = ivertex + 1
+        nonempty = counts > 0
+        previous[starts[nonempty]] = ends[nonempty] - 1
+        following[ends[nonempty] - 1] = starts[nonempty]
+        return previous, following
+
+    while True:
+        previous, following = neighbours(iring, counts)
+        keep = (x != x[previous]) | (y != y[previous])
+        x, y, iring = x[keep], y[keep], iring[keep]
+        counts = np.bincount(iring, minlength=len(polygons))
+        previous, following = neighbours(iring, counts)
+        keep = (x - x[previous])*(y[following] - y) != (y - y[previous])*(x[following] - x)
+        if keep.all():
+            break
+        x, y, iring = x[keep], y[keep], iring[keep]
+        counts = np.bincount(iring, minlength=len(polygons))
+
+    allVertices = np.column_stack((x, y)).tolist()
+    starts = (np.cumsum(counts) - counts).tolist()
+    simplified = []
+    for start, count, length in zip(starts, counts.tolist(), lengths.tolist()):
+        if count < 3:
+            simplified.append([])
+        elif count == length:
+            simplified.append(None)
+        else:
+            vertices = allVertices[start:start + count]
+            vertices.append(list(vertices[0]))
+            simplified.append(vertices)
+    return simplified
+
+
+def snapValue(value, cellsize, tolerance):
+    # Internal use only.
+
+    # Scalar version of snapVertices for one coordinate
+    snapped = round(value/cellsize)*cellsize
+    if abs(snapped - value) <= tolerance:
+        return snapped
+    return value
+
+
+def snapVertices(polygons, xcellsize, ycellsize, xtolerance, ytolerance, vectorized=True):
+    # Internal use only.
+
+    # Moves the x (y) coordinates of the vertices of the polygons that are
+    # within xtolerance (ytolerance) of a multiple of xcellsize (ycellsize)
+    # onto that multiple, see snapToGrid. Returns a list with, for every
+    # polygon, None if it is unchanged and otherwise the new closed list of
+    # vertices, and the number of moved vertices. All polygons are handled
+    # at once with numpy if it is installed, otherwise (or with
+    # vectorized=False) one by one.
+
+    if np == None or not vectorized:
+        snapped = []
+        nsnapped = 0
+        for polygon in polygons:
+            vertices = polygon.vertices
+            if np != None and type(vertices) == np.ndarray:
+                vertices = vertices.tolist()
+            newVertices = [[snapValue(x, xcellsize, xtolerance), snapValue(y, ycellsize, ytolerance)] for x, y in vertices]
+            nmoved = sum(1 for vertex, newVertex in zip(vertices[:-1], newVertices) if list(vertex) != newVertex)
+            snapped.append(newVertices if nmoved > 0 else None)
+            nsnapped += nmoved
+        return snapped, nsnapped
+
+    coordinates, lengths = gatherVertices(polygons)
+    cellsizes = np.array([xcellsize, ycellsize])
+    grid = np.round(coordinates/cellsizes)*cellsizes
+    moved = (np.abs(grid - coordinates) <= np.array([xtolerance, ytolerance])) & (grid != coordinates)
+    coordinates = np.where(moved, grid, coordinates)
+
+    # Moved vertices, not counting the closing vertex of each polygon
+    moved = moved.any(axis=1)
+    ends = np.cumsum(lengths)
+    ipolygon = np.repeat(np.arange(len(polygons)), lengths)
+    nmoved = np.bincount(ipolygon[moved], minlength=len(polygons))
+    nsnapped = int(moved.sum()) - int(moved[ends[lengths > 0] - 1].sum())
+
+    allVertices = coordinates.tolist()
+    snapped = []
+    for end, length, count in zip(ends.tolist(), lengths.tolist(), nmoved.tolist()):
+        snapped.append(allVertices[end - length:end] if count > 0 else None)
+    return snapped, nsnapped
+
+
+def gridCellSize(values, resolution, tolerance):
+    # Internal use only.
+
+    # Returns the largest multiple of resolution that all values are whole
+    # multiples of (within tolerance), the greatest common divisor of the
+    # values in units of the resolution. Returns None if some value is not a
+    # multiple of the resolution or all values are zero.
+
+    if np == None:
+        units = [round(value/resolution) for value in values]
+        if any(abs(unit*resolution - value) > tolerance for unit, value in zip(units, values)):
+            return None
+        divisor = math.gcd(*units) if units else 0
+    else:
+        values = np.asarray(values, dtype=float)
+        units = np.round(values/resolution)
+        if len(values) > 0 and np.abs(units*resolution - values).max() > tolerance:
+            return None
+        divisor = int(np.gcd.reduce(units.astype(np.int64))) if len(values) > 0 else 0
+    if divisor == 0:
+        return None
+    return divisor*resolution
+
+
+def clipPolygon(vertices, xmin, ymin, xmax, ymax):
+    # Internal use only.
+
+    # Clips the closed list of vertices to the rectangle with the
+    # Sutherland-Hodgman algorithm, i.e. against the four sides one after
+    # the other, see cropToRegion. Returns None if the polygon lies inside the
+    # rectangle, an empty list if nothing (but a line or point) is left, and
+    # otherwise the closed list of vertices of the clipped polygon. A
+    # concave polygon that leaves and reenters the rectangle is kept as one
+    # polygon, and the edges along the side in between are removed again
+    # (see simplifyRing).
+    if np != None and type(vertices) == np.ndarray:
+        vertices = vertices.tolist()
+    ring = [tuple(vertex) for vertex in vertices[:-1]]
+    if len(ring) == 0:
+        return []
+    xvertices = [vertex[0] for vertex in ring]
+    yvertices = [vertex[1] for vertex in ring]
+    if xmin <= min(xvertices) and max(xvertices) <= xmax and ymin <= min(yvertices) and max(yvertices) <= ymax:
+        return None
+    if xmax < min(xvertices) or max(xvertices) < xmin or ymax < min(yvertices) or max(yvertices) < ymin:
+        return []
+
+    for axis, bound, upper in [(0, xmin, False), (0, xmax, True), (1, ymin, False), (1, ymax, True)]:
+        clipped = []
+        for ivertex in range(len(ring)):
+            previous, current = ring[ivertex - 1], ring[ivertex]
+            previousInside = previous[axis] <= bound if upper else previous[axis] >= bound
+            currentInside = current[axis] <= bound if upper else current[axis] >= bound
+            if previousInside != currentInside:
+                # The point where the edge crosses the side
+                t = (bound - previous[axis])/(current[axis] - previous[axis])
+                other = previous[1 - axis] + t*(current[1 - axis] - previous[1 - axis])
+                clipped.append((bound, other) if axis == 0 else (other, bound))
+            if currentInside:
+                clipped.append(current)
+        ring = clipped
+        if len(ring) == 0:
+            return []
+
+    ring = simplifyRing(ring)
+    if len(ring) < 3:
+        return []
+    return [list(vertex) for vertex in ring + ring[:1]]
+
+
+def findEdge(vertices, xcoord, ycoord):
+    # Internal use only.
+
+    # Returns the index of the first edge of the closed list of vertices that
+    # the point (xcoord, ycoord) lies on, or None
+    for ivertex in range(len(vertices) - 1):
+        (x0, y0), (x1, y1) = vertices[ivertex], vertices[ivertex + 1]
+        if min(x0, x1) <= xcoord <= max(x0, x1) and min(y0, y1) <= ycoord <= max(y0, y1):
+            cross = (x1 - x0)*(ycoord - y0) - (y1 - y0)*(xcoord - x0)
+            if abs(cross) <= 1e-9*((x1 - x0)**2 + (y1 - y0)**2):
+                return ivertex
+    return None
+
+
+def nearestEdgePoints(edges, xcoord, ycoord, xmargin, ymargin, vectorized=True):
+    # Internal use only.
+
+    # Finds the attachment points of (xcoord, ycoord) on the edges (see
+    # EdgeIndex.getEdges) whose bounding box is within xmargin and ymargin of
+    # the point. Returns a list of (iedge, error, xnew, ynew) in the order of
+    # the edges, where (xnew, ynew) is the nearest point on edge number iedge
+    # and error the squared distance to it. For vertical and horizontal edges
+    # the error is the squared distance to the line through the edge, so
+    # points next to the end of an edge attach as well as points beside it.
+    # All edges are handled at once with numpy if it is installed, otherwise
+    # (or with vectorized=False) one by one.
+    if len(edges) == 0:
+        return []
+
+    if np == None or not vectorized:
+        attachments = []
+        for iedge, (polygon, ivertex, x0, y0, x1, y1) in enumerate(edges):
+            if min(x0,x1) - xmargin <= xcoord and \
+               xcoord <= max(x0,x1) + xmargin and \
+               min(y0,y1) - ymargin <= ycoord and \
+               ycoord <= max(y0,y1) + ymargin:
+                if x0 == x1:
+                    error = (xcoord - x0)**2
+                    xnew = x0
+                    ynew = min(max(ycoord, min(y0,y1)), max(y0,y1))
+                elif y0 == y1:
+                    error = (ycoord - y0)**2
+                    xnew = min(max(xcoord, min(x0,x1)), max(x0,x1))
+                    ynew = y0
+                else:
+                    # Projection onto the edge, clamped to its end points
+                    t = ( (x1-x0)*(xcoord-x0) + (y1-y0)*(ycoord-y0) ) / ( (x1-x0)**2 + (y1-y0)**2 )
+                    t = min(max(t, 0), 1)
+                    xnew = x0 + (x1-x0)*t
+                    ynew = y0 + (y1-y0)*t
+                    error = (xcoord - xnew)**2 + (ycoord - ynew)**2
+                attachments.append((iedge, error, xnew, ynew))
+        return attachments
+
+    coordinates = np.fromiter(itertools.chain.from_iterable(edge[2:] for edge in edges), float, 4*len(edges))
+    x0, y0, x1, y1 = coordinates.reshape(-1, 4).T
+    xmin, xmax = np.minimum(x0, x1), np.maximum(x0, x1)
+    ymin, ymax = np.minimum(y0, y1), np.maximum(y0, y1)
+    iedges = np.flatnonzero((xmin - xmargin <= xcoord) & (xcoord <= xmax + xmargin) &
+                            (ymin - ymargin <= ycoord) & (ycoord <= ymax + ymargin))
+    x0, y0, x1, y1 = x0[iedges], y0[iedges], x1[iedges], y1[iedges]
+    xmin, xmax, ymin, ymax = xmin[iedges], xmax[iedges], ymin[iedges], ymax[iedges]
+    vertical = x0 == x1
+    horizontal = (y0 == y1) & ~vertical
+    diagonal = ~(vertical | horizontal)
+
+    # Vertical and horizontal edges, clamped like in the scalar code so the
+    # attachment points are exactly the same
+    xnew = np.where(vertical, x0, np.clip(xcoord, xmin, xmax))
+    ynew = np.where(horizontal, y0, np.clip(ycoord, ymin, ymax))
+    error = np.where(vertical, (xcoord - x0)**2, (ycoord - y0)**2)
+
+    # Diagonal edges, projected onto the edge and clamped to its end points
+    dx, dy = x1[diagonal] - x0[diagonal], y1[diagonal] - y0[diagonal]
+    t = ( dx*(xcoord - x0[diagonal]) + dy*(ycoord - y0[diagonal]) ) / ( dx**2 + dy**2 )
+    t = np.clip(t, 0, 1)
+    xnew[diagonal] = x0[diagonal] + dx*t
+    ynew[diagonal] = y0[diagonal] + dy*t
+    error[diagonal] = (xcoord - xnew[diagonal])**2 + (ycoord - ynew[diagonal])**2
+
+    return list(zip(iedges.tolist(), error.tolist(), xnew.tolist(), ynew.tolist()))
+
+
+class LazyPolygons():
+    # Internal use only.
+
+    # The polygon records of the NUM statement of a lazily read project, kept
+    # as the raw text of the project file. The records are decoded into
+    # Polygon instances the first time the polygons of any technology layer
+    # are accessed. Until then printProject copies the text verbatim.
+
+    def __init__(self, text, npoly, geo, arrays=False):
+        self.text = text
+        self.npoly = npoly
+        self.geo = geo
+        # Store the vertices in an array (see readPolygons)
+        self.arrays = arrays
+
+    def decode(self):
+        if self.text == None:
+            return
+        lines = self.text.splitlines(True)
+        self.text = None
+        self.geo.lazypolygons = None
+        for dlayer in self.geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                if tlayer.lazypolygons is self:
+                    tlayer.lazypolygons = None
+        polygons, index = readPolygons(lines, 0, self.npoly, self.arrays)
+        assignPolygons(self.geo.dlayers, polygons)
+
+    def levels(self, debugids):
+        # Yields the (ilevel, debugid) of the polygons with the given debugids
+        # in the order of the NUM statement, without decoding the polygons.
+        # Only the start of the first line of each record is matched.
+        header = re.compile(r"\n(-?\d+) \d+ -?\d+ \S+ ({:s}) ".format("|".join(str(debugid) for debugid in debugids)))
+        firstLine = self.text[:self.text.find("\n")]
+        for match in [header.match("\n" + firstLine)] + list(header.finditer(self.text)):
+            if match != None:
+                yield int(match.group(1)), int(match.group(2))
+
+
+class ProjectReader():
+    # Internal use only.
+
+    # Reads the lines of a Sonnet project file into a Project instance. Each
+    # line is tokenized once, and block and statement keywords are looked up
+    # in the dispatch tables below instead of being tested one by one.
+
+    def __init__(self, lines, exception=Exception, lazy=False, processes=1, arrays=False):
+        self.lines = lines
+        self.index = 0
+        self.exception = exception
+        # Keep the NUM statement undecoded (see LazyPolygons)
+        self.lazy = lazy
+        # Number of processes reading large NUM statements (see
+        # readPolygonsParallel)
+        self.processes = processes
+        # Store the vertices in arrays (see readPolygons)
+        self.arrays = arrays
+        self.project = None
+        # Ports are assigned to a dlayer once their polygon has been read
+        self.ports = []
+
+        # Blocks of the project file (the line starting the block)
+        self.blocks = {
+            "HEADER\n": self.readHeader,
+            "DIM\n": self.readDim,
+            "GEO\n": self.readGeo,
+            "CONTROL\n": self.readControl,
+            "FREQ\n": self.readFreq,
+            "OPT\n": self.readOpt,
+            "VARSWP\n": self.readVarswp,
+            "FILEOUT\n": self.readFileout,
+            "SUBDIV\n": self.readSubdiv,
+            "QSG\n": self.readQsg,
+        }
+
+        # Statements of the GEO block
+        self.geoStatements = {
+            "TMET": self.readTmet,
+            "BMET": self.readBmet,
+            "MET": self.readMet,
+            "BRI": self.readBrick,
+            "BRA": self.readBrick,
+            "BOX": self.readBox,
+            "TECHLAY": self.readTechlay,
+            "VALVAR": self.readValvar,
+            "LORGN": self.readLorgn,
+            "POR1": self.readPort,
+            "SMD": self.readComponent,
+            "NUM": self.readNum,
+        }
+
+        # Statements of the CONTROL block
+        self.controlStatements = {"EDGECHECK": self.readEdgecheck}
+        for keyword in CONTROL_SWEEPS:
+            self.controlStatements[keyword] = self.readControlSweep
+        for keyword in CONTROL_VALUES:
+            self.controlStatements[keyword] = self.readControlValue
+        for keyword in CONTROL_SWITCHES:
+            self.controlStatements[keyword] = self.readControlSwitch
+
+        # Statements of the FREQ block
+        self.freqStatements = {
+            "SIMPLE": self.readFreqSweep,
+            "ABS": self.readFreqSweep,
+        }
+
+        # Statements of the VARSWP block
+        self.varswpStatements = {
+            "SWEEP": self.readPsweep,
+            "ABS_ENTRY": self.readPsweep,
+        }
+
+        # Statements of the FILEOUT block
+        self.fileoutStatements = {"FOLDER": self.readFolder}
+        for keyword in FILEOUT_TYPES:
+            self.fileoutStatements[keyword] = self.readResponse
+
+    def nextLine(self):
+        # Returns the current line and moves on to the next one
+        if self.index >= len(self.lines):
+            raise self.exception("Unexpected end of Sonnet project file.")
+        line = self.lines[self.index]
+        self.index += 1
+        return line
+
+    def readLines(self, end):
+        # Returns all lines up to (but not including) the line end, and moves
+        # on to the line after end
+        try:
+            stop = self.lines.index(end, self.index)
+        except ValueError:
+            raise self.exception("Sonnet project file is missing {:s}".format(end.strip()))
+        lines = self.lines[self.index:stop]
+        self.index = stop + 1
+        return lines
+
+    def readStatements(self, end, statements, block):
+        # Dispatches every statement up to the line end to its reader.
+        # Statements without a reader are skipped.
+        while True:
+            line = self.nextLine()
+            if line == end:
+                return
+            params = line.split()
+            if params:
+                reader = statements.get(params[0])
+                if reader != None:
+                    reader(params, block)
+
+    def read(self):
+        project = Project()
+        self.project = project
+
+        # Save all lines before HEADER block
+        preheader = Preheader()
+        project.preheader = preheader
+        try:
+            start = self.lines.index("HEADER\n")
+        except ValueError:
+            raise self.exception("Sonnet project file is missing HEADER")
+        preheader.lines = self.lines[:start]
+        self.index = start
+
+        while self.index < len(self.lines):
+            line = self.nextLine()
+            reader = self.blocks.get(line)
+            if reader != None:
+                reader()
+            elif line.split()[:1] == ["END"]:
+                # Reached the end of a block
+                pass
+            else:
+                print("Warning: Ignoring unknown line: {:s}".format(line))
+
+        return project
+
+    ########################################################################
+    # BLOCKS                                                               #
+    ########################################################################
+
+    def readHeader(self):
+        header = Header()
+        header.lines = self.readLines("END HEADER\n")
+        self.project.header = header
+
+    def readDim(self):
+        dim = Dim()
+        dim.lines = self.readLines("END DIM\n")
+        self.project.dim = dim
+
+    def readGeo(self):
+        geo = Geo()
+        self.project.geo = geo
+        self.ports = []
+        self.readStatements("END GEO\n", self.geoStatements, geo)
+
+    def readControl(self):
+        control = Control()
+        self.project.control = control
+        self.readStatements("END CONTROL\n", self.controlStatements, control)
+
+    def readFreq(self):
+        freq = Freq()
+        self.project.freq = freq
+        self.readStatements("END FREQ\n", self.freqStatements, freq)
+
+    def readOpt(self):
+        opt = Opt()
+        opt.lines = self.readLines("END OPT\n")
+        self.project.opt = opt
+
+    def readVarswp(self):
+        varswp = Varswp()
+        self.project.varswp = varswp
+        self.readStatements("END VARSWP\n", self.varswpStatements, varswp)
+
+    def readFileout(self):
+        fileout = Fileout()
+        self.project.fileout = fileout
+        self.readStatements("END FILEOUT\n", self.fileoutStatements, fileout)
+
+    def readSubdiv(self):
+        subdiv = Subdiv()
+        subdiv.lines = self.readLines("END SUBDIV\n")
+        self.project.subdiv = subdiv
+
+    def readQsg(self):
+        # The QSG block is usually the last one, so it may lack a newline
+        qsg = Qsg()
+        self.project.qsg = qsg
+        while self.index < len(self.lines):
+            line = self.nextLine()
+            if line in ["END QSG", "END QSG\n"]:
+                return
+            qsg.lines.append(line)
+
+    ########################################################################
+    # GEO STATEMENTS                                                       #
+    ########################################################################
+
+    def readMetal(self, metal, params):
+        metal.name = params[1] # assume no spaces
+        metal.patternid = int(params[2])
+        metal.type = params[3]
+        metal.values = [float(value) for value in params[4:]]
+        return metal
+
+    def readTmet(self, params, geo):
+        geo.tmet = self.readMetal(Tmet(), params)
+
+    def readBmet(self, params, geo):
+        geo.bmet = self.readMetal(Bmet(), params)
+
+    def readMet(self, params, geo):
+        geo.met = self.readMetal(Met(), params)
+
+    def readBrick(self, params, geo):
+        # BRI is an isotropic and BRA an anisotropic brick material
+        bri = Brick()
+        bri.name = params[1] # assume no spaces
+        bri.patternid = int(params[2])
+        bri.isIsotropic = params[0] == "BRI"
+        bri.values = [float(value) for value in params[3:]]
+        geo.bricks.append(bri)
+
+    def readBox(self, params, geo):
+        box = Box()
+        box.nlev = int(params[1])
+        box.xwidth = float(params[2])
+        box.ywidth = float(params[3])
+        box.xcells2 = float(params[4])
+        box.ycells2 = float(params[5])
+        box.nsubs = int(params[6])
+        box.eeff = float(params[7])
+        geo.box = box
+        # The dielectric layers follow on indented lines
+        layerIndex = 0
+        while self.lines[self.index][0] == " ":
+            params = self.nextLine().split()
+            dlayer = Dlayer()
+            dlayer.ilevel = layerIndex
+            dlayer.thickness = float(params[0])
+            dlayer.erel = float(params[1])
+            dlayer.mrel = float(params[2])
+            dlayer.eloss = float(params[3])
+            dlayer.mloss = float(params[4])
+            dlayer.esignma = float(params[5])
+            dlayer.nzpart = int(params[6])
+            dlayer.name = " ".join(params[7:]).replace('"','')
+            geo.dlayers.append(dlayer)
+            layerIndex += 1
+
+    def readTechlay(self, params, geo):
+        # Initialize technology layer and add it to dlayer
+        tlayer = Tlayer()
+        tlayer.lay_type = params[1]
+        tlayer.lay_name = params[2]
+        tlayer.dxf_layer = params[3]
+        tlayer.gds_stream = int(params[4])
+        tlayer.gds_object = int(params[5])
+        params = self.nextLine().split()
+        if len(params) != 13:
+            tlayer.type = " ".join(params)
+            params = self.nextLine().split()
+        else:
+            tlayer.type = "MET POL"
+        tlayer.ilevel = int(params[0])
+        tlayer.nvertices = int(params[1])
+        tlayer.mtype = int(params[2])
+        tlayer.filltype = params[3]
+        tlayer.debugid = int(params[4])
+        tlayer.xmin = int(params[5])
+        tlayer.ymin = int(params[6])
+        tlayer.xmax = int(params[7])
+        tlayer.ymax = int(params[8])
+        tlayer.conmax = int(params[9])
+        tlayer.res1 = int(params[10])
+        tlayer.res2 = int(params[11])
+        tlayer.edgemesh = params[12]
+        params = self.lines[self.index].split()
+        if params and params[0] == "TOLEVEL":
+            tlayer.to_level = int(params[1])
+            tlayer.meshingfill = params[2]
+            tlayer.pads = params[3]
+            self.index += 1
+        while self.lines[self.index] == "END\n":
+            self.index += 1
+        geo.dlayers[tlayer.ilevel].tlayers.append(tlayer)
+
+    def readValvar(self, params, geo):
+        valvar = Valvar()
+        valvar.varname = params[1]
+        valvar.unittype = params[2]
+        valvar.value = float(params[3])
+        valvar.description = params[4].replace('"','')
+        geo.valvars.append(valvar)
+
+    def readLorgn(self, params, geo):
+        lorgn = Lorgn()
+        lorgn.x = float(params[1])
+        lorgn.y = float(params[2])
+        lorgn.locked = params[3]
+        geo.lorgn = lorgn
+
+    def readPort(self, params, geo):
+        port = Port()
+        port.type = params[1]
+        port.ipolygon = int(self.nextLine().split()[1])
+        port.ivertex = int(self.nextLine().split()[0])
+        params = self.nextLine().split()
+        port.portnum = int(params[0])
+        port.resist = float(params[1])
+        port.react = float(params[2])
+        port.induct = float(params[3])
+        port.capac = float(params[4])
+        port.xcoord = float(params[5])
+        port.ycoord = float(params[6])
+        # We can not yet assign port to dlayer because its location is hidden
+        # in ipolygon, so for now we save port in a list of ports
+        self.ports.append(port)
+
+    def readComponent(self, params, geo):
+        component = Component()
+        component.levelnum = int(params[1])
+        component.label = params[2].replace('"','')
+        component.objectid = int(self.nextLine().split()[1])
+        component.gndref = self.nextLine().split()[1]
+        component.twtype = self.nextLine().split()[1]
+        sbox = self.nextLine().split()
+        component.leftpos = float(sbox[1])
+        component.rightpos = float(sbox[2])
+        component.toppos = float(sbox[3])
+        component.bottompos = float(sbox[4])
+        component.pbshw = self.nextLine().split()[1]
+        lpos = self.nextLine().split()
+        component.xpos = float(lpos[1])
+        component.ypos = float(lpos[2])
+        typeideal = self.nextLine().split()
+        component.idealtype = typeideal[2]
+        compval = typeideal[3]
+        # If compval is in quotes, it is a variable parameter
+        if compval[0] == '"' and compval[-1] == '"':
+            component.compval = compval.replace('"','')
+        # Otherwise it is a float value
+        else:
+            component.compval = float(compval)
+        smdp1 = self.nextLine().split()
+        component.smdp1_levelnum = int(smdp1[1])
+        component.smdp1_x = float(smdp1[2])
+        component.smdp1_y = float(smdp1[3])
+        component.smdp1_orientation = smdp1[4]
+        component.smdp1_portnum = int(smdp1[5])
+        component.smdp1_pinnum = int(smdp1[6])
+        smdp2 = self.nextLine().split()
+        component.smdp2_levelnum = int(smdp2[1])
+        component.smdp2_x = float(smdp2[2])
+        component.smdp2_y = float(smdp2[3])
+        component.smdp2_orientation = smdp2[4]
+        component.smdp2_portnum = int(smdp2[5])
+        component.smdp2_pinnum = int(smdp2[6])
+        # Skip the END of the SMD statement
+        self.nextLine()
+        geo.dlayers[component.levelnum].components.append(component)
+
+    def readNum(self, params, geo):
+        # Associate polygons with technology layers and ports with dlayers.
+        # The ports are looked up in a dictionary built once per file.
+        geo.npoly = int(params[1])
+
+        # Ports by the debugid of the polygon they are attached to
+        portsByPolygon = {}
+        for port in self.ports:
+            portsByPolygon.setdefault(port.ipolygon, []).append(port)
+
+        if self.lazy:
+            # The NUM statement is the last one in the GEO block
+            try:
+                end = self.lines.index("END GEO\n", self.index)
+            except ValueError:
+                raise self.exception("Sonnet project file is missing END GEO")
+            lazypolygons = LazyPolygons("".join(self.lines[self.index:end]), geo.npoly, geo, self.arrays)
+            # Only the ilevel of the polygons is needed to place the ports
+            levels = []
+            if portsByPolygon:
+                levels = list(lazypolygons.levels(portsByPolygon))
+            if set(debugid for ilevel, debugid in levels) == set(portsByPolygon):
+                for ilevel, debugid in levels:
+                    for port in portsByPolygon[debugid]:
+                        geo.dlayers[ilevel].ports.append(port)
+                geo.lazypolygons = lazypolygons
+                for dlayer in geo.dlayers:
+                    for tlayer in dlayer.tlayers:
+                        tlayer.lazypolygons = lazypolygons
+                self.index = end
+                return
+            # Some polygon records are not formatted the way Sonnet writes
+            # them, so we fall back to decoding all polygons
+
+        if self.processes > 1 and geo.npoly >= PARALLEL_THRESHOLD:
+            polygons, self.index = readPolygonsParallel(self.lines, self.index, geo.npoly, self.processes, self.exception, self.arrays)
+        else:
+            polygons, self.index = readPolygons(self.lines, self.index, geo.npoly, self.arrays)
+        assignPolygons(geo.dlayers, polygons)
+        for polygon in polygons:
+            # Assign port to layer if the current polygon's debugid matches
+            # that of a port's ipolygon
+            for port in portsByPolygon.get(polygon.debugid, ()):
+                geo.dlayers[polygon.ilevel].ports.append(port)
+
+    ########################################################################
+    # CONTROL STATEMENTS                                                   #
+    ########################################################################
+
+    def readControlSweep(self, params, control):
+        control.sweep = params[0]
+
+    def readControlValue(self, params, control):
+        name, convert = CONTROL_VALUES[params[0]]
+        setattr(control, name, convert(params[1]))
+
+    def readControlSwitch(self, params, control):
+        name, valuename, convert = CONTROL_SWITCHES[params[0]]
+        setattr(control, name, params[1]) # "Y" or "N"
+        if params[1] == "Y":
+            setattr(control, valuename, convert(params[2]))
+
+    def readEdgecheck(self, params, control):
+        control.edgecheck = params[1] # "Y" or "N"
+        if params[1] == "Y":
+            control.edgecheck_numlevels = int(params[2])
+        if params[-1] == "TECHLAY":
+            control.edgecheck_checktype = params[-1]
+
+    ########################################################################
+    # FREQ STATEMENTS                                                      #
+    ########################################################################
+
+    def readFreqSweep(self, params, freq):
+        # SIMPLE is a linear and ABS an adaptive frequency sweep
+        freq.sweep = params[0]
+        freq.f1 = float(params[1])
+        freq.f2 = float(params[2])
+        if params[0] == "SIMPLE":
+            freq.fstep = float(params[3])
+
+    ########################################################################
+    # VARSWP STATEMENTS                                                    #
+    ########################################################################
+
+    def readPsweep(self, params, varswp):
+        # SWEEP is a linear and ABS_ENTRY an adaptive frequency sweep
+        psweep = Psweep()
+        psweep.sweeptype = params[0]
+        psweep.f1 = float(params[1])
+        psweep.f2 = float(params[2])
+        if params[0] == "SWEEP":
+            psweep.fstep = float(params[3])
+        params = self.lines[self.index].split()
+        while params and params[0] == "VAR":
+            var = Var()
+            var.parameter = params[1]
+            var.ytype = params[2]
+            var.min = float(params[3])
+            var.max = float(params[4])
+            var.step = float(params[5])
+            psweep.vars.append(var)
+            self.index += 1
+            params = self.lines[self.index].split()
+        varswp.psweeps.append(psweep)
+
+    ########################################################################
+    # FILEOUT STATEMENTS                                                   #
+    ########################################################################
+
+    def readResponse(self, params, fileout):
+        fileout.filetype = params[0]
+        fileout.embed = params[1]
+        fileout.abs_inc = params[2]
+        fileout.filename = params[3]
+        fileout.comments = params[4]
+        fileout.sig = int(params[5])
+        fileout.partype = params[6]
+        fileout.parform = params[7]
+        fileout.ports = " ".join(params[8:])
+
+    def readFolder(self, params, fileout):
+        fileout.folder = params[1]
+
+
+def formatNumber(value):
+    # Internal use only.
+
+    # Same as "{:n}".format(value) (Sonnet project files are always written
+    # in the C locale), but floats are formatted with %g, which is several
+    # times faster and gives the same result
+    if type(value) == float:
+        return "%g" % value
+    return "{:n}".format(value)
+
+
+# A polygon record up to the TLAYNAM line. Integers from 1e6 up are formatted
+# differently by %g and {:n}, see ProjectWriter.writePolygon
+POLYGON_HEADER = "%s\n%s %s %s %s %s %g %g %g %g %g %g %g %s\n"
+
+
+class ProjectWriter():
+    # Internal use only.
+
+    # Writes a Project instance in the format of a Sonnet project file. The
+    # text is collected in self.text as a list of chunks, which are joined and
+    # written at once by printProject, and the vertices of every polygon are
+    # formatted in a single operation.
+
+    def __init__(self, project, exception=Exception):
+        self.project = project
+        self.exception = exception
+        self.text = []
+
+    def write(self):
+        # Returns the project as a string
+        project = self.project
+        text = self.text
+
+        # Write every line before the HEADER block
+        text += project.preheader.lines
+
+        if project.header == None:
+            raise self.exception("HEADER block not initialized.")
+        self.writeLines("HEADER", project.header.lines)
+
+        if project.dim == None:
+            raise self.exception("DIM block not initialized.")
+        self.writeLines("DIM", project.dim.lines)
+
+        if project.geo == None:
+            raise self.exception("GEO block not initialized.")
+        self.writeGeo(project.geo)
+
+        if project.control != None:
+            self.writeControl(project.control)
+        if project.freq != None:
+            self.writeFreq(project.freq)
+        if project.opt != None:
+            self.writeLines("OPT", project.opt.lines)
+        if project.varswp != None:
+            self.writeVarswp(project.varswp)
+        if project.fileout != None:
+            self.writeFileout(project.fileout)
+        if project.subdiv != None:
+            self.writeLines("SUBDIV", project.subdiv.lines)
+        if project.qsg != None:
+            self.writeLines("QSG", project.qsg.lines)
+            # Sonnet writes no newline at the end of the file
+            text[-1] = "END QSG"
+
+        return "".join(text)
+
+    def writeLines(self, block, lines):
+        # Blocks that are stored as lines
+        self.text.append(block + "\n")
+        self.text += lines
+        self.text.append("END " + block + "\n")
+
+    def writeMetal(self, keyword, metal):
+        # TMET, BMET and MET statements
+        values = "".join([formatNumber(value) + " " for value in metal.values])
+        self.text.append("{:s} {} {} {} {:s}\n".format(keyword, metal.name, metal.patternid, metal.type, values))
+
+    ########################################################################
+    # GEO BLOCK                                                            #
+    ########################################################################
+
+    def writeGeo(self, geo):
+        text = self.text
+        text.append("GEO\n")
+
+        if geo.tmet != None:
+            self.writeMetal("TMET", geo.tmet)
+        if geo.bmet != None:
+            self.writeMetal("BMET", geo.bmet)
+        if geo.met != None:
+            self.writeMetal("MET", geo.met)
+
+        for brick in geo.bricks:
+            keyword = "BRI" if brick.isIsotropic else "BRA"
+            values = "".join([formatNumber(value) + " " for value in brick.values])
+            text.append("{:s} \"{}\" {} {:s}\n".format(keyword, brick.name, brick.patternid, values))
+
+        box = geo.box
+        if box == None:
+            raise self.exception("BOX not initialized.")
+        text.append("BOX {} {:n} {:n} {:n} {:n} {} {:n}\n".format(box.nlev, box.xwidth, box.ywidth, box.xcells2, box.ycells2, box.nsubs, box.eeff))
+
+        for dlayer in geo.dlayers:
+            text.append("      {:n} {:n} {:n} {:n} {:n} {:n} {} \"{}\"\n".format(dlayer.thickness, dlayer.erel, dlayer.mrel, dlayer.eloss, dlayer.mloss, dlayer.esignma, dlayer.nzpart, dlayer.name))
+
+        for dlayer in geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                self.writeTechlay(tlayer)
+
+        for valvar in geo.valvars:
+            text.append("VALVAR {} {} {:n} \"{}\"\n".format(valvar.varname, valvar.unittype, valvar.value, valvar.description))
+
+        lorgn = geo.lorgn
+        if lorgn != None:
+            text.append("LORGN {:n} {:n} {}\n".format(lorgn.x, lorgn.y, lorgn.locked))
+
+        for dlayer in geo.dlayers:
+            for port in dlayer.ports:
+                text.append("POR1 {}\nPOLY {} 1\n{}\n{} {:n} {:n} {:n} {:n} {:n} {:n}\n".format(port.type, port.ipolygon, port.ivertex, port.portnum, port.resist, port.react, port.induct, port.capac, port.xcoord, port.ycoord))
+
+        for dlayer in geo.dlayers:
+            for component in dlayer.components:
+                self.writeComponent(component)
+
+        text.append("NUM {}\n".format(geo.npoly))
+
+        # Polygons of a lazily read project that have not been decoded are
+        # copied verbatim
+        if geo.lazypolygons != None:
+            text.append(geo.lazypolygons.text)
+        else:
+            for dlayer in geo.dlayers:
+                for tlayer in dlayer.tlayers:
+                    text.append(self.writePolygons(tlayer))
+
+        text.append("END GEO\n")
+
+    def writeTechlay(self, tlayer):
+        text = self.text
+        text.append("TECHLAY {} {} {} {} {}\n".format(tlayer.lay_type, tlayer.lay_name, tlayer.dxf_layer, tlayer.gds_stream, tlayer.gds_object))
+        if tlayer.type != "MET POL":
+            text.append("{}\n".format(tlayer.type))
+        text.append("{} {} {} {} {} {:n} {:n} {:n} {:n} {:n} {:n} {:n} {}\n".format(tlayer.ilevel, tlayer.nvertices, tlayer.mtype, tlayer.filltype, tlayer.debugid, tlayer.xmin, tlayer.ymin, tlayer.xmax, tlayer.ymax, tlayer.conmax, tlayer.res1, tlayer.res2, tlayer.edgemesh))
+        if tlayer.lay_type == "VIA":
+            text.append("TOLEVEL {} {} {}\n".format(tlayer.to_level, tlayer.meshingfill, tlayer.pads))
+        text.append("END\nEND\n")
+
+    def writeComponent(self, component):
+        text = self.text
+        text.append("SMD {} \"{}\"\nID {}\nGNDREF {}\nTWTYPE {}\n".format(component.levelnum, component.label, component.objectid, component.gndref, component.twtype))
+        text.append("SBOX {:n} {:n} {:n} {:n}\nPBSHW {}\nLPOS {:n} {:n}\n".format(component.leftpos, component.rightpos, component.toppos, component.bottompos, component.pbshw, component.xpos, component.ypos))
+        # Write compval either as a variable parameter or float
+        if type(component.compval) == str:
+            text.append("TYPE IDEAL {} \"{}\"\n".format(component.idealtype, component.compval))
+        else:
+            text.append("TYPE IDEAL {} {:n}\n".format(component.idealtype, component.compval))
+        text.append("SMDP {} {:n} {:n} {} {} {}\n".format(component.smdp1_levelnum, component.smdp1_x, component.smdp1_y, component.smdp1_orientation, component.smdp1_portnum, component.smdp1_pinnum))
+        text.append("SMDP {} {:n} {:n} {} {} {}\n".format(component.smdp2_levelnum, component.smdp2_x, component.smdp2_y, component.smdp2_orientation, component.smdp2_portnum, component.smdp2_pinnum))
+        text.append("END\n")
+
+    def writePolygons(self, tlayer):
+        # Returns the records of the polygons of tlayer. The records are
+        # cached in tlayer.polygontext together with the tlayer parameters
+        # copied into them, and reused until the polygons change (see
+        # Tlayer.markChanged).
+        tlayer.checkCaches()
+        key = (tlayer.ilevel, tlayer.to_level, tlayer.lay_type)
+        if tlayer.polygontext != None and tlayer.polygontext[0] == key:
+            return tlayer.polygontext[1]
+
+        via = tlayer.lay_type == "VIA"
+        records = []
+        for polygon in tlayer.getPolygons():
+            # Make sure the ilevel and to_level reflects that of tlayer
+            polygon.ilevel = tlayer.ilevel
+            polygon.to_level = tlayer.to_level
+            records.append(self.writePolygon(polygon, via))
+        text = "".join(records)
+        tlayer.polygontext = (key, text)
+        return text
+
+    def writePolygon(self, polygon, via):
+        # Returns the record of polygon. The numbers are formatted with %
+        # rather than str.format, and all vertices with a single format string.
+        try:
+            record = POLYGON_HEADER % (polygon.type, polygon.ilevel, polygon.nvertices, polygon.mtype, polygon.filltype, polygon.debugid, polygon.xmin, polygon.ymin, polygon.xmax, polygon.ymax, polygon.conmax, polygon.res1, polygon.res2, polygon.edgemesh)
+            if via:
+                record += "TOLEVEL %s %s %s\n" % (polygon.to_level, polygon.meshingfill, polygon.pads)
+            vertices = polygon.vertices
+            record += "TLAYNAM Stream%s:%s %s\n" % (polygon.gds_stream, polygon.gds_object, polygon.inherit)
+            if np != None and type(vertices) == np.ndarray:
+                coordinates = tuple(vertices.ravel().tolist())
+            else:
+                coordinates = tuple(itertools.chain.from_iterable(vertices))
+            record += "%g %g\n"*len(vertices) % coordinates
+        except TypeError:
+            # E.g. vertices given with more than two coordinates
+            return self.writePolygonExactly(polygon, via)
+        # %g writes integers from 1e6 up in exponent notation but {:n} does
+        # not, so those records are formatted again
+        if "e+" in record:
+            return self.writePolygonExactly(polygon, via)
+        return record + "END\n"
+
+    def writePolygonExactly(self, polygon, via):
+        # Returns the record of polygon, formatted number by number
+        record = ["{}\n".format(polygon.type)]
+        record.append("{} {} {} {} {} {:n} {:n} {:n} {:n} {:n} {:n} {:n} {}\n".format(polygon.ilevel, polygon.nvertices, polygon.mtype, polygon.filltype, polygon.debugid, polygon.xmin, polygon.ymin, polygon.xmax, polygon.ymax, polygon.conmax, polygon.res1, polygon.res2, polygon.edgemesh))
+        if via:
+            record.append("TOLEVEL {} {} {}\n".format(polygon.to_level, polygon.meshingfill, polygon.pads))
+        record.append("TLAYNAM Stream{}:{} {}\n".format(polygon.gds_stream, polygon.gds_object, polygon.inherit))
+        for vertex in polygon.vertices:
+            record.append("{} {}\n".format(formatNumber(vertex[0]), formatNumber(vertex[1])))
+        record.append("END\n")
+        return "".join(record)
+
+    ########################################################################
+    # CONTROL, FREQ, VARSWP AND FILEOUT BLOCKS                             #
+    ########################################################################
+
+    def writeControl(self, control):
+        text = self.text
+        text.append("CONTROL\n")
+
+        if control.sweep != None:
+            text.append("{}\n".format(control.sweep))
+
+        if control.options != None:
+            text.append("OPTIONS {}\n".format(control.options))
+
+        if control.subsplam != None:
+            text.append("SUBSPLAM {}".format(control.subsplam))
+            if control.subsplam_subslambda != None:
+                text.append(" {}".format(control.subsplam_subslambda))
+            text.append("\n")
+
+        if control.edgecheck != None:
+            text.append("EDGECHECK {}".format(control.edgecheck))
+            if control.edgecheck_numlevels != None:
+                text.append(" {}".format(control.edgecheck_numlevels))
+            if control.edgecheck_checktype != None:
+                text.append(" {}".format(control.edgecheck_checktype))
+            text.append("\n")
+
+        if control.cfmax != None:
+            text.append("CFMAX {}".format(control.cfmax))
+            if control.cfmax_subfreq != None:
+                text.append(" {:n}".format(control.cfmax_subfreq))
+            text.append("\n")
+
+        if control.cepsy != None:
+            text.append("CEPSY {}".format(control.cepsy))
+            if control.cepsy_epsilon != None:
+                text.append(" {:n}".format(control.cepsy_epsilon))
+            text.append("\n")
+
+        if control.filename != None:
+            text.append("FILENAME {}\n".format(control.filename))
+
+        if control.speed != None:
+            text.append("SPEED {}\n".format(control.speed))
+
+        if control.res_abs != None:
+            text.append("RES_ABS {}".format(control.res_abs))
+            if control.res_abs_resolution != None:
+                text.append(" {:n}".format(control.res_abs_resolution))
+            text.append("\n")
+
+        if control.cache_abs != None:
+            text.append("CACHE_ABS {}\n".format(control.cache_abs))
+
+        if control.targ_abs != None:
+            text.append("TARG_ABS {}\n".format(control.targ_abs))
+
+        if control.q_acc != None:
+            text.append("Q_ACC {}\n".format(control.q_acc))
+
+        if control.det_abs_res != None:
+            text.append("DET_ABS_RES {}\n".format(control.det_abs_res))
+
+        text.append("END CONTROL\n")
+
+    def writeFreq(self, freq):
+        text = self.text
+        text.append("FREQ\n")
+        if freq.sweep == "SIMPLE":
+            text.append("{} {:n} {:n} {:n}\n".format(freq.sweep, freq.f1, freq.f2, freq.fstep))
+        elif freq.sweep == "ABS":
+            text.append("{} {:n} {:n}\n".format(freq.sweep, freq.f1, freq.f2))
+        text.append("END FREQ\n")
+
+    def writeVarswp(self, varswp):
+        text = self.text
+        text.append("VARSWP\n")
+        for psweep in varswp.psweeps:
+            text.append("{} {:n} {:n}".format(psweep.sweeptype, psweep.f1, psweep.f2))
+            if psweep.sweeptype == "SWEEP":
+                text.append(" {:n}".format(psweep.fstep))
+            text.append("\n")
+            for var in psweep.vars:
+                text.append("VAR {} {} {:n} {:n} {:n}\n".format(var.parameter, var.ytype, var.min, var.max, var.step))
+        text.append("END\n")
+        text.append("END VARSWP\n")
+
+    def writeFileout(self, fileout):
+        text = self.text
+        text.append("FILEOUT\n")
+        text.append("{} {} {} {} {} {} {} {} {}\n".format(fileout.filetype, fileout.embed, fileout.abs_inc, fileout.filename, fileout.comments, fileout.sig, fileout.partype, fileout.parform, fileout.ports))
+        if fileout.folder != None:
+            text.append("FOLDER {}\n".format(fileout.folder))
+        text.append("END FILEOUT\n")
+
+
+# Bump whenever the classes of the project change, so that stale caches
+# written by an older SonPy are ignored
+PROJECT_CACHE_VERSION = 6
+
+
+def projectCacheKey(filename, options):
+    # Internal use only.
+
+    # The key under which a project file read with the given options is
+    # cached. It changes whenever the project file is modified.
+    stat = os.stat(filename)
+    return (PROJECT_CACHE_VERSION, stat.st_size, stat.st_mtime_ns, options)
+
+
+def readProjectCache(filename, key):
+    # Internal use only.
+
+    # Returns the project cached for the project file filename if the cache
+    # exists and was written for key, and otherwise None. The cache holds the
+    # pickled key followed by the pickled project, so a stale cache is
+    # rejected without loading the project.
+    try:
+        with open(filename + ".cache", 'rb') as fd:
+            if pickle.load(fd) != key:
+                return None
+            # Unpickling creates as many objects as parsing does
+            with gcPaused():
+                return pickle.load(fd)
+    except Exception:
+        # Missing, truncated or incompatible caches are ignored
+        return None
+
+
+def writeProjectCache(filename, key, project):
+    # Internal use only.
+
+    # Caches the project parsed from the project file filename. The cache is
+    # written to a temporary file which then replaces the old cache, so a
+    # crash never leaves a truncated cache behind.
+    temporary = filename + ".cache.tmp"
+    try:
+        with open(temporary, 'wb') as fd:
+            pickle.dump(key, fd, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(project, fd, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, filename + ".cache")
+    except OSError:
+        # Caching is optional, e.g. the directory may be read-only
+        pass
+
+
+def writeIfChanged(filename, text):
+    # Internal use only.
+
+    # Writes text to the file filename unless the file already contains it.
+    # The text is written to a temporary file first, which then replaces the
+    # file in one step. Returns True if the file was written.
+    # Text files are compared as read without newline translation, so the
+    # newlines of text are translated the way writing them would.
+    if os.linesep != "\n":
+        content = text.replace("\n", os.linesep)
+    else:
+        content = text
+    try:
+        with open(filename, 'r', newline='') as fd:
+            # Reading one character more reveals a longer file
+            if fd.read(len(content) + 1) == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        # A missing or unreadable file is replaced
+        pass
+
+    temporary = filename + ".tmp"
+    with open(temporary, 'w') as fd:
+        fd.write(text)
+    os.replace(temporary, filename)
+    return True
+
+
+def linkFile(source, link):
+    # Internal use only.
+
+    # Makes link a hard link to source, replacing any existing file link.
+    # The file is copied where hard links are not supported (e.g. FAT file
+    # systems). An existing hard link to source is kept.
+    try:
+        if os.path.samefile(source, link):
+            return
+    except OSError:
+        pass
+    temporary = link + ".tmp"
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, link)
+
+
+class ResultCache():
+    """
+    Cache of simulation results on disk, see :func:`setResultCache`. Every entry holds the output files of one simulation and is found by a hash of the Sonnet project file, its name and the em command, so only simulations of exactly the same project are taken from the cache. The least recently used entries are removed when the cache grows beyond its size.
+
+    :param str directory: Directory of the cache. It is created if needed, and can be shared between projects, scripts and sessions.
+    :param float maxsize: Maximum size of the cache in MB.
+    """
+
+    # Technical description for developers:
+    # Every entry is a subdirectory named after the key (see key) with a
+    # copy of every output file. Entries are written to a temporary
+    # directory which is renamed in one step, so a crash never leaves a
+    # partial entry behind. The modification time of an entry directory is
+    # set on every hit and ordered by evict, so the order of use survives
+    # the session. The statistics only count this instance.
+
+    def __init__(self, directory, maxsize=1000):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename, args):
+        # Internal use only.
+
+        # Returns the key of the simulation of the project file filename with
+        # the command args. The project file name is part of the key, since
+        # the output files are named after it ($BASENAME).
+        digest = hashlib.sha256()
+        for arg in args:
+            digest.update(arg.encode() + b"\0")
+        digest.update(os.path.basename(filename).encode() + b"\0")
+        with open(filename, 'rb') as fd:
+            for block in iter(lambda: fd.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def restore(self, key, outputs):
+        # Internal use only.
+
+        # Copies the output files of the entry key to the paths outputs and
+        # returns True, or returns False if there is no such entry
+        entry = os.path.join(self.directory, key)
+        try:
+            for output in outputs:
+                shutil.copyfile(os.path.join(entry, os.path.basename(output)), output)
+            os.utime(entry)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, outputs):
+        # Internal use only.
+
+        # Adds the output files outputs as the entry key and evicts the least
+        # recently used entries if the cache has grown too large. Missing
+        # output files (em failed to write them) are not cached.
+        entry = os.path.join(self.directory, key)
+        temporary = "{:s}.tmp{:d}".format(entry, os.getpid())
+        try:
+            os.makedirs(temporary, exist_ok=True)
+            for output in outputs:
+                shutil.copyfile(output, os.path.join(temporary, os.path.basename(output)))
+            os.replace(temporary, entry)
+        except OSError:
+            # The entry exists already, or the outputs are missing
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+        self.stores += 1
+        self.evict()
+
+    def entries(self):
+        # Internal use only.
+
+        # Returns the entries as (time of last use, size in bytes, path)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or ".tmp" in entry.name:
+                continue
+            entrySize = sum(file.stat().st_size for file in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, entrySize, entry.path))
+        return entries
+
+    def evict(self):
+        # Internal use only.
+
+        # Removes the least recently used entries until the cache fits into
+        # maxsize
+        entries = sorted(self.entries())
+        size = sum(entrySize for mtime, entrySize, path in entries)
+        for mtime, entrySize, path in entries:
+            if size <= 1e6*self.maxsize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entrySize
+            self.evictions += 1
+
+    def getStatistics(self):
+        """
+        Returns the statistics of the cache as a dictionary with the number of ``hits``, ``misses``, ``stores`` and ``evictions`` since the cache was set, and the number of ``entries`` and the ``size`` in MB of the whole cache.
+        """
+        entries = self.entries()
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions,
+                "entries": len(entries), "size": sum(entrySize for mtime, entrySize, path in entries)/1e6}
+
+
+class VariantResult():
+    # Outcome of one variant run by runVariants
+    __slots__ = ("name", "sonnet_file", "data_file", "returncode", "output", "elapsed", "cached")
+
+    def __init__(self, name, sonnet_file, data_file):
+        self.name = name
+        self.sonnet_file = sonnet_file
+        self.data_file = data_file
+        self.returncode = None
+        self.output = ""
+        self.elapsed = 0
+        self.cached = False
+
+
+def runVariantProcess(args, result):
+    # Internal use only.
+
+    # Runs on the threads of runVariants. Starts one em process, waits for it
+    # and fills in result. The output is read while em runs, so em never
+    # blocks on a full pipe. Errors starting the process are left to the
+    # caller.
+    start = time.perf_counter()
+    process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    result.elapsed = time.perf_counter() - start
+    result.returncode = process.returncode
+    result.output = process.stdout.decode(errors="replace")
+    return result
+
+
+class ProgressEvent():
+    # Progress of a running em process, parsed from one line of its verbose
+    # output by parseProgressLine. kind is "frequency" (value in unit, e.g.
+    # GHz), "subsections" (number of subsections), "memory" (value in unit,
+    # e.g. MB), "time" (elapsed seconds) or "output" for any other line.
+    __slots__ = ("kind", "value", "unit", "line")
+
+    def __init__(self, kind, value=None, unit=None, line=""):
+        self.kind = kind
+        self.value = value
+        self.unit = unit
+        self.line = line
+
+    def __repr__(self):
+        return "ProgressEvent({!r}, {!r}, {!r})".format(self.kind, self.value, self.unit)
+
+
+NUMBER = r"([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)"
+
+# Patterns of the progress lines of em -v, tried in this order. Every
+# pattern captures the value and optionally its unit.
+PROGRESS_PATTERNS = [
+    ("frequency", re.compile(r"freq.*?" + NUMBER + r"\s*([kMGT]?Hz)\b", re.IGNORECASE)),
+    ("frequency", re.compile(r"freq\w*\W+" + NUMBER + r"()", re.IGNORECASE)),
+    ("subsections", re.compile(r"(\d+)\s+subsections|subsections\W+(\d+)", re.IGNORECASE)),
+    ("memory", re.compile(r"memory\D*?" + NUMBER + r"\s*([kMGT]?B)\b", re.IGNORECASE)),
+    ("time", re.compile(r"(?:elapsed|time)\D*?(\d+):(\d\d):(\d\d(?:\.\d*)?)|(?:elapsed|time)\D*?" + NUMBER + r"\s*(?:s|sec|seconds)\b", re.IGNORECASE)),
+]
+
+# Matches the lines which may match one of PROGRESS_PATTERNS, so most lines
+# are recognized as plain output with a single search
+PROGRESS_KEYWORDS = re.compile(r"freq|subsections|memory|elapsed|time", re.IGNORECASE)
+
+
+def parseProgressLine(line):
+    # Internal use only.
+
+    # Returns the ProgressEvent of one line of em output
+    line = line.rstrip("\r\n")
+    if PROGRESS_KEYWORDS.search(line) == None:
+        return ProgressEvent("output", None, None, line)
+    for kind, pattern in PROGRESS_PATTERNS:
+        match = pattern.search(line)
+        if match == None:
+            continue
+        if kind == "frequency":
+            return ProgressEvent(kind, float(match.group(1)), match.group(2) or None, line)
+        elif kind == "subsections":
+            return ProgressEvent(kind, int(match.group(1) or match.group(2)), None, line)
+        elif kind == "memory":
+            return ProgressEvent(kind, float(match.group(1)), match.group(2), line)
+        else:
+            if match.group(1) != None:
+                hours, minutes, seconds = match.group(1, 2, 3)
+                seconds = 3600*int(hours) + 60*int(minutes) + float(seconds)
+            else:
+                seconds = float(match.group(4))
+            return ProgressEvent(kind, seconds, "s", line)
+    return ProgressEvent("output", None, None, line)
+
+
+class ProgressReader(threading.Thread):
+    # Internal use only.
+
+    # Thread reading the output of a process line by line while it runs, so
+    # the process never blocks on a full pipe, and passing the ProgressEvent
+    # of every line to progress (if given). An exception raised by progress
+    # is kept in error for the waiting thread, and the output is read to the
+    # end regardless.
+
+    def __init__(self, stream, progress=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.stream = stream
+        self.progress = progress
+        self.error = None
+
+    def run(self):
+        for raw in iter(self.stream.readline, b""):
+            if self.progress != None and self.error == None:
+                try:
+                    self.progress(parseProgressLine(raw.decode(errors="replace")))
+                except Exception as error:
+                    self.error = error
+        self.stream.close()
+
+
+async def startProcessAsync(args):
+    # Internal use only.
+
+    # Starts a process for waitProcessAsync with its output in a pipe. The
+    # start is shielded from cancellation, since asyncio waits forever for a
+    # process whose start was cancelled (the pipes are never connected).
+    # Instead the process is killed once it has started.
+    start = asyncio.ensure_future(asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT))
+    try:
+        return await asyncio.shield(start)
+    except asyncio.CancelledError:
+        try:
+            process = await start
+        except OSError:
+            raise asyncio.CancelledError()
+        process.kill()
+        await process.communicate()
+        raise
+
+
+async def waitProcessAsync(process, timeout=None, progress=None):
+    # Internal use only.
+
+    # Coroutine version of waiting for a process, used by the asynchronous
+    # functions of sonnet. The output is read while the process runs, so it
+    # never blocks on a full pipe, and with progress it is read line by line
+    # and the ProgressEvent of every line is passed to progress. The process
+    # is killed when the waiting coroutine is cancelled or times out, or when
+    # progress raises, so no process outlives its task. A timeout raises the
+    # builtin TimeoutError, which asyncio.TimeoutError only is from Python
+    # 3.11 on. Returns the exit code and the output of the process.
+    async def communicate():
+        if progress == None:
+            output, _ = await process.communicate()
+            return output
+        lines = []
+        while True:
+            raw = await process.stdout.readline()
+            if raw == b"":
+                break
+            lines.append(raw)
+            progress(parseProgressLine(raw.decode(errors="replace")))
+        await process.wait()
+        return b"".join(lines)
+
+    try:
+        output = await asyncio.wait_for(communicate(), timeout)
+    except BaseException as error:
+        # Cancelled, timed out or failed in progress
+        if process.returncode == None:
+            process.kill()
+            await process.wait()
+        if isinstance(error, asyncio.TimeoutError):
+            raise TimeoutError("Process did not finish within {} s".format(timeout))
+        raise
+    return process.returncode, output.decode(errors="replace")
+
+
 class sonnet(object):
     """
     Basic class for all interactions between Sonnet and Python, and for storing the Sonnet project. Start your interactions with SonPy by creating an instance of this class, like so:
@@ -332,6 +2682,9 @@ class sonnet(object):
         self.data_file = self.sonnet_file[:-3] + "csv"
         self.data_file_path = self.sonnet_file_path
 
+        # Cache of simulation results (see setResultCache)
+        self.result_cache = None
+
         # Class containing the Sonnet project
         self.project = None
 
@@ -339,24 +2692,25 @@ class sonnet(object):
         self.em_process = None
         self.emstatus_process = None
         self.project = None
-	
+
     @staticmethod
     def normalize_path(path):
-	"""
-	Normalizes the path name depending on current OS.
-	
-	:param str path: Any give path
-	"""
-	path_obj = pathlib.Path(path)
+        """
+        Normalizes the path name depending on current OS.
+
+        :param str path: Any give path
+        """
+        path_obj = pathlib.Path(path)
         if not path_obj.is_dir():
             raise ValueError(f"Expected directory; got {path}")
-	
-	if OS == 'Linux':
+
+        if OS == 'Linux':
             return f"{path_obj}/"
-	elif OS == 'Windows':
-	    if path_obj[-1] != '\\':
-            	path_obj += '\\'
-	    return path_obj
+        elif OS == 'Windows':
+            path_str = str(path_obj)
+            if path_str[-1] != '\\':
+                path_str += '\\'
+            return path_str
 
     ########################################################################
     # SET FILEPATHS AND FILENAMES                                          #
@@ -454,18 +2808,11 @@ class sonnet(object):
         """
         self.gds_translator_options = "-i{:s}".format(filename)
 
-    def runGdsTranslator(self, silent=False):
-        """
-        Runs Sonnet's GDSII file to Sonnet project file translator. A Sonnet project file with the same name as the GDSII file is created in the same directory.
-
-        After the translation process has run, the following functions are called:
-
-        1. :func:`readProject()`: Reads the created Sonnet project file into SonPy.
-        2. :func:`collapseDlayers()`: Removes empty dielectric layers.
-        3. :func:`cropBox()`: Crops the bounding box to the edge of the circuit.
+    def gdsTranslatorArgs(self):
+        # Internal use only.
 
-        :param bool silent: Toggle wait message.
-        """
+        # Returns the command line of the gds translator for runGdsTranslator
+        # and runGdsTranslatorAsync, after checking that the gds file exists
 
         # Verify gds file exists
         file_found = 0
@@ -480,18 +2827,40 @@ class sonnet(object):
             raise self.exception("GDSII file not found! Check that directory and filename are correct")
 
         # Convert gds file to son file through Sonnet's gds.exe
-        args = ([self.executable_path + self.gds_translator_file, # command
+        return ([self.executable_path + self.gds_translator_file, # command
                  self.gds_translator_options, # options
                  self.gds_file_path + self.gds_file]) # file
 
+    def gdsTranslatorNotFound(self):
+        # Internal use only.
+
+        # Returns the exception raised when the gds translator cannot be
+        # started, after telling the user where it was looked for
+        print("Error! Cannot start process, use setSonnetInstallationPath(path) to point the class to the location of your gds.exe file")
+        print("Current path is {:s}".format(self.executable_path))
+        return self.exception("Cannot run gds executable file, file not found")
+
+    def runGdsTranslator(self, silent=False):
+        """
+        Runs Sonnet's GDSII file to Sonnet project file translator. A Sonnet project file with the same name as the GDSII file is created in the same directory.
+
+        After the translation process has run, the following functions are called:
+
+        1. :func:`readProject()`: Reads the created Sonnet project file into SonPy.
+        2. :func:`collapseDlayers()`: Removes empty dielectric layers.
+        3. :func:`cropBox()`: Crops the bounding box to the edge of the circuit.
+
+        :param bool silent: Toggle wait message.
+        """
+
+        args = self.gdsTranslatorArgs()
+
         try:
             # Run conversion process
             self.gds_process = subprocess.Popen(args, stdout=subprocess.PIPE)
 
         except:
-            print("Error! Cannot start process, use setSonnetInstallationPath(path) to point the class to the location of your gds.exe file")
-            print("Current path is {:s}".format(self.executable_path))
-            raise self.exception("Cannot run gds executable file, file not found")
+            raise self.gdsTranslatorNotFound()
 
         # Wait for the process to complete
         if silent == False:
@@ -503,560 +2872,112 @@ class sonnet(object):
         self.collapseDlayers()
         self.cropBox()
 
-    ########################################################################
-    # READ AND WRITE THE SONNET PROJECT FILE                               #
-    ########################################################################
-
-    def readProject(self):
-        """
-        Reads the Sonnet project file into SonPy. This function is run in :func:`runGdsTranslator` to ensure the created Sonnet project file is read into SonPy for further manipulation.
+    async def runGdsTranslatorAsync(self, timeout=None, silent=False):
         """
+        Coroutine version of :func:`runGdsTranslator` for use with asyncio (Python 3.9 or later). The translator runs without blocking the event loop, and reading and cropping the created project runs on a worker thread.
 
-        # Initialize Sonnet project
-        project = Project()
-        self.project = project
+        :param float timeout: Maximum time in seconds to wait for the translator. The translator is stopped and ``TimeoutError`` is raised when it takes longer. Default is no limit.
+        :param bool silent: Toggle wait message.
 
-        with open(self.sonnet_file_path + self.sonnet_file, 'r') as fd:
+        :returns: Exit code of the translator, which is 0 since a failed translation raises an exception.
 
-            line = fd.readline()
-            preheader = Preheader()
-            project.preheader = preheader
-            while line != "HEADER\n":
-                # Save all lines before HEADER block
-                preheader.lines.append(line)
-                line = fd.readline()
+        :Example:
+            >>> import asyncio
+            >>> asyncio.run(snt.runGdsTranslatorAsync(timeout=60))
+            0
 
-            while line != "":
-
-                if line == "HEADER\n":
-                    # Initialize HEADER block
-                    header = Header()
-                    project.header = header
-                    line = fd.readline()
-
-                    while line != "END HEADER\n":
-                        # Save all lines
-                        header.lines.append(line)
-                        line = fd.readline()
-
-                elif line == "DIM\n":
-                    # Initialize DIM block
-                    dim = Dim()
-                    project.dim = dim
-                    line = fd.readline()
-
-                    while line != "END DIM\n":
-                        # Save all lines
-                        dim.lines.append(line)
-                        line = fd.readline()
-
-                elif line == "GEO\n":
-                    # Initialize GEO block
-                    geo = Geo()
-                    dlayers = []
-                    valvars = []
-                    ports = []
-                    geo.dlayers = dlayers
-                    geo.valvars = valvars
-                    project.geo = geo
-                    line = fd.readline()
-
-                    while line != "END GEO\n":
-
-                        if line.split()[0] == "TMET":
-                            # Initialize top metal
-                            params = line.split()
-                            tmet = Tmet()
-                            tmet.name = params[1]  # assume no spaces
-                            tmet.patternid = int(params[2])
-                            tmet.type = params[3]
-                            tmet.values = []
-                            for params in params[4:]:
-                                tmet.values.append(float(params))
-                            geo.tmet = tmet
-                            line = fd.readline()
-
-                        elif line.split()[0] == "BMET":
-                            # Initialize bottom metal
-                            params = line.split()
-                            bmet = Bmet()
-                            bmet.name = params[1]  # assume no spaces
-                            bmet.patternid = int(params[2])
-                            bmet.type = params[3]
-                            bmet.values = []
-                            for params in params[4:]:
-                                bmet.values.append(float(params))
-                            geo.bmet = bmet
-                            line = fd.readline()
-
-                        elif line.split()[0] == "MET":
-                            # Initialize metal
-                            params = line.split()
-                            met = Met()
-                            met.name = params[1] # assume no spaces
-                            met.patternid = int(params[2])
-                            met.type = params[3]
-                            met.values = []
-                            for params in params[4:]:
-                                met.values.append(float(params))
-                            geo.met = met
-                            line = fd.readline()
-
-                        elif line.split()[0] == "BRI":
-                            # Initialize isotropic brick material
-                            params = line.split()
-                            bri = Brick()
-                            bri.name = params[1]  # assume no spaces
-                            bri.patternid = int(params[2])
-                            bri.isIsotropic = True
-                            bri.values = []
-                            for params in params[3:]:
-                                bri.values.append(float(params))
-                            geo.bricks.append(bri)
-                            line = fd.readline()
-
-                        elif line.split()[0] == "BRA":
-                            # Initialize anisotropic brick material
-                            params = line.split()
-                            bri = Brick()
-                            bri.name = params[1]  # assume no spaces
-                            bri.patternid = int(params[2])
-                            bri.isIsotropic = False
-                            bri.values = []
-                            for params in params[3:]:
-                                bri.values.append(float(params))
-                            geo.bricks.append(bri)
-                            line = fd.readline()
-
-                        elif line.split()[0] == "BOX":
-                            # Initialize BOX
-                            params = line.split()
-                            box = Box()
-                            box.nlev = int(params[1])
-                            box.xwidth = float(params[2])
-                            box.ywidth = float(params[3])
-                            box.xcells2 = float(params[4])
-                            box.ycells2 = float(params[5])
-                            box.nsubs = int(params[6])
-                            box.eeff = float(params[7])
-                            geo.box = box
-                            # Initialize dielectric layers
-                            layerIndex = 0
-                            line = fd.readline()
-                            while line[0] == " ":
-                                params = line.split()
-                                dlayer = Dlayer()
-                                dlayer.ilevel = layerIndex
-                                dlayer.thickness = float(params[0])
-                                dlayer.erel = float(params[1])
-                                dlayer.mrel = float(params[2])
-                                dlayer.eloss = float(params[3])
-                                dlayer.mloss = float(params[4])
-                                dlayer.esignma = float(params[5])
-                                dlayer.nzpart = int(params[6])
-                                dlayer.name = " ".join(params[7:]).replace('"','')
-                                dlayers.append(dlayer)
-                                layerIndex += 1
-                                line = fd.readline()
-
-                        elif line.split()[0] == "TECHLAY":
-                            # Initialize technology layer and add it to dlayer
-                            params = line.split()
-                            tlayer = Tlayer()
-                            tlayer.lay_type = params[1]
-                            tlayer.lay_name = params[2]
-                            tlayer.dxf_layer = params[3]
-                            tlayer.gds_stream = int(params[4])
-                            print(tlayer.gds_stream)
-                            tlayer.gds_object = int(params[5])
-                            params = fd.readline().split()
-                            if len(params) != 13:
-                                tlayer.type = " ".join(params)
-                                params = fd.readline().split()
-                            else:
-                                tlayer.type = "MET POL"
-                            tlayer.ilevel = int(params[0])
-                            tlayer.nvertices = int(params[1])
-                            tlayer.mtype = int(params[2])
-                            tlayer.filltype = params[3]
-                            tlayer.debugid = int(params[4])
-                            tlayer.xmin = int(params[5])
-                            tlayer.ymin = int(params[6])
-                            tlayer.xmax = int(params[7])
-                            tlayer.ymax = int(params[8])
-                            tlayer.conmax = int(params[9])
-                            tlayer.res1 = int(params[10])
-                            tlayer.res2 = int(params[11])
-                            tlayer.edgemesh = params[12]
-                            line = fd.readline()
-                            if line.split()[0] == "TOLEVEL":
-                                params = line.split()
-                                tlayer.to_level = int(params[1])
-                                tlayer.meshingfill = params[2]
-                                tlayer.pads = params[3]
-                                line = fd.readline()
-                            while line == "END\n":
-                                line = fd.readline()
-                            dlayers[tlayer.ilevel].tlayers.append(tlayer)
-
-                        elif line.split()[0] == "VALVAR":
-                            # Initialize variable parameter
-                            params = line.split()
-                            valvar = Valvar()
-                            valvar.varname = params[1]
-                            valvar.unittype = params[2]
-                            valvar.value = float(params[3])
-                            valvar.description = params[4].replace('"','')
-                            valvars.append(valvar)
-                            line = fd.readline()
-
-                        elif line.split()[0] == "LORGN":
-                            # Initialize location of origin
-                            params = line.split()
-                            lorgn = Lorgn()
-                            lorgn.x = float(params[1])
-                            lorgn.y = float(params[2])
-                            lorgn.locked = params[3]
-                            geo.lorgn = lorgn
-                            line = fd.readline()
-
-                        elif line.split()[0] == "POR1":
-                            # Initialize port
-                            port = Port()
-                            port.type = line.split()[1]
-                            port.ipolygon = int(fd.readline().split()[1])
-                            port.ivertex = int(fd.readline().split()[0])
-                            params = fd.readline().split()
-                            port.portnum = int(params[0])
-                            port.resist = float(params[1])
-                            port.react = float(params[2])
-                            port.induct = float(params[3])
-                            port.capac = float(params[4])
-                            port.xcoord = float(params[5])
-                            port.ycoord = float(params[6])
-                            # We can not yet assign port to dlayer because
-                            # its location is hidden in ipolygon, so for now
-                            # we save port in a list of ports
-                            ports.append(port)
-                            line = fd.readline()
-
-                        elif line.split()[0] == "SMD":
-                            # Initialize component and add it to dlayer
-                            component = Component()
-                            component.levelnum = int(line.split()[1])
-                            component.label = line.split()[2].replace('"','')
-                            component.objectid = int(fd.readline().split()[1])
-                            component.gndref = fd.readline().split()[1]
-                            component.twtype = fd.readline().split()[1]
-                            sbox = fd.readline().split()
-                            component.leftpos = float(sbox[1])
-                            component.rightpos = float(sbox[2])
-                            component.toppos = float(sbox[3])
-                            component.bottompos = float(sbox[4])
-                            component.pbshw = fd.readline().split()[1]
-                            lpos = fd.readline().split()
-                            component.xpos = float(lpos[1])
-                            component.ypos = float(lpos[2])
-                            typeideal = fd.readline().split()
-                            component.idealtype = typeideal[2]
-                            compval = typeideal[3]
-                            # If compval is in quotes, it is a variable parameter
-                            if compval[0] == '"' and compval[-1] == '"':
-                                component.compval = compval.replace('"','')
-                            # Otherwise it is a float value
-                            else:
-                                component.compval = float(compval)
-                            smdp1 = fd.readline().split()
-                            component.smdp1_levelnum = int(smdp1[1])
-                            component.smdp1_x = float(smdp1[2])
-                            component.smdp1_y = float(smdp1[3])
-                            component.smdp1_orientation = smdp1[4]
-                            component.smdp1_portnum = int(smdp1[5])
-                            component.smdp1_pinnum = int(smdp1[6])
-                            smdp2 = fd.readline().split()
-                            component.smdp2_levelnum = int(smdp2[1])
-                            component.smdp2_x = float(smdp2[2])
-                            component.smdp2_y = float(smdp2[3])
-                            component.smdp2_orientation = smdp2[4]
-                            component.smdp2_portnum = int(smdp2[5])
-                            component.smdp2_pinnum = int(smdp2[6])
-                            dlayers[component.levelnum].components.append(component)
-                            line = fd.readline()
-                            line = fd.readline()
-
-                        elif line.split()[0] == "NUM":
-                            # Associate polygons with technology layers
-                            npoly = int(line.split()[1])
-                            geo.npoly = npoly
-                            for poly in range(npoly):
-                                polygon = Polygon()
-                                params = fd.readline().split()
-                                if len(params) != 13:
-                                    polygon.type = " ".join(params)
-                                    params = fd.readline().split()
-                                else:
-                                    polygon.type = "MET POL"
-                                polygon.ilevel = int(params[0])
-                                polygon.nvertices = int(params[1])
-                                polygon.mtype = int(params[2])
-                                polygon.filltype = params[3]
-                                polygon.debugid = int(params[4])
-                                polygon.xmin = int(params[5])
-                                polygon.ymin = int(params[6])
-                                polygon.xmax = int(params[7])
-                                polygon.ymax = int(params[8])
-                                polygon.conmax = int(params[9])
-                                polygon.res1 = int(params[10])
-                                polygon.res2 = int(params[11])
-                                polygon.edgemesh = params[12]
-                                line = fd.readline()
-                                if line.split()[0] == "TOLEVEL":
-                                    params = line.split()
-                                    polygon.to_level = int(params[1])
-                                    polygon.meshingfill = params[2]
-                                    polygon.pads = params[3]
-                                    line = fd.readline()
-                                tlaynam = line.split()
-                                gds_indices = tlaynam[1].replace("Stream","").split(":")
-                                polygon.gds_stream = int(gds_indices[0])
-                                polygon.gds_object = int(gds_indices[1])
-                                polygon.inherit = tlaynam[2]
-                                line = fd.readline()
-                                while line != "END\n":
-                                    xvertex = float(line.split()[0])
-                                    yvertex = float(line.split()[1])
-                                    polygon.vertices.append([xvertex, yvertex])
-                                    line = fd.readline()
-                                for dlayer in dlayers:
-                                    for tlayer in dlayer.tlayers:
-                                        if tlayer.gds_stream == polygon.gds_stream and \
-                                           tlayer.gds_object == polygon.gds_object:
-                                            tlayer.polygons.append(polygon)
-                                # Assign port to layer if the current polygon's
-                                # debugid matches that of a port's ipolygon
-                                for port in ports:
-                                    if polygon.debugid == port.ipolygon:
-                                        dlayers[polygon.ilevel].ports.append(port)
+        Cancelling the task stops the translator.
+        """
 
-                            else:
-                                line = fd.readline()
-
-                elif line == "CONTROL\n":
-                    # Initialize CONTROL block
-                    control = Control()
-                    project.control = control
-                    line = fd.readline()
-                    while line != "END CONTROL\n":
-                        if line.split()[0] in ["SIMPLE", "STD", "ABS", "OPTIMIZE", "VARSWP", "EXTFILE"]:
-                            control.sweep = line.split()[0]
-                            line = fd.readline()
-
-                        elif line.split()[0] == "OPTIONS":
-                            control.options = line.split()[1]
-                            line = fd.readline()
-
-                        elif line.split()[0] == "SUBSPLAM":
-                            control.subsplam = line.split()[1] # "Y" or "N"
-                            if line.split()[1] == "Y":
-                                control.subsplam_subslambda = int(line.split()[2])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "EDGECHECK":
-                            control.edgecheck = line.split()[1] # "Y" or "N"
-                            if line.split()[1] == "Y":
-                                control.edgecheck_numlevels = int(line.split()[2])
-                            if line.split()[-1] == "TECHLAY":
-                                control.edgecheck_checktype = line.split()[-1]
-                            line = fd.readline()
-
-                        elif line.split()[0] == "CFMAX":
-                            control.cfmax = line.split()[1] # "Y" or "N"
-                            if line.split()[1] == "Y":
-                                control.cfmax_subfreq = float(line.split()[2])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "CEPSY":
-                            control.cepsy = line.split()[1] # "Y" or "N"
-                            if line.split()[1] == "Y":
-                                control.cepsy_epsilon = float(line.split()[2])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "FILENAME":
-                            control.filename = line.split()[1]
-                            line = fd.readline()
-
-                        elif line.split()[0] == "SPEED":
-                            control.speed = int(line.split()[1])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "RES_ABS":
-                            control.res_abs = line.split()[1] # "Y" or "N"
-                            if line.split()[1] == "Y":
-                                control.res_abs_resolution = float(line.split()[2])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "CACHE_ABS":
-                            control.cache_abs = int(line.split()[1])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "TARG_ABS":
-                            control.targ_abs = int(line.split()[1])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "Q_ACC":
-                            control.q_acc = line.split()[1] # "Y" or "N"
-                            line = fd.readline()
-
-                        elif line.split()[0] == "DET_ABS_RES":
-                            control.det_abs_res = line.split()[1] # "Y" or "N"
-                            line = fd.readline()
+        # Technical description for developers:
+        # Same steps as runGdsTranslator, but the search for the gds file
+        # (which walks the whole directory tree) and reading the project run
+        # on a thread with asyncio.to_thread, since they can take seconds,
+        # and the translator is awaited by waitProcessAsync. The project is
+        # only read if the translator succeeded.
 
-                        else:
-                            line = fd.readline()
-
-                elif line == "FREQ\n":
-                    # Initialize FREQ block
-                    freq = Freq()
-                    project.freq = freq
-                    line = fd.readline()
-                    while line != "END FREQ\n":
-
-                        if line.split()[0] == "SIMPLE":
-                            freq.sweep = line.split()[0]
-                            freq.f1 = float(line.split()[1])
-                            freq.f2 = float(line.split()[2])
-                            freq.fstep = float(line.split()[3])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "ABS":
-                            freq.sweep = line.split()[0]
-                            freq.f1 = float(line.split()[1])
-                            freq.f2 = float(line.split()[2])
-                            line = fd.readline()
+        args = await asyncio.to_thread(self.gdsTranslatorArgs)
 
-                        else:
-                            line = fd.readline()
-
-                elif line == "OPT\n":
-                    # Initialize OPT block
-                    opt = Opt()
-                    project.opt = opt
-                    line = fd.readline()
-
-                    while line != "END OPT\n":
-                        # Save all lines
-                        opt.lines.append(line)
-                        line = fd.readline()
-
-                elif line == "VARSWP\n":
-                    # Initialize VARSWP block
-                    varswp = Varswp()
-                    psweeps = []
-                    varswp.psweeps = psweeps
-                    project.varswp = varswp
-                    line = fd.readline()
-
-                    while line != "END VARSWP\n":
-
-                        if line.split()[0] == "SWEEP":
-                            # Initialize parameter sweep
-                            psweep = Psweep()
-                            psweep.sweeptype = line.split()[0]
-                            psweep.f1 = float(line.split()[1])
-                            psweep.f2 = float(line.split()[2])
-                            psweep.fstep = float(line.split()[3])
-
-                            line = fd.readline()
-                            while line.split()[0] == "VAR":
-                                var = Var()
-                                var.parameter = line.split()[1]
-                                var.ytype = line.split()[2]
-                                var.min = float(line.split()[3])
-                                var.max = float(line.split()[4])
-                                var.step = float(line.split()[5])
-                                psweep.vars.append(var)
-                                line = fd.readline()
-                            psweeps.append(psweep)
-
-                        elif line.split()[0] == "ABS_ENTRY":
-                            # Initialize parameter sweep
-                            psweep = Psweep()
-                            psweep.sweeptype = line.split()[0]
-                            psweep.f1 = float(line.split()[1])
-                            psweep.f2 = float(line.split()[2])
-
-                            line = fd.readline()
-                            while line.split()[0] == "VAR":
-                                var = Var()
-                                var.parameter = line.split()[1]
-                                var.ytype = line.split()[2]
-                                var.min = float(line.split()[3])
-                                var.max = float(line.split()[4])
-                                var.step = float(line.split()[5])
-                                psweep.vars.append(var)
-                                line = fd.readline()
-                            psweeps.append(psweep)
+        try:
+            # Run conversion process
+            self.gds_process = await startProcessAsync(args)
+        except OSError:
+            raise self.gdsTranslatorNotFound()
 
-                        else:
-                            line = fd.readline()
-
-                elif line == "FILEOUT\n":
-                    # Initialize FILEOUT block
-                    fileout = Fileout()
-                    project.fileout = fileout
-                    line = fd.readline()
-
-                    while line != "END FILEOUT\n":
-
-                        if line.split()[0] in ["TS", "TOUCH2", "DATA_BANK", "SC", "CSV", "CADENCE", "MDIF", "EBMDIF"]:
-                            params = line.split()
-                            fileout.filetype = params[0]
-                            fileout.embed = params[1]
-                            fileout.abs_inc = params[2]
-                            fileout.filename = params[3]
-                            fileout.comments = params[4]
-                            fileout.sig = int(params[5])
-                            fileout.partype = params[6]
-                            fileout.parform = params[7]
-                            fileout.ports = " ".join(params[8:])
-                            line = fd.readline()
-
-                        elif line.split()[0] == "FOLDER":
-                            fileout.folder = line.split()[1]
-                            line = fd.readline()
+        # Wait for the process to complete
+        if silent == False:
+            print('Translating...')
+        returncode, output = await waitProcessAsync(self.gds_process, timeout)
+        if returncode != 0:
+            raise self.exception("The gds translator failed with exit code {:d}: {:s}".format(returncode, output.strip()))
 
-                        else:
-                            line = fd.readline()
-
-                elif line == "SUBDIV\n":
-                    # Initialize SUBDIV block
-                    subdiv = Subdiv()
-                    project.subdiv = subdiv
-                    line = fd.readline()
-
-                    while line != "END SUBDIV\n":
-                        # Save all lines
-                        subdiv.lines.append(line)
-                        line = fd.readline()
-
-                elif line == "QSG\n":
-                    # Initialize QSG block
-                    qsg = Qsg()
-                    project.qsg = qsg
-                    line = fd.readline()
-
-                    while line not in ["END QSG", "END QSG\n"]:
-                        # Save all lines
-                        qsg.lines.append(line)
-                        line = fd.readline()
-
-                elif line.split()[0] == "END":
-                    # Reached the end of a block
-                    line = fd.readline()
+        # Read the Sonnet file into Sonpy and run some default changes
+        def postprocess():
+            self.readProject()
+            self.collapseDlayers()
+            self.cropBox()
+        await asyncio.to_thread(postprocess)
+        return returncode
 
-                else:
-                    print("Warning: Ignoring unknown line: {:s}".format(line))
-                    line = fd.readline()
+    ########################################################################
+    # READ AND WRITE THE SONNET PROJECT FILE                               #
+    ########################################################################
+
+    def readProject(self, lazy=False, cache=False, processes=1, arrays=False):
+        """
+        Reads the Sonnet project file into SonPy. This function is run in :func:`runGdsTranslator` to ensure the created Sonnet project file is read into SonPy for further manipulation.
+
+        :param bool lazy: Keep the polygons undecoded until they are first needed. This speeds up reading and writing projects when only settings such as the frequency sweep, parameter sweeps, variables or output files are changed. The polygons are decoded as soon as a function working on the geometry (e.g. :func:`addPort`, :func:`cropBox` or :func:`setTlayer`) runs.
+        :param bool cache: Save a binary copy of the read project next to the project file (with the extra extension ``.cache``) and reuse it as long as the project file is unchanged. Loading the cache is several times faster than reading the project file. The cache is a pickle file, so only use it in directories you trust.
+        :param int processes: Number of processes reading the polygons. Use 0 for one process per CPU core. Only projects with at least ``PARALLEL_THRESHOLD`` polygons are read in parallel, and scripts reading in parallel must guard their main code with ``if __name__ == '__main__':`` on Windows and macOS.
+        :param bool arrays: Store the vertices of all polygons in a single numpy array, and make the vertices of every polygon (``polygon.vertices``) a view on it with one row per vertex. This takes a third or less of the memory of the default lists of ``[x, y]`` lists, the less the more vertices the polygons have. Requires numpy.
+        """
+
+        # Technical description for developers:
+        # The file is read in one go and handed to ProjectReader, which splits
+        # every line once and dispatches the block and statement keywords
+        # through lookup tables (see ProjectReader.__init__). The polygon
+        # records of the NUM statement are parsed by readPolygons.
+        # In lazy mode the NUM statement is kept as raw text in
+        # geo.lazypolygons and decoded the first time tlayer.polygons is
+        # accessed (see LazyPolygons and the Tlayer.polygons property). Until
+        # then printProject writes the text back verbatim.
+        # The cache is keyed on the size and modification time of the project
+        # file (see projectCacheKey), so it is invalidated as soon as the file
+        # changes, also when it is changed outside SonPy.
+        # With processes > 1 the polygon records are split into chunks at END
+        # lines and parsed on a process pool (see readPolygonsParallel). Only
+        # the parsing runs in parallel: the Polygon instances are rebuilt in
+        # this process from tuples, which takes about half as long as reading
+        # them, so the speedup is limited to about two.
+        # With arrays the coordinates are parsed into one flat array, and
+        # polygon.vertices is an (n, 2) view on it (see readPolygons and
+        # storeVertices). Code working on vertices must therefore only index
+        # and iterate them, and compare them coordinate by coordinate.
+
+        filename = self.sonnet_file_path + self.sonnet_file
+
+        if arrays and np == None:
+            raise self.exception("Storing vertices in arrays requires numpy.")
+
+        if cache:
+            key = projectCacheKey(filename, (lazy, arrays))
+            project = readProjectCache(filename, key)
+            if project != None:
+                self.project = project
+                return
+
+        with open(filename, 'r') as fd:
+            lines = fd.readlines()
+
+        if processes == 0:
+            processes = os.cpu_count() or 1
+
+        reader = ProjectReader(lines, self.exception, lazy, processes, arrays)
+        self.project = reader.read()
+
+        if cache:
+            writeProjectCache(filename, key, self.project)
 
     def printLayers(self):
         """
@@ -1070,15 +2991,15 @@ class sonnet(object):
 
         print("\n================== TOP ==================\n")
         for dlayer in self.project.geo.dlayers:
-            print("  Dielectric layer:  {ilevel} ({name})".format(**vars(dlayer)))
+            print("  Dielectric layer:  {} ({})".format(dlayer.ilevel, dlayer.name))
             for tlayer in dlayer.tlayers:
-                print("  Technology layer:  {gds_stream} ({lay_type})".format(**vars(tlayer)))
+                print("  Technology layer:  {} ({})".format(tlayer.gds_stream, tlayer.lay_type))
             for port in dlayer.ports:
-                print("  Port:              {portnum} ({type})".format(**vars(port)))
+                print("  Port:              {} ({})".format(port.portnum, port.type))
             for component in dlayer.components:
-                print("  Component:         {label} of value {compval} ({idealtype})".format(**vars(component)))
+                print("  Component:         {} of value {} ({})".format(component.label, component.compval, component.idealtype))
             if dlayer.ilevel < len(self.project.geo.dlayers) - 1:
-                print("\n================= LVL {ilevel} =================\n".format(**vars(dlayer)))
+                print("\n================= LVL {} =================\n".format(dlayer.ilevel))
         print("\n================== GND ==================\n")
 
     def printParameters(self):
@@ -1093,25 +3014,25 @@ class sonnet(object):
             print("  No variables defined")
         else:
             for valvar in self.project.geo.valvars:
-                print("  {varname} ({unittype})".format(**vars(valvar)))
+                print("  {} ({})".format(valvar.varname, valvar.unittype))
 
         if self.project.control.sweep == "VARSWP":
             sweepNumber = 0
             for psweep in self.project.varswp.psweeps:
                 sweepNumber += 1
                 if psweep.sweeptype == "ABS_ENTRY":
-                    print("\nSweep {:n}: Adaptive frequency sweep from {f1:n} to {f2:n} with variables:".format(sweepNumber, **vars(psweep)))
+                    print("\nSweep {:n}: Adaptive frequency sweep from {:n} to {:n} with variables:".format(sweepNumber, psweep.f1, psweep.f2))
                 elif psweep.sweeptype == "SWEEP":
-                    print("\nSweep {:n}: Linear frequency sweep from {f1:n} to {f2:n} in steps of {fstep:n} with variables:".format(sweepNumber, **vars(psweep)))
+                    print("\nSweep {:n}: Linear frequency sweep from {:n} to {:n} in steps of {:n} with variables:".format(sweepNumber, psweep.f1, psweep.f2, psweep.fstep))
                 else:
                     print("\nWarning: Unknown parameter sweep set!")
                 for var in psweep.vars:
                     if var.ytype != "N":
-                        print("  {parameter} from {min:n} to {max:n} in steps of {step:n}".format(**vars(var)))
+                        print("  {} from {:n} to {:n} in steps of {:n}".format(var.parameter, var.min, var.max, var.step))
         elif self.project.control.sweep == "ABS":
-            print("\nAdaptive frequency sweep from {f1:n} to {f2:n}".format(**vars(self.project.freq)))
+            print("\nAdaptive frequency sweep from {:n} to {:n}".format(self.project.freq.f1, self.project.freq.f2))
         elif self.project.control.sweep == "SIMPLE":
-            print("\nLinear frequency sweep from {f1:n} to {f2:n} in steps of {fstep:n}".format(**vars(self.project.freq)))
+            print("\nLinear frequency sweep from {:n} to {:n} in steps of {:n}".format(self.project.freq.f1, self.project.freq.f2, self.project.freq.fstep))
         else:
             print("\nWarning: No sweep set or unknown sweep set!")
         print("\n")
@@ -1119,269 +3040,29 @@ class sonnet(object):
     def printProject(self):
         """
         Prints (overwrites) the Sonnet project with the changes made in SonPy to the Sonnet project file. This function runs before the Sonnet simulation to ensure any changes made in SonPy are recorded in the Sonnet project file Sonnet's simulation software reads.
-        """
-
-        with open(self.sonnet_file_path + self.sonnet_file, 'w') as fd:
-
-            # Write every line before the HEADER block
-            for line in self.project.preheader.lines:
-                fd.write(line)
-
-            # Write HEADER block
-            header = self.project.header
-            if header == None:
-                raise self.exception("HEADER block not initialized.")
-            fd.write("HEADER\n")
-            for line in header.lines:
-                fd.write(line)
-            fd.write("END HEADER\n")
-
-            # Write DIM block
-            dim = self.project.dim
-            if dim == None:
-                raise self.exception("DIM block not initialized.")
-            fd.write("DIM\n")
-            for line in dim.lines:
-                fd.write(line)
-            fd.write("END DIM\n")
-
-            # Write GEO block
-            geo = self.project.geo
-            if geo == None:
-                raise self.exception("GEO block not initialized.")
-            fd.write("GEO\n")
-
-            tmet = geo.tmet
-            if tmet != None:
-                fd.write("TMET {name} {patternid} {type} ".format(**vars(tmet)))
-                for value in tmet.values:
-                    fd.write("{:n} ".format(value))
-                fd.write("\n")
-
-            bmet = geo.bmet
-            if bmet != None:
-                fd.write("BMET {name} {patternid} {type} ".format(**vars(bmet)))
-                for value in bmet.values:
-                    fd.write("{:n} ".format(value))
-                fd.write("\n")
-
-            met = geo.met
-            if met != None:
-                fd.write("MET {name} {patternid} {type} ".format(**vars(met)))
-                for value in met.values:
-                    fd.write("{:n} ".format(value))
-                fd.write("\n")
-
-            bri = geo.bricks
-            if bri:
-                for bricks in bri:
-                    if bricks.isIsotropic:
-                        fd.write("BRI ")
-                    else:
-                        fd.write("BRA ")
-                    fd.write("\"{name}\" {patternid} ".format(**vars(bricks)))
-                    for value in bricks.values:
-                        fd.write("{:n} ".format(value))
-                    fd.write("\n")
-
-            box = geo.box
-            if box != None:
-                fd.write("BOX {nlev} {xwidth:n} {ywidth:n} {xcells2:n} {ycells2:n} {nsubs} {eeff:n}\n".format(**vars(box)))
-            else:
-                raise self.exception("BOX not initialized.")
-
-            for dlayer in geo.dlayers:
-                fd.write("      {thickness:n} {erel:n} {mrel:n} {eloss:n} {mloss:n} {esignma:n} {nzpart} \"{name}\"\n".format(**vars(dlayer)))
-
-            for dlayer in geo.dlayers:
-                for tlayer in dlayer.tlayers:
-                    fd.write("TECHLAY {lay_type} {lay_name} {dxf_layer} {gds_stream} {gds_object}\n".format(**vars(tlayer)))
-                    if tlayer.type != "MET POL":
-                        fd.write("{type}\n".format(**vars(tlayer)))
-                    fd.write("{ilevel} {nvertices} {mtype} {filltype} {debugid} {xmin:n} {ymin:n} {xmax:n} {ymax:n} {conmax:n} {res1:n} {res2:n} {edgemesh}\n".format(**vars(tlayer)))
-                    if tlayer.lay_type == "VIA":
-                        fd.write("TOLEVEL {to_level} {meshingfill} {pads}\n".format(**vars(tlayer)))
-                    fd.write("END\nEND\n")
-
-            valvars = geo.valvars
-            for valvar in valvars:
-                fd.write("VALVAR {varname} {unittype} {value:n} \"{description}\"\n".format(**vars(valvar)))
-
-            lorgn = geo.lorgn
-            if lorgn != None:
-                fd.write("LORGN {x:n} {y:n} {locked}\n".format(**vars(lorgn)))
 
-            for dlayer in geo.dlayers:
-                for port in dlayer.ports:
-                    fd.write("POR1 {type}\n".format(**vars(port)))
-                    fd.write("POLY {ipolygon} 1\n".format(**vars(port)))
-                    fd.write("{ivertex}\n".format(**vars(port)))
-                    fd.write("{portnum} {resist:n} {react:n} {induct:n} {capac:n} {xcoord:n} {ycoord:n}\n".format(**vars(port)))
-
-            for dlayer in geo.dlayers:
-                for component in dlayer.components:
-                    fd.write("SMD {levelnum} \"{label}\"\n".format(**vars(component)))
-                    fd.write("ID {objectid}\n".format(**vars(component)))
-                    fd.write("GNDREF {gndref}\n".format(**vars(component)))
-                    fd.write("TWTYPE {twtype}\n".format(**vars(component)))
-                    fd.write("SBOX {leftpos:n} {rightpos:n} {toppos:n} {bottompos:n}\n".format(**vars(component)))
-                    fd.write("PBSHW {pbshw}\n".format(**vars(component)))
-                    fd.write("LPOS {xpos:n} {ypos:n}\n".format(**vars(component)))
-                    fd.write("TYPE IDEAL {idealtype} ".format(**vars(component)))
-                    # Write compval either as a variable parameter or float
-                    if type(component.compval) == str:
-                        fd.write("\"{compval}\"\n".format(**vars(component)))
-                    else:
-                        fd.write("{compval:n}\n".format(**vars(component)))
-                    fd.write("SMDP {smdp1_levelnum} {smdp1_x:n} {smdp1_y:n} {smdp1_orientation} {smdp1_portnum} {smdp1_pinnum}\n".format(**vars(component)))
-                    fd.write("SMDP {smdp2_levelnum} {smdp2_x:n} {smdp2_y:n} {smdp2_orientation} {smdp2_portnum} {smdp2_pinnum}\n".format(**vars(component)))
-                    fd.write("END\n")
+        The file is left untouched when it already contains the project, so repeated simulations of an unchanged project keep Sonnet's cached analysis data. Otherwise the project is written to a temporary file which then replaces the project file, so the project file is never left half written.
 
-            fd.write("NUM {npoly}\n".format(**vars(geo)))
+        The formatted polygons of every technology layer are reused by the next call until the polygons of the layer change. Changes made by the functions of SonPy and changes of the list ``tlayer.polygons`` are noticed. If you change polygons of a technology layer in place (e.g. their vertices), call ``tlayer.markChanged()`` before printing.
+        """
 
-            for dlayer in geo.dlayers:
-                for tlayer in dlayer.tlayers:
-                    for polygon in tlayer.polygons:
-                        # Make sure the ilevel and to_level reflects that of tlayer
-                        polygon.ilevel = tlayer.ilevel
-                        polygon.to_level = tlayer.to_level
-                        fd.write("{type}\n".format(**vars(polygon)))
-                        fd.write("{ilevel} {nvertices} {mtype} {filltype} {debugid} {xmin:n} {ymin:n} {xmax:n} {ymax:n} {conmax:n} {res1:n} {res2:n} {edgemesh}\n".format(**vars(polygon)))
-                        if tlayer.lay_type == "VIA":
-                            fd.write("TOLEVEL {to_level} {meshingfill} {pads}\n".format(**vars(polygon)))
-                        fd.write("TLAYNAM Stream{gds_stream}:{gds_object} {inherit}\n".format(**vars(polygon)))
-                        for vertex in polygon.vertices:
-                            fd.write("{:n} {:n}\n".format(vertex[0], vertex[1]))
-                        fd.write("END\n")
-
-            fd.write("END GEO\n")
-
-            # Write CONTROL block
-            control = self.project.control
-            if control != None:
-                fd.write("CONTROL\n")
-
-                if control.sweep != None:
-                    fd.write("{sweep}\n".format(**vars(control)))
-
-                if control.options != None:
-                    fd.write("OPTIONS {options}\n".format(**vars(control)))
-
-                if control.subsplam != None:
-                    fd.write("SUBSPLAM {subsplam}".format(**vars(control)))
-                    if control.subsplam_subslambda != None:
-                        fd.write(" {subsplam_subslambda}".format(**vars(control)))
-                    fd.write("\n")
-
-                if control.edgecheck != None:
-                    fd.write("EDGECHECK {edgecheck}".format(**vars(control)))
-                    if control.edgecheck_numlevels != None:
-                        fd.write(" {edgecheck_numlevels}".format(**vars(control)))
-                    if control.edgecheck_checktype != None:
-                        fd.write(" {edgecheck_checktype}".format(**vars(control)))
-                    fd.write("\n")
-
-                if control.cfmax != None:
-                    fd.write("CFMAX {cfmax}".format(**vars(control)))
-                    if control.cfmax_subfreq != None:
-                        fd.write(" {cfmax_subfreq:n}".format(**vars(control)))
-                    fd.write("\n")
-
-                if control.cepsy != None:
-                    fd.write("CEPSY {cepsy}".format(**vars(control)))
-                    if control.cepsy != None:
-                        fd.write(" {cepsy_epsilon:n}".format(**vars(control)))
-                    fd.write("\n")
-
-                if control.filename != None:
-                    fd.write("FILENAME {filename}\n".format(**vars(control)))
-
-                if control.speed != None:
-                    fd.write("SPEED {speed}\n".format(**vars(control)))
-
-                if control.res_abs != None:
-                    fd.write("RES_ABS {res_abs}".format(**vars(control)))
-                    if control.res_abs_resolution != None:
-                        fd.write(" {res_abs_resolution:n}".format(**vars(control)))
-                    fd.write("\n")
-
-                if control.cache_abs != None:
-                    fd.write("CACHE_ABS {cache_abs}\n".format(**vars(control)))
-
-                if control.targ_abs != None:
-                    fd.write("TARG_ABS {targ_abs}\n".format(**vars(control)))
-
-                if control.q_acc != None:
-                    fd.write("Q_ACC {q_acc}\n".format(**vars(control)))
-
-                if control.det_abs_res != None:
-                    fd.write("DET_ABS_RES {det_abs_res}\n".format(**vars(control)))
-
-                fd.write("END CONTROL\n")
-
-            # Write FREQ block
-            freq = self.project.freq
-            if freq != None:
-                fd.write("FREQ\n")
-
-                if freq.sweep == "SIMPLE":
-                    fd.write("{sweep} {f1:n} {f2:n} {fstep:n}\n".format(**vars(freq)))
-
-                elif freq.sweep == "ABS":
-                    fd.write("{sweep} {f1:n} {f2:n}\n".format(**vars(freq)))
-
-                fd.write("END FREQ\n")
-
-            # Write OPT block
-            opt = self.project.opt
-            if opt != None:
-                fd.write("OPT\n")
-                for line in opt.lines:
-                    fd.write(line)
-                fd.write("END OPT\n")
-
-            # Write VARSWP block
-            varswp = self.project.varswp
-            if varswp != None:
-                fd.write("VARSWP\n")
-
-                for psweep in varswp.psweeps:
-                    fd.write("{sweeptype} {f1:n} {f2:n}".format(**vars(psweep)))
-                    if psweep.sweeptype == "SWEEP":
-                        fd.write(" {fstep:n}".format(**vars(psweep)))
-                    fd.write("\n")
-                    for var in psweep.vars:
-                        fd.write("VAR {parameter} {ytype} {min:n} {max:n} {step:n}\n".format(**vars(var)))
-                fd.write("END\n")
-
-                fd.write("END VARSWP\n")
-
-            # Write FILEOUT block
-            fileout = self.project.fileout
-            if fileout != None:
-                fd.write("FILEOUT\n")
-
-                fd.write("{filetype} {embed} {abs_inc} {filename} {comments} {sig} {partype} {parform} {ports}\n".format(**vars(fileout)))
-                if fileout.folder != None:
-                   fd.write("FOLDER {folder}\n".format(**vars(fileout)))
-
-                fd.write("END FILEOUT\n")
-
-            # Write SUBDIV block
-            subdiv = self.project.subdiv
-            if subdiv != None:
-                fd.write("SUBDIV\n")
-                for line in subdiv.lines:
-                    fd.write(line)
-                fd.write("END SUBDIV\n")
-
-            # Write QSG block
-            qsg = self.project.qsg
-            if qsg != None:
-                fd.write("QSG\n")
-                for line in qsg.lines:
-                    fd.write(line)
-                fd.write("END QSG")
+        # Technical description for developers:
+        # ProjectWriter collects the text of the project file in chunks, which
+        # are written with a single call. The polygon records, which make up
+        # most of the file, are formatted with % instead of str.format.
+        # The polygon records of every technology layer are cached in
+        # tlayer.polygontext and written again as long as the polygons are
+        # unchanged, so printing a project again after changing e.g. the
+        # frequency sweep or a variable only formats the other blocks, which
+        # are small. The records are dropped when the polygons change, see
+        # Tlayer.markChanged and PolygonList, which takes constant time.
+
+        # The file is only written when its content changes, which keeps its
+        # modification time and thereby the analysis data em has cached for
+        # it (see writeIfChanged).
+
+        text = ProjectWriter(self.project, self.exception).write()
+        writeIfChanged(self.sonnet_file_path + self.sonnet_file, text)
 
     ########################################################################
     # PROJECT GEOMETRY (LAYERS, PORTS, COMPONENTS ECT.)                    #
@@ -1392,29 +3073,40 @@ class sonnet(object):
         Gets the bounding box for the polygons in the project.
 
         """
-        xvertices, yvertices = [], []
+        # Technical description for developers:
+        # Every technology layer caches the extent of its polygons (see
+        # Tlayer.getExtent), which is dropped when its polygons change (see
+        # Tlayer.markChanged). The bounding box is therefore only recomputed
+        # for layers whose polygons have changed, which makes mapPoint cheap
+        # enough to run for every port and component.
+        # Polygons where all points are the same (glitches of Sonnet or the
+        # gds translator) are not part of the bounding box.
+
+        extents = []
         for dlayer in self.project.geo.dlayers:
             for tlayer in dlayer.tlayers:
-                for polygon in tlayer.polygons:
-                    # check if polygon is a sonnet glitch where all the points are the same
-                    glitched_polygon = all(x==polygon.vertices[0] for x in polygon.vertices)
-                    if not glitched_polygon:
-                        for vertex in polygon.vertices:
-                            xvertices.append(vertex[0])
-                            yvertices.append(vertex[1])
+                extent = tlayer.getExtent()
+                if extent != None:
+                    extents.append(extent)
 
-        xmin, ymin = min(xvertices), min(yvertices)
-        xmax, ymax = max(xvertices), max(yvertices)
+        if not extents:
+            raise self.exception("No polygons in project.")
 
-        return[[xmin,ymin],[xmax,ymax]]
+        xmin = min(extent[0] for extent in extents)
+        ymin = min(extent[1] for extent in extents)
+        xmax = max(extent[2] for extent in extents)
+        ymax = max(extent[3] for extent in extents)
 
+        return[[xmin,ymin],[xmax,ymax]]
 
-    def cropBox(self, xcellsize=1, ycellsize=1):
+    def cropBox(self, xcellsize=1, ycellsize=1, snap=False, tolerance=None):
         """
         Crops the bounding box (used in Sonnet to confine the simulation space) to the circuit of the circuit.
 
-        :param xcellsize: Cellsize in x direction.
-        :param ycellsize: Cellsize in y direction.
+        :param xcellsize: Cellsize in x direction. If ``None``, the largest cell size that keeps the geometry exact is used, see :func:`proposeCellSize`.
+        :param ycellsize: Cellsize in y direction. If ``None``, see ``xcellsize``.
+        :param bool snap: Snap vertices near the cell grid onto it after cropping, see :func:`snapToGrid`.
+        :param float tolerance: Snapping tolerance, see :func:`snapToGrid`.
         :type xcellsize: float
         :type ycellsize: float
 
@@ -1426,19 +3118,16 @@ class sonnet(object):
         # If the circuit is rectangular, this ensures that ports added to the
         # edges of the circuit is also at the edge of the BOX
 
-        xvertices, yvertices = [], []
-        for dlayer in self.project.geo.dlayers:
-            for tlayer in dlayer.tlayers:
-                for polygon in tlayer.polygons:
-                    # check if the polygon is a sonnet or gds glitch where all the points are the same
-                    glitched_polygon = all(x == polygon.vertices[0] for x in polygon.vertices)
-                    if not glitched_polygon:
-                        for vertex in polygon.vertices:
-                            xvertices.append(vertex[0])
-                            yvertices.append(vertex[1])
-
-        xmin, ymin = min(xvertices), min(yvertices)
-        xmax, ymax = max(xvertices), max(yvertices)
+        if xcellsize == None or ycellsize == None:
+            [xproposed, yproposed] = self.proposeCellSize()
+            if xcellsize == None:
+                xcellsize = xproposed
+            if ycellsize == None:
+                ycellsize = yproposed
+
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+        # Shift the circuit (all polygons, ports and components)
+        self.transformGeometry(offset=(-xmin, -ymin))
         # Define or redefine the local origin (LORGN)
         lorgn = Lorgn()
         lorgn.x = 0
@@ -1451,92 +3140,423 @@ class sonnet(object):
         self.project.geo.box.xwidth = int(round((xmax - xmin)/xcellsize))*xcellsize
         self.project.geo.box.ywidth = int(round((ymax - ymin)/ycellsize))*ycellsize
 
-        # Shift the circuit (all polygons, components and polygons)
+        if snap:
+            self.snapToGrid(xcellsize, ycellsize, tolerance, silent=True)
+
+    def transformGeometry(self, matrix=((1, 0), (0, 1)), offset=(0, 0)):
+        """
+        Applies the affine transform ``(x, y) -> A (x, y) + b`` to all polygons, ports, components and the local origin, for instance to build variants of a circuit. Coordinates are in Sonnet's coordinate system, relative to the upper left corner of the box with the y axis pointing down. The box itself is not changed, see :func:`cropBox`. See also :func:`translate`, :func:`mirror` and :func:`scale`.
+
+        :param matrix: The matrix ``A`` as ``((a11, a12), (a21, a22))``.
+        :param offset: The offset ``b`` as ``(b1, b2)``.
+        :type matrix: tuple of tuples of floats
+        :type offset: tuple of floats
+        """
+
+        # Technical description for developers:
+        # The vertices of each technology layer are transformed at once by
+        # transformVertices. Ports and components are few and transformed one
+        # by one. The schematic box of a component is transformed through
+        # two opposite corners, and the orientation of its ports through the
+        # direction the letter stands for, so components only survive
+        # transforms that keep the axes (translations, mirrors, scaling and
+        # rotations by multiples of 90 degrees). The cached extents of the
+        # technology layers are transformed along for these.
+
+        ((xx, xy), (yx, yy)), (dx, dy) = matrix, offset
+        if xx*yy - xy*yx == 0:
+            raise self.exception("The transform is singular.")
+        keepsAxes = (xy == 0 and yx == 0) or (xx == 0 and yy == 0)
+        for dlayer in self.project.geo.dlayers:
+            if len(dlayer.components) > 0 and not keepsAxes:
+                raise self.exception("Components can only be transformed when the axes are kept.")
+
+        def transform(x, y):
+            return xx*x + xy*y + dx, yx*x + yy*y + dy
+
+        # Directions of the component port orientations
+        directions = {"L": (-1, 0), "R": (1, 0), "T": (0, -1), "B": (0, 1)}
+        def orientation(letter):
+            xdir, ydir = directions[letter]
+            xdir, ydir = xx*xdir + xy*ydir, yx*xdir + yy*ydir
+            if ydir == 0:
+                return "R" if xdir > 0 else "L"
+            return "B" if ydir > 0 else "T"
+
         for dlayer in self.project.geo.dlayers:
             for tlayer in dlayer.tlayers:
-                for polygon in tlayer.polygons:
-                    for vertex in polygon.vertices:
-                        vertex[0] += -xmin
-                        vertex[1] += -ymin
+                extent = tlayer.getExtent()
+                polygons = tlayer.getPolygons()
+                with gcPaused():
+                    transformVertices(polygons, matrix, offset)
+                tlayer.polygons = polygons
+                if extent != None and keepsAxes:
+                    (x0, y0), (x1, y1) = transform(extent[0], extent[1]), transform(extent[2], extent[3])
+                    tlayer.extent = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            for port in dlayer.ports:
+                port.xcoord, port.ycoord = transform(port.xcoord, port.ycoord)
+            for component in dlayer.components:
+                component.smdp1_x, component.smdp1_y = transform(component.smdp1_x, component.smdp1_y)
+                component.smdp2_x, component.smdp2_y = transform(component.smdp2_x, component.smdp2_y)
+                component.smdp1_orientation = orientation(component.smdp1_orientation)
+                component.smdp2_orientation = orientation(component.smdp2_orientation)
+                component.xpos, component.ypos = transform(component.xpos, component.ypos)
+                (x0, y0), (x1, y1) = transform(component.leftpos, component.toppos), transform(component.rightpos, component.bottompos)
+                component.leftpos, component.rightpos = min(x0, x1), max(x0, x1)
+                component.toppos, component.bottompos = min(y0, y1), max(y0, y1)
+
+        lorgn = self.project.geo.lorgn
+        if lorgn != None and lorgn.x != None:
+            lorgn.x, lorgn.y = transform(lorgn.x, lorgn.y)
+
+    def translate(self, dx, dy):
+        """
+        Moves the circuit by (dx, dy) in Sonnet's coordinate system (the y axis pointing down), see :func:`transformGeometry`.
+
+        :param float dx: Distance in x direction.
+        :param float dy: Distance in y direction.
+        """
+
+        self.transformGeometry(offset=(dx, dy))
+
+    def mirror(self, axis="x"):
+        """
+        Mirrors the circuit in place, see :func:`transformGeometry`. The circuit keeps its bounding box.
+
+        :param str axis: ``"x"`` flips the x coordinates (left and right), ``"y"`` the y coordinates (top and bottom).
+        """
+
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+        if axis == "x":
+            self.transformGeometry(((-1, 0), (0, 1)), (xmin + xmax, 0))
+        elif axis == "y":
+            self.transformGeometry(((1, 0), (0, -1)), (0, ymin + ymax))
+        else:
+            raise self.exception("Invalid axis.")
+
+    def scale(self, xfactor, yfactor=None):
+        """
+        Scales the circuit about the upper left corner of its bounding box, see :func:`transformGeometry`. Call :func:`cropBox` afterwards to fit the box to the scaled circuit.
+
+        :param float xfactor: Scale factor in x direction.
+        :param float yfactor: Scale factor in y direction. Default is the same as in x direction.
+        """
+
+        if yfactor == None:
+            yfactor = xfactor
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+        self.transformGeometry(((xfactor, 0), (0, yfactor)), (xmin - xfactor*xmin, ymin - yfactor*ymin))
+
+    def cropToRegion(self, xmin, ymin, xmax, ymax):
+        """
+        Crops the circuit to a window, e.g. to simulate a single resonator or coupler of a chip in a much smaller project. Polygons are clipped to the window, and ports and components outside of it are removed. The box is resized to the window (keeping the cell size) and the local origin is moved to its lower left corner. The coordinates are relative to the lower left corner like in :func:`addPort`.
+
+        :param float xmin: Left side of the window.
+        :param float ymin: Bottom side of the window.
+        :param float xmax: Right side of the window.
+        :param float ymax: Top side of the window.
+        """
+
+        # Technical description for developers:
+        # Polygons are clipped by clipPolygon (Sutherland-Hodgman) in
+        # Sonnet's coordinate system, where the window spans (xmin, ytop) to
+        # (xmax, ybottom). Ports must lie in the window and on the clipped
+        # polygon, component ports in the window. The debug ids of the
+        # remaining polygons are renumbered from 1 in the order they are
+        # written, the ports follow their polygons. Finally the window is
+        # moved to the origin with transformGeometry.
+
+        if xmin >= xmax or ymin >= ymax:
+            raise self.exception("Empty window.")
+        # Window corners in Sonnet's coordinate system
+        xleft, ytop = self.mapPoint(xmin, ymax)
+        xright, ybottom = self.mapPoint(xmax, ymin)
+        def inside(xcoord, ycoord):
+            return xleft <= xcoord <= xright and ytop <= ycoord <= ybottom
+
+        npoly = 0
+        for dlayer in self.project.geo.dlayers:
+            portsByPolygon = {}
+            for port in dlayer.ports:
+                portsByPolygon.setdefault(port.ipolygon, []).append(port)
+            ports = []
+            for tlayer in dlayer.tlayers:
+                polygons = []
+                for polygon in tlayer.getPolygons():
+                    vertices = clipPolygon(polygon.vertices, xleft, ytop, xright, ybottom)
+                    if vertices == []:
+                        continue
+                    if vertices != None:
+                        polygon.vertices = vertices
+                        polygon.nvertices = len(vertices)
+                    for port in portsByPolygon.pop(polygon.debugid, []):
+                        if not inside(port.xcoord, port.ycoord):
+                            continue
+                        ivertex = findEdge(polygon.vertices, port.xcoord, port.ycoord)
+                        if ivertex == None:
+                            continue
+                        port.ivertex = ivertex
+                        port.ipolygon = npoly + len(polygons) + 1
+                        ports.append(port)
+                    polygon.debugid = npoly + len(polygons) + 1
+                    polygons.append(polygon)
+                tlayer.polygons = polygons
+                npoly += len(polygons)
+            # Keep the ports in their original order
+            kept = set(id(port) for port in ports)
+            dlayer.ports = [port for port in dlayer.ports if id(port) in kept]
+            dlayer.components = [component for component in dlayer.components
+                                 if inside(component.smdp1_x, component.smdp1_y) and inside(component.smdp2_x, component.smdp2_y)]
+        self.project.geo.npoly = npoly
+
+        # Move the window to the origin and fit the box to it, keeping the
+        # cell size
+        self.transformGeometry(offset=(-xleft, -ytop))
+        box = self.project.geo.box
+        xcellsize = 2*box.xwidth/box.xcells2
+        ycellsize = 2*box.ywidth/box.ycells2
+        box.xcells2 = int(2*round((xright - xleft)/xcellsize))
+        box.ycells2 = int(2*round((ybottom - ytop)/ycellsize))
+        box.xwidth = int(round((xright - xleft)/xcellsize))*xcellsize
+        box.ywidth = int(round((ybottom - ytop)/ycellsize))*ycellsize
+        lorgn = Lorgn()
+        lorgn.x = 0
+        lorgn.y = ybottom - ytop
+        self.project.geo.lorgn = lorgn
+
+    def proposeCellSize(self, resolution=0.001, tolerance=None):
+        """
+        Proposes the largest cell size in x and y direction that keeps the geometry exact, i.e. with all vertices on the cell grid once the box is cropped with :func:`cropBox`. Cells larger than necessary make Sonnet subsection the circuit more finely and run slower.
+
+        :param float resolution: Smallest cell size considered, e.g. the database unit of the GDSII file in the length unit of the project.
+        :param float tolerance: Largest deviation of a vertex from a multiple of the resolution. Default is a thousandth of the resolution (rounding errors only).
+        :return: Cell sizes ``[xcellsize, ycellsize]``.
+        :rtype: list of floats
+        """
+
+        # Technical description for developers:
+        # The vertex coordinates relative to the lower left corner of the
+        # bounding box (the origin after cropBox) are expressed in units of
+        # the resolution, and the cell size is their greatest common
+        # divisor (see gridCellSize).
+
+        if tolerance == None:
+            tolerance = resolution/1000
+
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+        xvalues = []
+        yvalues = []
+        for dlayer in self.project.geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                for polygon in tlayer.getPolygons():
+                    vertices = polygon.vertices
+                    if np != None and type(vertices) == np.ndarray:
+                        vertices = vertices.tolist()
+                    for xvertex, yvertex in vertices:
+                        xvalues.append(xvertex - xmin)
+                        yvalues.append(yvertex - ymin)
+
+        xcellsize = gridCellSize(xvalues, resolution, tolerance)
+        ycellsize = gridCellSize(yvalues, resolution, tolerance)
+        if xcellsize == None or ycellsize == None:
+            raise self.exception("Vertices are not on a grid of the resolution, use snapToGrid first.")
+
+        return [xcellsize, ycellsize]
+
+    def snapToGrid(self, xcellsize=None, ycellsize=None, tolerance=None, silent=False):
+        """
+        Moves vertices that lie close to the cell grid onto it, e.g. after the GDSII translator shifted them ever so slightly (see :func:`addPort`). Off-grid vertices make Sonnet subsection the circuit more finely and run slower. Vertices farther from the grid than the tolerance are left alone. Ports and component ports are snapped the same way.
+
+        :param float xcellsize: Cellsize in x direction. Default is the cell size of the box.
+        :param float ycellsize: Cellsize in y direction. Default is the cell size of the box.
+        :param float tolerance: Largest distance a coordinate is moved. Default is a hundredth of the cell size.
+        :param bool silent: Toggle the message with the number of snapped vertices.
+        :return: Number of snapped vertices.
+        :rtype: int
+        """
+
+        # Technical description for developers:
+        # The grid starts at the origin of Sonnet's coordinate system (the
+        # upper left corner of the box). The vertices of each technology
+        # layer are snapped at once by snapVertices.
+
+        box = self.project.geo.box
+        if xcellsize == None:
+            xcellsize = 2*box.xwidth/box.xcells2
+        if ycellsize == None:
+            ycellsize = 2*box.ywidth/box.ycells2
+        if tolerance == None:
+            xtolerance, ytolerance = xcellsize/100, ycellsize/100
+        else:
+            xtolerance, ytolerance = tolerance, tolerance
+
+        nsnapped = 0
+        for dlayer in self.project.geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                polygons = tlayer.getPolygons()
+                with gcPaused():
+                    snapped, nvertices = snapVertices(polygons, xcellsize, ycellsize, xtolerance, ytolerance)
+                if nvertices > 0:
+                    for polygon, vertices in zip(polygons, snapped):
+                        if vertices != None:
+                            polygon.vertices = vertices
+                    tlayer.polygons = polygons
+                    nsnapped += nvertices
             for port in dlayer.ports:
-                port.xcoord += -xmin
-                port.ycoord += -ymin
+                port.xcoord = snapValue(port.xcoord, xcellsize, xtolerance)
+                port.ycoord = snapValue(port.ycoord, ycellsize, ytolerance)
             for component in dlayer.components:
-                component.xpos += -xmin
-                component.smdp1_x += -xmin
-                component.smdp2_x += -xmin
-                component.leftpos += -xmin
-                component.rightpos += -xmin
-                component.ypos += -ymin
-                component.smdp1_y += -ymin
-                component.smdp2_y += -ymin
-                component.toppos += -ymin
-                component.bottompos += -ymin
-
-    # def mergePolygons(self):
-    #     """
-    #     Merges all adjacent polygons. This operations reduces the number of polygons thereby saving simulation time, but it does not changed the physical system or the simulation results.
-    #     """
-    #
-    #     for dlayer in self.project.geo.dlayers:
-    #         for tlayer in dlayer.tlayers:
-    #             adjacentPolygons = []
-    #             polygons = tlayer.polygons
-    #             # Loop over pairs of different polygons
-    #             for i in range(0, len(polygons)):
-    #                 # Primary polygon
-    #                 x_pri = [xvertex for [xvertex, yvertex] in polygons[i].vertices]
-    #                 y_pri = [yvertex for [xvertex, yvertex] in polygons[i].vertices]
-    #                 for j in range(i + 1, len(polygons)):
-    #                     # Secondary polygon
-    #                     for vertex in range(0, polygons[j].nvertices - 1):
-    #                         x = polygon.vertices[vertex][0]
-    #                         y = polygon.vertices[vertex][1]
-    #                         # Check if point is within primary polygon (quick test)
-    #                         if x >= min(x_pri) and x <= max(x_pri) and \
-    #                            y >= min(y_pri) and y <= max(y_pri):
-    #                             # Check if point lies along primary polygon edge (slow test)
-    #                             for
-    #
-    #
-    #                         x0 = polygon.vertices[vertex][0]
-    #                         y0 = polygon.vertices[vertex][1]
-    #                         x1 = polygon.vertices[vertex + 1][0]
-    #                         y1 = polygon.vertices[vertex + 1][1]
-    #
-    #                 # Primary polygon
-    #                 x_pri = [xvertex for [xvertex, yvertex] in polygons[i].vertices]
-    #                 y_pri = [yvertex for [xvertex, yvertex] in polygons[i].vertices]
-    #                 for j in range(i + 1, len(polygons)):
-    #                     # Secondary polygon
-    #                     x_sec = [xvertex for [xvertex, yvertex] in polygons[j].vertices]
-    #                     y_sec = [yvertex for [xvertex, yvertex] in polygons[j].vertices]
-    #                     # If they cannot be adjacent then skip this pair...
-    #                     if min(x_sec) > max(x_pri) or max(x_sec) < min(x_pri) or \
-    #                        min(y_sec) > max(y_pri) or max(y_sec) < min(y_pri):
-    #                         break
-    #                     # ...else we see if vertex points of the primary polygon
-    #                     # lie on any of the primary polygon edges
-    #                     else:
-    #                         for k in range()
-    #
-    #                     # MAIN PROBLEM: How to make sure that all connected polygons get merged?
-    #
-    #
-    #
-    #                     for
-    #                     # Check if point is within primary polygon (quick test)
-    #                     if x >= xmin and x <= xmax and \
-    #                        y >= ymin and y <= ymax:
-    #                         # Check if point lies along primary polygon edge (slow test)
-    #
-    #
-    #
-    #
-    #                 # Update nvertices of the polygon
-    #
-    #                 # Update npoly in the GEO block
+                component.smdp1_x = snapValue(component.smdp1_x, xcellsize, xtolerance)
+                component.smdp1_y = snapValue(component.smdp1_y, ycellsize, ytolerance)
+                component.smdp2_x = snapValue(component.smdp2_x, xcellsize, xtolerance)
+                component.smdp2_y = snapValue(component.smdp2_y, ycellsize, ytolerance)
 
+        if silent == False:
+            print("Snapped {:d} vertices.".format(nsnapped))
+
+        return nsnapped
+
+    def mergePolygons(self, silent=False):
+        """
+        Merges all adjacent polygons. This operations reduces the number of polygons thereby saving simulation time, but it does not changed the physical system or the simulation results. Only polygons of the same technology layer with the same properties that share (parts of) edges are merged, and only into polygons without holes: polygons that enclose a hole, like a ring of rectangles, are merged into as few polygons as this greedy search finds, e.g. a ring open on one side and the rectangle closing it. Ports are moved to the merged polygons.
+
+        :param bool silent: Toggle the message with the number of polygons before and after merging.
+        :return: Number of polygons before and after merging.
+        :rtype: tuple of ints
+        """
+
+        # Technical description for developers:
+        # The polygons of each technology layer are grouped by all their
+        # properties except the debug id and vertices, and each group is
+        # merged by mergePolygonGroups, which hashes the edges instead of
+        # comparing pairs of polygons. A merged polygon takes the place and
+        # debug id of the first polygon it is made of. Ports on any of the
+        # polygons are attached to the edge of the merged polygon they lie
+        # on. If a port or component port would end up inside the merged
+        # polygon (on an edge shared by two polygons), those polygons are
+        # not merged.
+
+        npolygonsBefore = 0
+        npolygonsAfter = 0
+        properties = operator.attrgetter(*[name for name in Polygon.__slots__ if name not in ("debugid", "nvertices", "vertices")])
+        for dlayer in self.project.geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                polygons = tlayer.getPolygons()
+                npolygonsBefore += len(polygons)
+                groups = {}
+                for ipolygon, polygon in enumerate(polygons):
+                    groups.setdefault(properties(polygon), []).append(ipolygon)
+
+                replaced = {}
+                for ipolygons in groups.values():
+                    group = [polygons[ipolygon] for ipolygon in ipolygons]
+                    with gcPaused():
+                        mergedGroups = mergePolygonGroups(group)
+                    for imembers, vertices in mergedGroups:
+                        members = [group[imember] for imember in imembers]
+                        moves = self.portMoves(dlayer, members, vertices)
+                        if moves == None:
+                            continue
+                        for port, ivertex in moves:
+                            port.ipolygon = members[0].debugid
+                            port.ivertex = ivertex
+                        merged = members[0]
+                        merged.vertices = vertices
+                        merged.nvertices = len(vertices)
+                        for member in members[1:]:
+                            replaced[id(member)] = None
+
+                if replaced:
+                    tlayer.polygons = [polygon for polygon in polygons if id(polygon) not in replaced]
+                    self.project.geo.npoly -= len(replaced)
+                npolygonsAfter += len(tlayer.getPolygons())
+
+        if silent == False:
+            print("Merged {:d} polygons into {:d}.".format(npolygonsBefore, npolygonsAfter))
+
+        return npolygonsBefore, npolygonsAfter
+
+    def portMoves(self, dlayer, members, vertices):
+        # Internal use only.
+
+        # Returns the ports of the dlayer attached to the polygons members,
+        # with the index of the edge of the merged polygon (with vertices)
+        # they lie on, or None if a port or component port on the edges of
+        # the members would not be on the edges of the merged polygon
+
+        debugids = set(polygon.debugid for polygon in members)
+        moves = []
+        for port in dlayer.ports:
+            if port.ipolygon in debugids:
+                ivertex = findEdge(vertices, port.xcoord, port.ycoord)
+                if ivertex == None:
+                    return None
+                moves.append((port, ivertex))
+        for component in dlayer.components:
+            for xcoord, ycoord in [(component.smdp1_x, component.smdp1_y), (component.smdp2_x, component.smdp2_y)]:
+                if findEdge(vertices, xcoord, ycoord) != None:
+                    continue
+                for polygon in members:
+                    if findEdge(polygon.vertices, xcoord, ycoord) != None:
+                        return None
+        return moves
+
+    def simplifyGeometry(self, silent=False):
+        """
+        Removes duplicate vertices, vertices in the middle of straight edges and degenerate polygons (lines and points, e.g. the glitched polygons that the GDSII translator sometimes produces) from all technology layers. This does not change the physical system, but saves subsections and file size. Polygons with ports are never removed, and ports stay on the same edges.
+
+        :param bool silent: Toggle the message with the number of removed vertices and polygons.
+        :return: Number of removed vertices and number of removed polygons.
+        :rtype: tuple of ints
+        """
+
+        # Technical description for developers:
+        # The vertices are simplified by simplifyPolygons for all polygons
+        # of a technology layer at once. The ivertex of the ports on changed
+        # polygons is looked up again from the port coordinates.
+
+        nvertices = 0
+        npolygons = 0
+        for dlayer in self.project.geo.dlayers:
+            portsByPolygon = {}
+            for port in dlayer.ports:
+                portsByPolygon.setdefault(port.ipolygon, []).append(port)
+            for tlayer in dlayer.tlayers:
+                polygons = tlayer.getPolygons()
+                with gcPaused():
+                    simplified = simplifyPolygons(polygons)
+                changed = False
+                kept = []
+                for polygon, vertices in zip(polygons, simplified):
+                    if vertices == None:
+                        kept.append(polygon)
+                        continue
+                    ports = portsByPolygon.get(polygon.debugid, [])
+                    moves = [(port, findEdge(vertices, port.xcoord, port.ycoord)) for port in ports]
+                    if len(vertices) == 0 and len(ports) == 0:
+                        # Degenerate polygon
+                        nvertices += len(polygon.vertices)
+                        npolygons += 1
+                        changed = True
+                    elif len(vertices) == 0 or None in [ivertex for port, ivertex in moves]:
+                        kept.append(polygon)
+                    else:
+                        for port, ivertex in moves:
+                            port.ivertex = ivertex
+                        nvertices += len(polygon.vertices) - len(vertices)
+                        polygon.vertices = vertices
+                        polygon.nvertices = len(vertices)
+                        kept.append(polygon)
+                        changed = True
+                if changed:
+                    tlayer.polygons = kept
+        if npolygons > 0:
+            self.project.geo.npoly -= npolygons
+
+        if silent == False:
+            print("Removed {:d} vertices and {:d} polygons.".format(nvertices, npolygons))
+
+        return nvertices, npolygons
 
     def mapPoint(self, xcoord, ycoord):
         # Internal use only.
@@ -1546,14 +3566,66 @@ class sonnet(object):
         # left corner (LLC). This function takes an input point (xcoord, ycoord)
         # from the user's LLC system and returns the point in Sonnet's ULC system
 
-        yvertices = []
-        for dlayer in self.project.geo.dlayers:
-            for tlayer in dlayer.tlayers:
-                for polygon in tlayer.polygons:
-                    for vertex in polygon.vertices:
-                        yvertices.append(vertex[1])
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+
+        return xcoord, (ymax - ymin) - ycoord
+
+    def setPortOptions(self, port, options, allTlayers):
+        # Internal use only.
+
+        # Sets the keyword arguments of addPort (and the per port options of
+        # addPorts) on the port and returns the technology layers to look
+        # for attachment points in
+
+        searchTlayers = allTlayers
+        for key, value in options.items():
+            if key == "resist":
+                port.resist = value
+            elif key == "react":
+                port.react = value
+            elif key == "induct":
+                port.induct = value
+            elif key == "capac":
+                port.capac = value
+            elif key == "tlayer_index":
+                # Redefine the tlayer search range
+                if type(value) == int:
+                    value = [value]
+                searchTlayers = []
+                for tlayer in allTlayers:
+                    if tlayer.gds_stream in value:
+                        searchTlayers.append(tlayer)
+            else:
+                raise self.exception("Invalid keyword argument.")
+
+        return searchTlayers
+
+    def findAttachment(self, xcoord, ycoord, xmargin, ymargin, searchTlayers):
+        # Internal use only.
+
+        # Returns the attachment point of a port at (xcoord, ycoord) as
+        # [ipolygon, ivertex, error, ilevel, xnew, ynew], or None if there
+        # is no polygon edge within the margins in the search tlayers
+        # (Remember that we are a now in Sonnets coordinate system where
+        # all points are relative the the circuit's upper left corner)
+
+        candidateAttachments = []
+        for tlayer in searchTlayers:
+            # Only the edges in the grid cells around the point are checked
+            edges = tlayer.getEdgeIndex().query(xcoord - xmargin, ycoord - ymargin, xcoord + xmargin, ycoord + ymargin)
+            # If the attachment point is close enough to a polygon edge, we
+            # save the vertex index (ivertex), polygon index (ipolygon), the
+            # distance error and the tlayer index
+            for iedge, error, xnew, ynew in nearestEdgePoints(edges, xcoord, ycoord, xmargin, ymargin):
+                polygon, vertex = edges[iedge][:2]
+                candidateAttachments.append([polygon.debugid, vertex, error, tlayer.ilevel, xnew, ynew])
 
-        return xcoord, (max(yvertices) - min(yvertices)) - ycoord
+        if len(candidateAttachments) == 0:
+            return None
+        # Sort according to error, for several equally good attachment
+        # points the first one is picked
+        candidateAttachments.sort(key=lambda item: item[2])
+        return candidateAttachments[0]
 
     def addPort(self, xcoord, ycoord, xmargin=0.005, ymargin=0.005, **kwargs):
         """
@@ -1587,6 +3659,13 @@ class sonnet(object):
         # layers, but the search range can be decreased by setting the keyword
         # argument "tlayer_index" to a single integer or list of integers
         # with the gds indices of the technology layers.
+        # The edges near the attachment point are looked up in the EdgeIndex
+        # of each technology layer, a grid built on first use and dropped
+        # when the polygons of the layer change (see Tlayer.markChanged).
+        # The distance to the edges found there is computed for all of them
+        # at once by nearestEdgePoints. For diagonal edges the error is the
+        # squared distance to the edge itself, for vertical and horizontal
+        # edges the squared distance to the line through the edge.
 
         port = Port()
         xcoord, ycoord = self.mapPoint(xcoord, ycoord)
@@ -1601,85 +3680,16 @@ class sonnet(object):
                 numberOfPorts += 1
             for component in dlayer.components:
                 numberOfPorts += 2
-        searchTlayers = allTlayers
         port.portnum = numberOfPorts + 1
 
         # Get keyword arguments from user input
-        for key, value in kwargs.items():
-            if key == "resist":
-                port.resist = value
-            elif key == "react":
-                port.react = value
-            elif key == "induct":
-                port.induct = value
-            elif key == "capac":
-                port.capac = value
-            elif key == "tlayer_index":
-                # Redefine the tlayer search range
-                if type(value) == int:
-                    value = [value]
-                searchTlayers = []
-                for tlayer in allTlayers:
-                    if tlayer.gds_stream in value:
-                        searchTlayers.append(tlayer)
-            else:
-                raise self.exception("Invalid keyword argument.")
-
-        # Look for possible attachment points within the search tlayers
-        # (Remember that we are a now in Sonnets coordinate system where
-        # all points are relative the the circuit's upper left corner)
-        candidateAttachments = []
-        for tlayer in searchTlayers:
-            for polygon in tlayer.polygons:
-                for vertex in range(0, polygon.nvertices - 1):
-                    x0 = polygon.vertices[vertex][0]
-                    y0 = polygon.vertices[vertex][1]
-                    x1 = polygon.vertices[vertex + 1][0]
-                    y1 = polygon.vertices[vertex + 1][1]
-                    # If the attachment point is close enough to the polygon edge,
-                    # we save the vertex index (ivertex), polygon index (ipolygon),
-                    # a (simplified) distance error and the tlayer index
-                    if min(x0,x1) - xmargin <= xcoord and \
-                       xcoord <= max(x0,x1) + xmargin and \
-                       min(y0,y1) - ymargin <= ycoord and \
-                       ycoord <= max(y0,y1) + ymargin:
-                        if x0 == x1:
-                            error = (xcoord - x0)**2
-                            # The nearest edge point
-                            xnew = x0
-                            if ycoord > max(y0,y1):
-                                ynew = max(y0,y1)
-                            elif ycoord < min(y0,y1):
-                                ynew = min(y0,y1)
-                            else:
-                                ynew = ycoord
-                            candidateAttachments.append([polygon.debugid, vertex, error, tlayer.ilevel, xnew, ynew])
-                        elif y0 == y1:
-                            error = (ycoord - y0)**2
-                            # The nearest edge point
-                            ynew = y0
-                            if xcoord > max(x0,x1):
-                                xnew = max(x0,x1)
-                            elif xcoord < min(x0,x1):
-                                xnew = min(x0,x1)
-                            else:
-                                xnew = xcoord
-                            candidateAttachments.append([polygon.debugid, vertex, error, tlayer.ilevel, xnew, ynew])
-                        else:
-                            error = ycoord - y0 - (y1 - y0)/(x1 - x0)*(xcoord - x0)**2 \
-                                  + xcoord - x0 - (x1 - x0)/(y1 - y0)*(ycoord - y0)**2
-                            # The nearest edge point
-                            t = ( (x0-x1)*(x0-xcoord) + (y0-y1)*(y0-ycoord) ) / ( (x1-x0)**2 + (y1-y0)**2 )
-                            xnew = x0 + (x1-x0)*t
-                            ynew = y0 + (y1-y0)*t
-                            candidateAttachments.append([polygon.debugid, vertex, error, tlayer.ilevel, xnew, ynew])
+        searchTlayers = self.setPortOptions(port, kwargs, allTlayers)
 
-        # Evalute the found potential polygon edges to attach to
-        if len(candidateAttachments) == 0:
+        # Look for the best attachment point within the search tlayers
+        attachment = self.findAttachment(xcoord, ycoord, xmargin, ymargin, searchTlayers)
+        if attachment == None:
             raise self.exception("No polygon edges found to attach port to!")
-        # Sort according to error and add the best attachment point to the port
-        candidateAttachments.sort(key=lambda item: abs(item[2]))
-        [ipolygon, ivertex, error, ilevel, xnew, ynew] = candidateAttachments[0]
+        [ipolygon, ivertex, error, ilevel, xnew, ynew] = attachment
         port.ipolygon = ipolygon
         port.ivertex = ivertex
         port.xcoord = xnew
@@ -1688,40 +3698,69 @@ class sonnet(object):
         # Add the port to the dlayer
         self.project.geo.dlayers[ilevel].ports.append(port)
 
-    def addComponent(self, x1, y1, x2, y2, tlayer_index, component_type="ind", value=10, xmargin=0.005, ymargin=0.005, **kwargs):
+    def addPorts(self, points, xmargin=0.005, ymargin=0.005, **kwargs):
         """
-        Adds an ideal component. Attachment point margins are the same as for :func:`addPort`.
+        Adds several ports (of standard type) at once, like calling :func:`addPort` for every point but faster for many ports. The ports are numbered in the order of the points. All points are checked before any port is added: if some of them have no polygon edge to attach to, an error lists all of them and the project is left unchanged.
 
-        :param float x1: Attachment x coordinate for the first port.
-        :param float y1: Attachment y coordinate for the first port.
-        :param float x2: Attachment x coordinate for the second port.
-        :param float y2: Attachment y coordinate for the second port.
+        :param points: Attachment coordinates ``(x, y)``, each optionally followed by a dictionary with keyword arguments for that port only, e.g. ``[(0, 100), (200, 100, {"resist": 25})]``.
+        :type points: list of tuples or array of shape (n, 2)
         :param float xmargin: Margin in x direction.
         :param float ymargin: Margin in y direction.
-        :param int tlayer_index: Index (gds stream number) of the technology layer the component will live in.
-        :param str component_type: Type of component. Should be ``"ind"`` (inductor), ``"cap"`` (capacitor) or ``"res"`` (resistor).
-        :param float value: Value of the component in units suitable for the component type.
-
-        Keyword arguments:
 
-        :param str name: Name for the component. Default is ``L``, ``C``, ``R`` followed by a number for inductors, capacitors and resistors. For instance, the first ideal capacitor is named ``"L1"``, the next ``"L2"`` ect.
-        :param int smdp1_portnum: Port number for first port, see [Son15]_ under SMD. Default is the number of existing ports + 1.
-        :param int smdp1_pinnum: See [Son15]_ under SMD.
-        :param int smdp2_portnum: Port number for second port, see [Son15]_ under SMD. Default is the number of existing ports + 2.
-        :param int smdp2_pinnum: See [Son15]_ under SMD.
+        Keyword arguments are the same as for :func:`addPort` and apply to all ports, unless they are given for a single port.
         """
 
-        # Technical description for delevopers:
-        # Adds a SMD definition of TYPE IDEAL in the GEO block (after LORGN)
-        # The component type is "ind" for inductor, "cap" for capacitor, or
-        # "res" for resistor.
-        # The value argument sets the inductance/capacitance/resistance
-        # The tlayer argument is the gds index of the technology layer
-        # The component's endpoints are (x1,y1) and (x2,y2) in LLC system
-        # Only a simple ideal components are supported, thus the following
-        # do not appear in the statement of the component: TWTYPE FEED or
-        # CUST, TWVALUE, DRP1, PBSHW Y, PBOX, PKG or any TYPE other than IDEAL
-        # Like in the addPort function we attach to nearby polygon edges.
+        # Technical description for developers:
+        # The existing ports are counted, the circuit height is looked up
+        # and the edge indices of the technology layers are built once for
+        # all points, so adding a port costs about the same regardless of
+        # the number of ports and polygons. See addPort for the attachment.
+
+        # List all technology layers (default search range)
+        allTlayers = []
+        numberOfPorts = 0
+        for dlayer in self.project.geo.dlayers:
+            for tlayer in dlayer.tlayers:
+                allTlayers.append(tlayer)
+            numberOfPorts += len(dlayer.ports) + 2*len(dlayer.components)
+
+        [[xmin, ymin], [xmax, ymax]] = self.getBoundingBox()
+
+        newPorts = []
+        failedPoints = []
+        for point in points:
+            options = dict(kwargs)
+            if len(point) > 2:
+                options.update(point[2])
+            port = Port()
+            port.portnum = numberOfPorts + len(newPorts) + 1
+            searchTlayers = self.setPortOptions(port, options, allTlayers)
+            # Same as mapPoint
+            xcoord, ycoord = point[0], (ymax - ymin) - point[1]
+            attachment = self.findAttachment(xcoord, ycoord, xmargin, ymargin, searchTlayers)
+            if attachment == None:
+                failedPoints.append("({}, {})".format(point[0], point[1]))
+                continue
+            [ipolygon, ivertex, error, ilevel, xnew, ynew] = attachment
+            port.ipolygon = ipolygon
+            port.ivertex = ivertex
+            port.xcoord = xnew
+            port.ycoord = ynew
+            newPorts.append((ilevel, port))
+
+        if len(failedPoints) > 0:
+            raise self.exception("No polygon edges found to attach ports to at " + ", ".join(failedPoints) + "!")
+
+        # Add the ports to the dlayers
+        for ilevel, port in newPorts:
+            self.project.geo.dlayers[ilevel].ports.append(port)
+
+    def makeComponent(self, x1, y1, x2, y2, tlayer_index, component_type, value, xmargin, ymargin):
+        # Internal use only.
+
+        # Returns a new ideal component (see addComponent) attached to the
+        # polygon edges nearest to (x1, y1) and (x2, y2), and the tag its
+        # default label starts with. The caller numbers the component.
 
         component = Component()
         component.compval = value
@@ -1741,29 +3780,12 @@ class sonnet(object):
         else:
             raise self.exception("Invalid component type.")
 
-        numberOfPorts = 0
-        numberOfComponents = 0
-        numberOfSameComponents = 0
         for dlayer in self.project.geo.dlayers:
             for tlayer in dlayer.tlayers:
                 if tlayer.gds_stream == tlayer_index:
                     component.levelnum = dlayer.ilevel
                     component.smdp1_levelnum = dlayer.ilevel
                     component.smdp2_levelnum = dlayer.ilevel
-            for oldComponent in dlayer.components:
-                numberOfPorts += 2
-                numberOfComponents += 1
-                if oldComponent.idealtype == component.idealtype:
-                    numberOfSameComponents += 1
-            for port in dlayer.ports:
-                numberOfPorts += 1
-
-        # Default labelling is "L1", "L2" ect. for inductors and similarly
-        # "C1", "R1" ect. for capacitors and resistors
-        component.label = "\"" + nametag + str(numberOfSameComponents + 1) + "\""
-        component.objectid = numberOfComponents + 1
-        component.smdp1_portnum = numberOfPorts + 1
-        component.smdp2_portnum = numberOfPorts + 2
         component.smdp1_pinnum = 1
         component.smdp2_pinnum = 2
 
@@ -1778,83 +3800,17 @@ class sonnet(object):
         candidateAttachments2 = []
         for dlayer in self.project.geo.dlayers:
             for tlayer in dlayer.tlayers:
-                for polygon in tlayer.polygons:
-                    for vertex in range(0, polygon.nvertices - 1):
-                        x0 = polygon.vertices[vertex][0]
-                        y0 =  polygon.vertices[vertex][1]
-                        x1 = polygon.vertices[vertex + 1][0]
-                        y1 = polygon.vertices[vertex + 1][1]
-                        # If the attachment point of port number 1 is close
-                        # enough to the polygon edge we save it
-                        if min(x0,x1) - xmargin <= xcoord1 and \
-                           xcoord1 <= max(x0,x1) + xmargin and \
-                           min(y0,y1) - ymargin <= ycoord1 and \
-                           ycoord1 <= max(y0,y1) + ymargin:
-                            if x0 == x1:
-                                error = (xcoord1 - x0)**2
-                                # The nearest edge point
-                                xnew = x0
-                                if ycoord1 > max(y0,y1):
-                                    ynew = max(y0,y1)
-                                elif ycoord1 < min(y0,y1):
-                                    ynew = min(y0,y1)
-                                else:
-                                    ynew = ycoord1
-                                candidateAttachments1.append([error, xnew, ynew])
-                            elif y0 == y1:
-                                error = (ycoord1 - y0)**2
-                                # The nearest edge point
-                                ynew = y0
-                                if xcoord1 > max(x0,x1):
-                                    xnew = max(x0,x1)
-                                elif xcoord1 < min(x0,x1):
-                                    xnew = min(x0,x1)
-                                else:
-                                    xnew = xcoord1
-                                candidateAttachments1.append([error, xnew, ynew])
-                            else:
-                                error = ycoord1 - y0 - (y1 - y0)/(x1 - x0)*(xcoord1 - x0)**2 \
-                                      + xcoord1 - x0 - (x1 - x0)/(y1 - y0)*(ycoord1 - y0)**2
-                                # The nearest edge point
-                                t = ( (x0-x1)*(x0-xcoord1) + (y0-y1)*(y0-ycoord1) ) / ( (x1-x0)**2 + (y1-y0)**2 )
-                                xnew = x0 + (x1-x0)*t
-                                ynew = y0 + (y1-y0)*t
-                                candidateAttachments1.append([error, xnew, ynew])
-                        # And similarly save points for port nmber 2
-                        if min(x0,x1) - xmargin <= xcoord2 and \
-                           xcoord2 <= max(x0,x1) + xmargin and \
-                           min(y0,y1) - ymargin <= ycoord2 and \
-                           ycoord2 <= max(y0,y1) + ymargin:
-                            if x0 == x1:
-                                error = (xcoord2 - x0)**2
-                                # The nearest edge point
-                                xnew = x0
-                                if ycoord2 > max(y0,y1):
-                                    ynew = max(y0,y1)
-                                elif ycoord2 < min(y0,y1):
-                                    ynew = min(y0,y1)
-                                else:
-                                    ynew = ycoord2
-                                candidateAttachments2.append([error, xnew, ynew])
-                            elif y0 == y1:
-                                error = (ycoord2 - y0)**2
-                                # The nearest edge point
-                                ynew = y0
-                                if xcoord2 > max(x0,x1):
-                                    xnew = max(x0,x1)
-                                elif xcoord2 < min(x0,x1):
-                                    xnew = min(x0,x1)
-                                else:
-                                    xnew = xcoord2
-                                candidateAttachments2.append([error, xnew, ynew])
-                            else:
-                                error = ycoord2 - y0 - (y1 - y0)/(x1 - x0)*(xcoord2 - x0)**2 \
-                                      + xcoord2 - x0 - (x1 - x0)/(y1 - y0)*(ycoord2 - y0)**2
-                                # The nearest edge point
-                                t = ( (x0-x1)*(x0-xcoord1) + (y0-y1)*(y0-ycoord2) ) / ( (x1-x0)**2 + (y1-y0)**2 )
-                                xnew = x0 + (x1-x0)*t
-                                ynew = y0 + (y1-y0)*t
-                                candidateAttachments2.append([error, xnew, ynew])
+                # Only the edges in the grid cells around the points are checked
+                edgeindex = tlayer.getEdgeIndex()
+                # If the attachment point of port number 1 is close enough to
+                # a polygon edge we save it
+                edges = edgeindex.query(xcoord1 - xmargin, ycoord1 - ymargin, xcoord1 + xmargin, ycoord1 + ymargin)
+                for iedge, error, xnew, ynew in nearestEdgePoints(edges, xcoord1, ycoord1, xmargin, ymargin):
+                    candidateAttachments1.append([error, xnew, ynew])
+                # And similarly save points for port number 2
+                edges = edgeindex.query(xcoord2 - xmargin, ycoord2 - ymargin, xcoord2 + xmargin, ycoord2 + ymargin)
+                for iedge, error, xnew, ynew in nearestEdgePoints(edges, xcoord2, ycoord2, xmargin, ymargin):
+                    candidateAttachments2.append([error, xnew, ynew])
 
         # Evalute the found potential polygon edges to attach to
         if len(candidateAttachments1) == 0:
@@ -1862,8 +3818,8 @@ class sonnet(object):
         if len(candidateAttachments2) == 0:
             raise self.exception("No polygon edges found to attach component port 2 to!")
         # Sort according to error and add the best attachment point to the port
-        candidateAttachments1.sort(key=lambda item: item[2])
-        candidateAttachments2.sort(key=lambda item: item[2])
+        candidateAttachments1.sort(key=lambda item: item[0])
+        candidateAttachments2.sort(key=lambda item: item[0])
         [error1, xnew1, ynew1] = candidateAttachments1[0]
         [error2, xnew2, ynew2] = candidateAttachments2[0]
 
@@ -1924,23 +3880,129 @@ class sonnet(object):
         else:
             raise self.exception("Component neither vertical nor horizontal!")
 
-        # Update parameters with keyword arguments from the user
-        for key, value in kwargs.items():
-            if key in "name":
-                port.label = value
+        return component, nametag
+
+    def setComponentOptions(self, component, options):
+        # Internal use only.
+
+        # Sets the keyword arguments of addComponent (and the per component
+        # options of addComponents) on the component
+
+        for key, value in options.items():
+            if key == "name":
+                component.label = value
             elif key == "smdp1_portnum":
-                port.smdp1_portnum = value
+                component.smdp1_portnum = value
             elif key == "smdp1_pinnum":
-                port.smdp1_pinnum = value
+                component.smdp1_pinnum = value
             elif key == "smdp2_portnum":
-                port.smdp2_portnum = value
+                component.smdp2_portnum = value
             elif key == "smdp2_pinnum":
-                port.smdp2_pinnum = value
+                component.smdp2_pinnum = value
             else:
                 raise self.exception("Invalid keyword argument.")
 
+    def addComponent(self, x1, y1, x2, y2, tlayer_index, component_type="ind", value=10, xmargin=0.005, ymargin=0.005, **kwargs):
+        """
+        Adds an ideal component. Attachment point margins are the same as for :func:`addPort`.
+
+        :param float x1: Attachment x coordinate for the first port.
+        :param float y1: Attachment y coordinate for the first port.
+        :param float x2: Attachment x coordinate for the second port.
+        :param float y2: Attachment y coordinate for the second port.
+        :param float xmargin: Margin in x direction.
+        :param float ymargin: Margin in y direction.
+        :param int tlayer_index: Index (gds stream number) of the technology layer the component will live in.
+        :param str component_type: Type of component. Should be ``"ind"`` (inductor), ``"cap"`` (capacitor) or ``"res"`` (resistor).
+        :param float value: Value of the component in units suitable for the component type.
+
+        Keyword arguments:
+
+        :param str name: Name for the component. Default is ``L``, ``C``, ``R`` followed by a number for inductors, capacitors and resistors. For instance, the first ideal capacitor is named ``"L1"``, the next ``"L2"`` ect.
+        :param int smdp1_portnum: Port number for first port, see [Son15]_ under SMD. Default is the number of existing ports + 1.
+        :param int smdp1_pinnum: See [Son15]_ under SMD.
+        :param int smdp2_portnum: Port number for second port, see [Son15]_ under SMD. Default is the number of existing ports + 2.
+        :param int smdp2_pinnum: See [Son15]_ under SMD.
+        """
+
+        # Technical description for delevopers:
+        # Adds a SMD definition of TYPE IDEAL in the GEO block (after LORGN)
+        # The component type is "ind" for inductor, "cap" for capacitor, or
+        # "res" for resistor.
+        # The value argument sets the inductance/capacitance/resistance
+        # The tlayer argument is the gds index of the technology layer
+        # The component's endpoints are (x1,y1) and (x2,y2) in LLC system
+        # Only a simple ideal components are supported, thus the following
+        # do not appear in the statement of the component: TWTYPE FEED or
+        # CUST, TWVALUE, DRP1, PBSHW Y, PBOX, PKG or any TYPE other than IDEAL
+        # Like in the addPort function we attach to nearby polygon edges.
+
+        component, nametag = self.makeComponent(x1, y1, x2, y2, tlayer_index, component_type, value, xmargin, ymargin)
+
+        numberOfPorts = 0
+        numberOfComponents = 0
+        numberOfSameComponents = 0
+        for dlayer in self.project.geo.dlayers:
+            for oldComponent in dlayer.components:
+                numberOfPorts += 2
+                numberOfComponents += 1
+                if oldComponent.idealtype == component.idealtype:
+                    numberOfSameComponents += 1
+            for port in dlayer.ports:
+                numberOfPorts += 1
+
+        # Default labelling is "L1", "L2" ect. for inductors and similarly
+        # "C1", "R1" ect. for capacitors and resistors
+        component.label = nametag + str(numberOfSameComponents + 1)
+        component.objectid = numberOfComponents + 1
+        component.smdp1_portnum = numberOfPorts + 1
+        component.smdp2_portnum = numberOfPorts + 2
+
+        # Update parameters with keyword arguments from the user
+        self.setComponentOptions(component, kwargs)
+
         self.project.geo.dlayers[component.levelnum].components.append(component)
 
+    def addComponents(self, components, xmargin=0.005, ymargin=0.005):
+        """
+        Adds several ideal components at once, like calling :func:`addComponent` for every component but faster for many components. Labels, object IDs and port numbers continue from the existing components in the order of the list. All components are attached and checked before any of them is added, so an invalid component leaves the project unchanged.
+
+        :param components: Components as tuples ``(x1, y1, x2, y2, tlayer_index, component_type, value)`` with the arguments of :func:`addComponent`, each optionally followed by a dictionary with its keyword arguments, e.g. ``[(0, 50, 10, 50, 0, "cap", 1), (20, 50, 30, 50, 0, "ind", 2, {"name": "Lk"})]``.
+        :type components: list of tuples
+        :param float xmargin: Margin in x direction.
+        :param float ymargin: Margin in y direction.
+        """
+
+        # Technical description for developers:
+        # The existing ports and components are counted once, and the edge
+        # indices of the technology layers are shared by all components.
+
+        numberOfPorts = 0
+        numberOfComponents = 0
+        numberOfSameComponents = {}
+        for dlayer in self.project.geo.dlayers:
+            for oldComponent in dlayer.components:
+                numberOfPorts += 2
+                numberOfComponents += 1
+                numberOfSameComponents[oldComponent.idealtype] = numberOfSameComponents.get(oldComponent.idealtype, 0) + 1
+            numberOfPorts += len(dlayer.ports)
+
+        newComponents = []
+        for spec in components:
+            [x1, y1, x2, y2, tlayer_index, component_type, value] = spec[:7]
+            component, nametag = self.makeComponent(x1, y1, x2, y2, tlayer_index, component_type, value, xmargin, ymargin)
+            numberOfSameComponents[component.idealtype] = numberOfSameComponents.get(component.idealtype, 0) + 1
+            component.label = nametag + str(numberOfSameComponents[component.idealtype])
+            component.objectid = numberOfComponents + len(newComponents) + 1
+            component.smdp1_portnum = numberOfPorts + 2*len(newComponents) + 1
+            component.smdp2_portnum = numberOfPorts + 2*len(newComponents) + 2
+            if len(spec) > 7:
+                self.setComponentOptions(component, spec[7])
+            newComponents.append(component)
+
+        for component in newComponents:
+            self.project.geo.dlayers[component.levelnum].components.append(component)
+
     def removeDlayer(self, dlayer_index=0):
         """
         Removes a dielectric layer including any technology layers, ports or components that reside in the layer. Any via technology layers that extend to this dielectric layer are also removed.
@@ -2156,6 +4218,8 @@ class sonnet(object):
             for tlayer in dlayer.tlayers:
                 if tlayer.gds_stream == tlayer_index:
                     tlayerFound = True
+                    # The polygons are changed in place below
+                    tlayer.markChanged()
                     for key, value in kwargs.items():
                         # Setting the layer type (lay_type)
                         if key == "tlayer_type":
@@ -2208,7 +4272,7 @@ class sonnet(object):
                                 component.smdp2_levelnum = value
                         # Go on to the other parameters
                         elif key == "name":
-                            tlayer.name = value
+                            tlayer.lay_name = value
                         # mtype (metal type) is used to switch on lossless metal type
                         elif key == "lossless":
                             if value == True:
@@ -2253,11 +4317,11 @@ class sonnet(object):
         Adds a dielectric layer to the project.
 
         :param erel: relative permitivity or [erelx, erely, erelz]
-	:type erel: float or list of floats of length 3
+        :type erel: float or list of floats of length 3
         :param loss_tan: loss tangent or [erelx, erely, erelz]
-	:type loss_tan: float or list of floats of length 3
+        :type loss_tan: float or list of floats of length 3
         :param cond: conductivity or [erelx, erely, erelz]
-	:type cond: float or list of floats of length 3
+        :type cond: float or list of floats of length 3
 
         """
 
@@ -2312,7 +4376,6 @@ class sonnet(object):
         newBrick.name = name
         self.project.geo.bricks.append(newBrick)
 
-
     ########################################################################
     # FREQUENCY AND PARAMETER SWEEPS                                       #
     ########################################################################
@@ -2618,11 +4681,66 @@ class sonnet(object):
     # SONNET SIMULATOR (em.exe, emstatus.exe)                              #
     ########################################################################
 
-    def runSimulation(self):
+    def setResultCache(self, directory, maxsize=1000):
+        """
+        Sets a cache for the results of :func:`runSimulation`, :func:`runSimulationAsync` and :func:`runVariants`. Before em is started, the cache is searched for a simulation of exactly the same project (same project file name and content, same em executable and options). If there is one, its output files are copied to where em would write them instead of running the simulation. After a successful simulation its output files are added to the cache. The statistics of the cache are returned by ``snt.result_cache.getStatistics()``.
+
+        :param str directory: Directory of the cache, or ``None`` to stop using a cache. The directory can be shared between projects, scripts and sessions.
+        :param float maxsize: Maximum size of the cache in MB. The least recently used results are removed when it grows larger.
+
+        :Example:
+            >>> snt.setResultCache("C:\\Users\\Lab\\sonnet_cache\\")
+            >>> snt.runSimulation() # simulates
+            >>> snt.runSimulation() # copies the results from the cache
+            >>> snt.result_cache.getStatistics()
+            {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0, 'entries': 1, 'size': 0.01}
+        """
+        if directory == None:
+            self.result_cache = None
+        else:
+            self.result_cache = ResultCache(directory, maxsize)
+
+    def getOutputFiles(self, sonnet_file=None):
+        # Internal use only.
+
+        # Returns the paths of the output files em writes for the project file
+        # sonnet_file (default the project file) according to the FILEOUT
+        # block, see setOutput
+        fileout = self.project.fileout
+        if fileout == None:
+            return []
+        if sonnet_file == None:
+            sonnet_file = self.sonnet_file
+        directory = self.sonnet_file_path
+        if fileout.folder != None:
+            directory = os.path.join(directory, fileout.folder)
+        filename = fileout.filename.replace("$BASENAME", os.path.splitext(sonnet_file)[0])
+        return [os.path.join(directory, filename)]
+
+    def runSimulation(self, progress=None):
         """
         Runs the Sonnet simulation without the pop-up status monitor. This function also calls :func:`printProject()`, thereby saving any changes made in SonPy to the Sonnet project file before starting the simulation.
+
+        :param progress: Function called with the progress of the simulation while it runs, one event per line of output of em. Every event has the attributes ``kind``, ``value``, ``unit`` and ``line`` (the line of output). ``kind`` is ``"frequency"`` for a frequency being analyzed (``value`` in ``unit``, e.g. ``"GHz"``), ``"subsections"`` for the number of subsections, ``"memory"`` for a memory estimate (``value`` in ``unit``, e.g. ``"MB"``), ``"time"`` for an elapsed time (``value`` in seconds) and ``"output"`` for any other line. The function runs on a separate thread.
+
+        :Example:
+            >>> def progress(event):
+            ...     if event.kind == "frequency":
+            ...         print("Analyzing {} {}".format(event.value, event.unit))
+            >>> snt.runSimulation(progress=progress)
         """
 
+        # Technical description for developers:
+        # The output of em (with stderr merged into it) is read by a
+        # ProgressReader thread while em runs, also without progress, since
+        # em blocks once the pipe is full and would never finish. The lines
+        # are parsed by parseProgressLine with the patterns of
+        # PROGRESS_PATTERNS. An exception raised by progress is raised here
+        # once em has finished.
+        # With a result cache (see setResultCache and ResultCache) the
+        # project file is hashed after it is written, and em is only started
+        # if the cache has no entry for the hash.
+
         # Print the Sonnet Project File
         self.printProject()
 
@@ -2642,22 +4760,337 @@ class sonnet(object):
             print("Project file {:s} can not be located in path {:s}".format(self.sonnet_file, self.sonnet_file_path))
             raise self.exception("Sonnet project file not found! Check that directory and filename are correct!")
 
-        self.done_flag = 0
         args = ([self.executable_path + self.executable_file, # command
                  self.sonnet_options, # options
                  self.sonnet_file_path + self.sonnet_file]) # file
 
+        outputs = self.getOutputFiles()
+        if self.result_cache != None and len(outputs) > 0:
+            key = self.result_cache.key(args[2], args[:2])
+            if self.result_cache.restore(key, outputs):
+                return
+
+        self.done_flag = 0
         try:
-            self.em_process = subprocess.Popen(args, stdout=subprocess.PIPE)
+            self.em_process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             self.run_count = self.run_count + 1
         except:
             print("Error! Can't start process, use setSonnetInstallationPath(path) to point the class to the location of your em.exe file")
             print("Current path is {:s}".format(self.executable_path))
             self.done_flag = 1
             raise self.exception("Can not run sonnet executable file, file not found")
+        reader = ProgressReader(self.em_process.stdout, progress)
+        reader.start()
 
         # Wait for the process to complete
         self.em_process.wait()
+        reader.join()
+        self.done_flag = 1
+        if self.result_cache != None and len(outputs) > 0 and self.em_process.returncode == 0:
+            self.result_cache.store(key, outputs)
+        if reader.error != None:
+            raise reader.error
+
+    def runVariants(self, variants, processes=0, cpusPerProcess=1, memory=None, memoryPerProcess=None, silent=False):
+        """
+        Runs Sonnet simulations of several variants of the project at the same time. Every variant is a function which changes a copy of the project, for instance the frequency sweep, a variable or the geometry. Each variant is written to its own Sonnet project file next to the project file (``test_<name>.son`` for ``test.son``) and simulated with its own em process. The project itself is left unchanged. An output file name without ``$BASENAME`` (see :func:`setOutput`) gets the name of the variant appended (``out_<name>.csv`` for ``out.csv``), so the variants do not write the same file.
+
+        :param variants: Functions called with a :class:`sonnet` instance holding a copy of the project, either as a dictionary of names and functions or as a list of functions named ``1``, ``2`` and so on.
+        :param int processes: Maximum number of simultaneous em processes. Use 0 for one per CPU core (or per ``cpusPerProcess`` cores).
+        :param int cpusPerProcess: Number of CPU cores one em process is expected to use. Only used when ``processes`` is 0.
+        :param float memory: Memory available to the simulations in MB. Together with ``memoryPerProcess`` it further limits the number of simultaneous em processes.
+        :param float memoryPerProcess: Memory one em process is expected to use in MB.
+        :param bool silent: Toggle progress messages.
+
+        :returns: List of results in the order of the variants, each with the attributes ``name``, ``sonnet_file`` (path of the project file), ``data_file`` (path of the output file, see :func:`setOutput`), ``returncode`` (exit code of em), ``output`` (output of em), ``elapsed`` (run time in seconds) and ``cached`` (whether the results were taken from the result cache, see :func:`setResultCache`).
+
+        :Example:
+            >>> def sweep(f1, f2):
+            ...     return lambda variant: variant.setFrequencySweep(f1=f1, f2=f2)
+            >>> results = snt.runVariants({"low": sweep(1, 5), "high": sweep(5, 10)}, processes=2)
+            >>> [result.returncode for result in results]
+            [0, 0]
+        """
+
+        # Technical description for developers:
+        # The project is pickled once and every variant is applied to its own
+        # unpickled copy, which is much faster than copy.deepcopy. The variant
+        # files are written here one after the other, and each is handed to a
+        # thread pool as soon as it is written, so the first simulations run
+        # while the other variants are still being written. The threads only
+        # start em and wait for it (see runVariantProcess), which releases the
+        # GIL, so em runs in as many processes as there are threads.
+        # The run_count and done_flag of runSimulation are not used, since
+        # the em processes of the variants are not tracked on the instance.
+        # The pool is shared with runParameterVariants (see runVariantPool).
+        # The output file name of a copy is made unique after the variant
+        # has changed it, since the variant may call setOutput itself.
+
+        if isinstance(variants, dict):
+            variants = list(variants.items())
+        else:
+            variants = [(str(index + 1), variant) for index, variant in enumerate(variants)]
+
+        stem, extension = os.path.splitext(self.sonnet_file)
+        data = pickle.dumps(self.project, pickle.HIGHEST_PROTOCOL)
+
+        def runs():
+            for name, variant in variants:
+                clone = sonnet.__new__(sonnet)
+                clone.__dict__.update(self.__dict__)
+                clone.project = pickle.loads(data)
+                clone.sonnet_file = "{:s}_{:s}{:s}".format(stem, name, extension)
+                variant(clone)
+                fileout = clone.project.fileout
+                if fileout != None and "$BASENAME" not in fileout.filename:
+                    filestem, fileextension = os.path.splitext(fileout.filename)
+                    fileout.filename = "{:s}_{:s}{:s}".format(filestem, name, fileextension)
+                clone.printProject()
+
+                args = ([self.executable_path + self.executable_file, # command
+                         self.sonnet_options, # options
+                         clone.sonnet_file_path + clone.sonnet_file]) # file
+                yield name, args, args[:2], clone.getOutputFiles()
+
+        processes = self.variantProcesses(len(variants), processes, cpusPerProcess, memory, memoryPerProcess)
+        return self.runVariantPool(runs(), processes, silent)
+
+    def runParameterVariants(self, assignments, processes=0, cpusPerProcess=1, memory=None, memoryPerProcess=None, silent=False):
+        """
+        Runs Sonnet simulations of the project for several values of its variable parameters at the same time, like :func:`runVariants`. The project file is written only once, and every run overrides the parameters with a parameter file of its own (em option ``-ParamFile``), so the geometry is not written again for every run. Each run uses a hard link to the project file (``test_<name>.son`` for ``test.son``, a copy where hard links are not supported), so the output files of the runs, which are named after the project file, do not overwrite each other. The output file name (see :func:`setOutput`) must therefore contain ``$BASENAME``, as the default does.
+
+        :param assignments: Values of the variable parameters (see :func:`addParameter`) of every run, each as a dictionary of parameter names and values. Either a dictionary of names and assignments or a list of assignments named ``1``, ``2`` and so on. Parameters missing from an assignment keep their value in the project.
+        :param int processes: Maximum number of simultaneous em processes, see :func:`runVariants`.
+        :param int cpusPerProcess: Number of CPU cores one em process is expected to use, see :func:`runVariants`.
+        :param float memory: Memory available to the simulations in MB, see :func:`runVariants`.
+        :param float memoryPerProcess: Memory one em process is expected to use in MB, see :func:`runVariants`.
+        :param bool silent: Toggle progress messages.
+
+        :returns: List of results in the order of the assignments, see :func:`runVariants`.
+
+        :Example:
+            >>> snt.addParameter("Lk", unittype="IND", value=10)
+            >>> results = snt.runParameterVariants([{"Lk": 5}, {"Lk": 10}, {"Lk": 20}])
+            >>> [result.data_file for result in results]
+            ['C:\\Users\\Lab\\Desktop\\sonnet_test\\test_1.csv', 'C:\\Users\\Lab\\Desktop\\sonnet_test\\test_2.csv', 'C:\\Users\\Lab\\Desktop\\sonnet_test\\test_3.csv']
+        """
+
+        # Technical description for developers:
+        # The parameter files hold one "name=value" line per parameter and
+        # are written next to the project file (test_<name>.param). Only the
+        # small parameter files and the links are written per run, see
+        # linkFile. The links keep the content of the project file, so the
+        # result cache key of a run is taken over the linked project file and
+        # the content of its parameter file.
+
+        if isinstance(assignments, dict):
+            assignments = list(assignments.items())
+        else:
+            assignments = [(str(index + 1), assignment) for index, assignment in enumerate(assignments)]
+
+        # Check all assignments before the first run is started
+        varnames = set(valvar.varname for valvar in self.project.geo.valvars)
+        for name, assignment in assignments:
+            for parameter in assignment:
+                if parameter not in varnames:
+                    raise self.exception("Parameter {} of run {} is not a variable parameter of the project.".format(parameter, name))
+        # All runs share the FILEOUT block of the project file, so only the
+        # name of their project file can tell their output files apart
+        fileout = self.project.fileout
+        if fileout != None and "$BASENAME" not in fileout.filename:
+            raise self.exception("Output file name {} does not contain $BASENAME, so all runs would write the same output file.".format(fileout.filename))
+
+        self.printProject()
+        filename = self.sonnet_file_path + self.sonnet_file
+        stem, extension = os.path.splitext(self.sonnet_file)
+
+        def runs():
+            for name, assignment in assignments:
+                sonnet_file = "{:s}_{:s}{:s}".format(stem, name, extension)
+                link = self.sonnet_file_path + sonnet_file
+                linkFile(filename, link)
+
+                text = "".join("{}={}\n".format(parameter, value) for parameter, value in assignment.items())
+                paramfile = self.sonnet_file_path + "{:s}_{:s}.param".format(stem, name)
+                writeIfChanged(paramfile, text)
+
+                args = ([self.executable_path + self.executable_file, # command
+                         self.sonnet_options, # options
+                         "-ParamFile", paramfile, # parameters
+                         link]) # file
+                yield name, args, args[:3] + [text], self.getOutputFiles(sonnet_file)
+
+        processes = self.variantProcesses(len(assignments), processes, cpusPerProcess, memory, memoryPerProcess)
+        return self.runVariantPool(runs(), processes, silent)
+
+    def variantProcesses(self, nvariants, processes, cpusPerProcess, memory, memoryPerProcess):
+        # Internal use only.
+
+        # Returns the number of simultaneous em processes of runVariants and
+        # runParameterVariants within the CPU and memory budgets
+        if processes == 0:
+            processes = max(1, (os.cpu_count() or 1)//cpusPerProcess)
+        if memory != None and memoryPerProcess != None:
+            processes = min(processes, max(1, int(memory//memoryPerProcess)))
+        return min(processes, max(1, nvariants))
+
+    def runVariantPool(self, runs, processes, silent):
+        # Internal use only.
+
+        # Runs em for every (name, command, cache key arguments, output
+        # files) of runs on a pool of processes threads, and returns the
+        # VariantResult of every run. The runs are consumed one at a time, so
+        # each run starts while the next one is prepared. Runs found in the
+        # result cache are not started, and the results of the others are
+        # stored here rather than on the threads.
+        cache = self.result_cache
+        results = []
+        # (result, future, cache key, output files) of every run started
+        started = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=processes) as executor:
+            for name, args, keyargs, outputs in runs:
+                result = VariantResult(name, args[-1], outputs[0] if len(outputs) > 0 else None)
+                results.append(result)
+
+                key = None
+                if cache != None and len(outputs) > 0:
+                    key = cache.key(result.sonnet_file, keyargs)
+                    if cache.restore(key, outputs):
+                        result.returncode = 0
+                        result.cached = True
+                        continue
+                started.append((result, executor.submit(runVariantProcess, args, result), key, outputs))
+            if silent == False:
+                print("Simulating {:d} variants in {:d} processes...".format(len(started), processes))
+
+            for result, future, key, outputs in started:
+                try:
+                    future.result()
+                except OSError:
+                    # The executable is the same for every variant
+                    for other in started:
+                        other[1].cancel()
+                    print("Error! Can't start process, use setSonnetInstallationPath(path) to point the class to the location of your em.exe file")
+                    print("Current path is {:s}".format(self.executable_path))
+                    raise self.exception("Can not run sonnet executable file, file not found")
+                if key != None and result.returncode == 0:
+                    cache.store(key, outputs)
+                if silent == False:
+                    print("  Variant {:s} finished with exit code {:d} after {:.1f} s".format(result.name, result.returncode, result.elapsed))
+
+        return results
+
+    async def runSimulationAsync(self, timeout=None, progress=None):
+        """
+        Coroutine version of :func:`runSimulation` for use with asyncio (Python 3.9 or later). The simulation runs without blocking the event loop, so many projects (each with its own :class:`sonnet` instance) can be simulated and awaited at the same time. The project file is written on a worker thread.
+
+        :param float timeout: Maximum time in seconds to wait for the simulation. The simulation is stopped and ``TimeoutError`` is raised when it takes longer. Default is no limit.
+        :param progress: Function called with the progress of the simulation while it runs, see :func:`runSimulation`. The function runs in the event loop, and the simulation is stopped if it raises an exception.
+
+        :returns: Exit code of em (0 for results taken from the result cache, see :func:`setResultCache`), or ``None`` if a simulation of this instance is still running.
+
+        :Example:
+            >>> import asyncio
+            >>> async def main(projects):
+            ...     return await asyncio.gather(*[snt.runSimulationAsync(timeout=3600) for snt in projects])
+            >>> asyncio.run(main([snt1, snt2]))
+            [0, 0]
+
+        Cancelling the task stops the simulation.
+        """
+
+        # Technical description for developers:
+        # em is awaited by waitProcessAsync, which kills it when the task is
+        # cancelled or times out. done_flag is set again when the simulation
+        # ends, also after an error or cancellation, so the instance can run
+        # the next simulation.
+
+        if self.done_flag == 0:
+            print("Can't start new simulation until previous simulation completes.")
+            return None
+
+        self.done_flag = 0
+        try:
+            # Print the Sonnet Project File
+            await asyncio.to_thread(self.printProject)
+
+            args = ([self.executable_path + self.executable_file, # command
+                     self.sonnet_options, # options
+                     self.sonnet_file_path + self.sonnet_file]) # file
+
+            outputs = self.getOutputFiles()
+            cache = self.result_cache
+            if cache != None and len(outputs) > 0:
+                key = await asyncio.to_thread(cache.key, args[2], args[:2])
+                if await asyncio.to_thread(cache.restore, key, outputs):
+                    return 0
+
+            try:
+                self.em_process = await startProcessAsync(args)
+                self.run_count = self.run_count + 1
+            except OSError:
+                print("Error! Can't start process, use setSonnetInstallationPath(path) to point the class to the location of your em.exe file")
+                print("Current path is {:s}".format(self.executable_path))
+                raise self.exception("Can not run sonnet executable file, file not found")
+
+            # Wait for the process to complete
+            returncode, output = await waitProcessAsync(self.em_process, timeout, progress)
+            if cache != None and len(outputs) > 0 and returncode == 0:
+                await asyncio.to_thread(cache.store, key, outputs)
+        finally:
+            self.done_flag = 1
+
+        return returncode
+
+    async def runSimulationStatusMonitorAsync(self, timeout=None):
+        """
+        Coroutine version of :func:`runSimulationStatusMonitor` for use with asyncio (Python 3.9 or later). Like :func:`runSimulationAsync`, but with the pop-up status monitor.
+
+        :param float timeout: Maximum time in seconds to wait for the simulation. The status monitor is stopped and ``TimeoutError`` is raised when it takes longer. Default is no limit.
+
+        :returns: Exit code of the status monitor, or ``None`` if a simulation of this instance is still running.
+        """
+
+        # Technical description for developers:
+        # The five seconds runSimulationStatusMonitor sleeps before looking up
+        # the em process of the status monitor are awaited instead, while the
+        # status monitor is already being waited for.
+
+        if self.done_flag == 0:
+            print("Can't start new simulation until previous simulation completes.")
+            return None
+
+        self.done_flag = 0
+        try:
+            # Print the Sonnet Project File
+            await asyncio.to_thread(self.printProject)
+
+            args = ([self.executable_path + self.executable_and_monitor_file, # command
+                     self.executable_and_monitor_options, # options
+                     self.sonnet_file_path + self.sonnet_file]) # file
+
+            try:
+                self.emstatus_process = await startProcessAsync(args)
+                self.run_count = self.run_count + 1
+            except OSError:
+                print("Error! Can't start process, use setSonnetInstallationPath(path) to point the class to the location of your em.exe file")
+                print("Current path is {:s}".format(self.executable_path))
+                raise self.exception("Can not run sonnet executable file, file not found")
+
+            async def findEmProcess():
+                await asyncio.sleep(5)
+                self.getEmProcessID()
+
+            # Wait for the process to complete
+            finder = asyncio.ensure_future(findEmProcess())
+            try:
+                returncode, output = await waitProcessAsync(self.emstatus_process, timeout)
+            finally:
+                finder.cancel()
+        finally:
+            self.done_flag = 1
+
+        return returncode
 
     def runSimulationStatusMonitor(self):
         """
@@ -2687,40 +5120,44 @@ class sonnet(object):
               self.executable_and_monitor_options, # options
               self.sonnet_file_path + self.sonnet_file]) # file
         try:
-            self.emstatus_process = subprocess.Popen(args, stdout=subprocess.PIPE)
+            self.emstatus_process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             self.run_count = self.run_count + 1
         except:
             print("Error! Can't start process, use setSonnetInstallationPath(path) to point the class to the location of your em.exe file")
             print("Current path is {:s}".format(self.executable_path))
             self.done_flag = 1
             raise self.exception("Can not run sonnet executable file, file not found")
+        # Only read to keep the pipe from filling up
+        reader = ProgressReader(self.emstatus_process.stdout)
+        reader.start()
         time.sleep(5)
         self.getEmProcessID()
 
         # Wait for the process to complete
         self.emstatus_process.wait()
+        reader.join()
+        self.done_flag = 1
 
     def getEmProcessID(self):
         # Internal use only.
 
         # Based on SimulationStatusMonitor process 'emstatus.exe', find out child process 'em.exe'
-	if OS == 'Windows':
-		WMI = GetObject('winmgmts:')
-		processes = WMI.InstancesOf('Win32_Process')
-		self.parentPID = int(self.emstatus_process.pid)
-		self.emPID = None
-		for process in processes:
-		    parent = int(process.Properties_('ParentProcessId').Value)
-		    child = int(process.Properties_('ProcessId').Value)
-		    if (parent == self.parentPID):
-			self.emPID = child
-			break
-	elif OS == 'Linux':
-		self.parentPID = int(self.emstatus_process.pid)
-        	child = os.popen(f'pgrep -P {self.parentPID}').read()
-        	child = ''.join([c for c in child if c.isdigit()])
-        	self.emPID = int(child)
-		
+        if OS == 'Windows':
+            WMI = GetObject('winmgmts:')
+            processes = WMI.InstancesOf('Win32_Process')
+            self.parentPID = int(self.emstatus_process.pid)
+            self.emPID = None
+            for process in processes:
+                parent = int(process.Properties_('ParentProcessId').Value)
+                child = int(process.Properties_('ProcessId').Value)
+                if (parent == self.parentPID):
+                    self.emPID = child
+                    break
+        elif OS == 'Linux':
+            self.parentPID = int(self.emstatus_process.pid)
+            child = os.popen(f'pgrep -P {self.parentPID}').read()
+            child = ''.join([c for c in child if c.isdigit()])
+            self.emPID = int(child)
 
     ########################################################################
     # MISCELLANEOUS FUNCTIONS                                              #